@@ -0,0 +1,138 @@
+"""Throughput of ``PUT /api/transaction/`` under each write-concurrency strategy.
+
+Every strategy runs the same mix of deposits and withdrawals through ``TransactionService`` and
+``run_in_transaction``, once against a few hot users and once spread uniformly over many users.
+The benchmark creates its own ``bench-`` users in the configured database and deletes them afterwards::
+
+    python benchmarks/concurrency_strategies.py --concurrency 32 --operations 4000
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import statistics
+import time
+import uuid
+from datetime import UTC, datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database.concurrency import (
+    TRANSACTION_CONFLICTS,
+    TRANSACTION_RETRIES,
+    ConcurrencyStrategy,
+    run_in_transaction,
+)
+from app.database.models import OutboxDb, TransactionDb, TransactionUidDb, UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.exceptions import ConcurrentUpdateError, TransactionExceedsBalanceError
+from app.schemas import TransactionAdd
+from app.services import TransactionService
+from app.settings import Settings
+from app.types import TransactionType
+
+
+PREFIX = "bench-"
+WORKLOADS = {"hot": 4, "uniform": 1_000}
+
+
+async def transact(sessionmaker: async_sessionmaker[AsyncSession], strategy: ConcurrencyStrategy, user_id: str) -> str:
+    async with sessionmaker() as session:
+        service = TransactionService(
+            transaction_repo=TransactionRepository(session),
+            user_repo=UserRepository(session, strategy=strategy),
+            outbox_repo=OutboxRepository(session),
+            ledger_repo=LedgerRepository(session),
+            db_session=session,
+        )
+        data = TransactionAdd(
+            uid=f"{PREFIX}{uuid.uuid4().hex[:30]}",
+            user_id=user_id,
+            amount=Decimal(random.randint(1, 100)),  # noqa: S311
+            type=random.choice(list(TransactionType)),  # noqa: S311
+            created_at=datetime.now(UTC),
+        )
+        try:
+            await run_in_transaction(session, lambda: service.add_transaction(data), strategy)
+        except TransactionExceedsBalanceError:
+            return "rejected"
+        except ConcurrentUpdateError:
+            return "failed"
+        return "ok"
+
+
+async def run(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    strategy: ConcurrencyStrategy,
+    users: int,
+    operations: int,
+    concurrency: int,
+) -> None:
+    async with sessionmaker() as session:
+        await session.execute(
+            update(UserDb).where(UserDb.id.startswith(PREFIX)).values(balance=Decimal(1_000_000), version=0)
+        )
+        await session.commit()
+
+    user_ids = itertools.cycle(random.sample(range(users), users))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def operation() -> str:
+        async with semaphore:
+            started = time.perf_counter()
+            outcome = await transact(sessionmaker, strategy, f"{PREFIX}{next(user_ids)}")
+            latencies.append((time.perf_counter() - started) * 1000)
+            return outcome
+
+    retries = TRANSACTION_RETRIES.value(strategy=strategy)
+    conflicts = TRANSACTION_CONFLICTS.value(strategy=strategy)
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(operation() for _ in range(operations)))
+    elapsed = time.perf_counter() - started
+
+    print(  # noqa: T201
+        f"{strategy:>12} {users:>5} users: {operations / elapsed:8.1f} tx/s, "
+        f"p50 {statistics.median(latencies):7.2f} ms, p99 {statistics.quantiles(latencies, n=100)[-1]:7.2f} ms, "
+        f"conflicts {TRANSACTION_CONFLICTS.value(strategy=strategy) - conflicts:6.0f}, "
+        f"retries {TRANSACTION_RETRIES.value(strategy=strategy) - retries:6.0f}, "
+        f"gave up {outcomes.count('failed')}"
+    )
+
+
+async def main(dsn: str, operations: int, concurrency: int) -> None:
+    engine = create_async_engine(dsn, pool_size=concurrency, max_overflow=0)
+    sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    try:
+        async with sessionmaker() as session:
+            session.add_all(UserDb(id=f"{PREFIX}{number}", name="bench") for number in range(max(WORKLOADS.values())))
+            await session.commit()
+
+        for (workload, users), strategy in itertools.product(WORKLOADS.items(), ConcurrencyStrategy):
+            print(f"{workload:>8}", end=" ")  # noqa: T201
+            await run(sessionmaker, strategy, users, operations, concurrency)
+    finally:
+        async with sessionmaker() as session:
+            await session.execute(delete(OutboxDb).where(OutboxDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionDb).where(TransactionDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionUidDb).where(TransactionUidDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(UserDb).where(UserDb.id.startswith(PREFIX)))
+            # Takes the benchmark's transactions out of the ledger totals again.
+            await LedgerRepository(session).rebuild()
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=Settings().db_dsn.render_as_string(hide_password=False))
+    parser.add_argument("--operations", type=int, default=4_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    # Exhausted retries are counted in the "gave up" column instead.
+    logging.getLogger("app.database.concurrency").setLevel(logging.ERROR)
+    asyncio.run(main(args.dsn, args.operations, args.concurrency))
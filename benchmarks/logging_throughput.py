@@ -0,0 +1,106 @@
+"""Event loop throughput with logging on, writing on the event loop's thread or behind the log queue.
+
+Every simulated request logs ``--statements`` statements on ``sqlalchemy.engine``, as ``DATABASE__ECHO``
+does, and one ``app`` record, all at INFO. Records are written as JSON to a file. ``--write-delay`` adds a
+pause to every write, like a slow pipe or terminal. ``direct`` writes on the event loop's thread. ``queue``
+goes through ``app.logs`` without sampling, ``sampled`` with the default sampling. ``drain`` is the time the
+listener then takes to write out what is still queued::
+
+    python benchmarks/logging_throughput.py --requests 20000 --concurrency 64 --write-delay 0.00005
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+import typing
+from pathlib import Path
+
+from app.logs import DROPPED, SAMPLED_OUT, JsonFormatter, configure_logging, stop_logging
+from app.settings import Logging, Settings
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: Path, delay: float):
+        super().__init__(path, encoding="utf-8")
+        self.write_delay = delay
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        super().emit(record)
+
+
+async def handle(number: int, statements: int) -> None:
+    engine_logger = logging.getLogger("sqlalchemy.engine.Engine")
+    for statement in range(statements):
+        engine_logger.info("SELECT users.balance FROM users WHERE users.id = $1::VARCHAR [%s] (%s)", number, statement)
+        await asyncio.sleep(0)
+    logging.getLogger("app.api").info("Handled request %s", number, extra={"user_id": f"user-{number}"})
+
+
+async def run(requests: int, concurrency: int, statements: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def request(number: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await handle(number, statements)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(request(number) for number in range(requests)))
+    return latencies
+
+
+def main(mode: str, args: argparse.Namespace, directory: Path) -> None:
+    path = directory / f"{mode}.jsonl"
+    handler = SlowFileHandler(path, args.write_delay)
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+    listener = None
+    if mode != "direct":
+        sampling = Logging().sampling if mode == "sampled" else {}
+        settings = Settings(logging={"queue_size": args.queue_size, "sampling": sampling}, database={"echo": True})
+        listener = configure_logging(settings)
+    dropped, sampled_out = DROPPED.value(level="INFO"), SAMPLED_OUT.value(logger="sqlalchemy.engine")
+
+    started = time.perf_counter()
+    latencies = asyncio.run(run(args.requests, args.concurrency, args.statements))
+    elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    stop_logging(listener)
+    drain = time.perf_counter() - started
+    handler.close()
+
+    with path.open(encoding="utf-8") as file:
+        written = sum(1 for _ in file)
+    print(  # noqa: T201
+        f"{mode:>8}: {args.requests / elapsed:9.0f} requests/s, "
+        f"p50 {statistics.median(latencies):7.2f} ms, p99 {statistics.quantiles(latencies, n=100)[-1]:7.2f} ms, "
+        f"written {written:8d}, dropped {DROPPED.value(level='INFO') - dropped:8.0f}, "
+        f"sampled out {SAMPLED_OUT.value(logger='sqlalchemy.engine') - sampled_out:8.0f}, drain {drain:6.2f} s"
+    )
+
+
+MODES: typing.Final = ("direct", "queue", "sampled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--statements", type=int, default=3, help="statements logged per request")
+    parser.add_argument("--write-delay", type=float, default=0.0, help="seconds every write takes on top")
+    parser.add_argument("--queue-size", type=int, default=Logging().queue_size)
+    parser.add_argument("--mode", choices=MODES, nargs="+", default=MODES)
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temporary:
+        for benchmark_mode in arguments.mode:
+            main(benchmark_mode, arguments, Path(temporary))
@@ -0,0 +1,71 @@
+"""Historical balance queries on the in-memory ledger as one user's history grows.
+
+Adds transactions to a single ``BalanceHistory``, a share of them backdated to a random earlier time, and
+times ``sum_until`` at random timestamps each time the history has doubled. It also reports the bytes
+held per transaction, with and without the uid index. Needs no database::
+
+    python benchmarks/memory_ledger.py --transactions 1000000 --backdated 0.1
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+import uuid
+
+from app.database.memory_ledger import BalanceHistory, MemoryLedger
+
+
+QUERIES = 20_000
+
+
+def query_micros(history: BalanceHistory, horizon: int) -> float:
+    points = [random.randrange(horizon) for _ in range(QUERIES)]  # noqa: S311
+    started = time.perf_counter()
+    for point in points:
+        history.sum_until(point)
+    return (time.perf_counter() - started) / QUERIES * 1e6
+
+
+def growth(transactions: int, backdated: float) -> None:
+    history = BalanceHistory()
+    checkpoint = 1_000
+    started = time.perf_counter()
+    for number in range(1, transactions + 1):
+        micros = number * 1_000
+        if random.random() < backdated:  # noqa: S311
+            micros = random.randrange(micros)  # noqa: S311
+        history.add(micros, random.randint(-100, 100))  # noqa: S311
+        if number == checkpoint:
+            elapsed = time.perf_counter() - started
+            print(  # noqa: T201
+                f"{number:>10} transactions: {elapsed / number * 1e6:6.2f} us per add, "
+                f"{query_micros(history, micros):6.2f} us per sum_until"
+            )
+            checkpoint *= 2
+            started = time.perf_counter() - elapsed
+
+
+def footprint(transactions: int, keep_uids: bool) -> None:
+    tracemalloc.start()
+    ledger = MemoryLedger(keep_uids=keep_uids)
+    for number in range(transactions):
+        ledger.add_transaction(uuid.uuid4().hex, f"user-{number % 1_000}", number * 1_000, number % 100)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'with' if keep_uids else 'without'} uids: {size / transactions:6.1f} bytes per transaction")  # noqa: T201
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--backdated", type=float, default=0.1, help="share of transactions added out of order")
+    args = parser.parse_args()
+
+    growth(args.transactions, args.backdated)
+    for keep_uids in (False, True):
+        footprint(min(args.transactions, 200_000), keep_uids)
+
+
+if __name__ == "__main__":
+    main()
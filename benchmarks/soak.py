@@ -0,0 +1,407 @@
+"""Soak test: hours of mixed traffic against the in-process application, watching memory and latency drift.
+
+Runs the application with its lifespan against the test database of ``--env-file``, like the test suite,
+without the per-user rate limit, and replays a mix of deposits, withdrawals, retried payments, transfers,
+balance reads, historical reads and transaction lookups from ``--concurrency`` clients. Every ``--interval``
+seconds it takes a ``tracemalloc`` snapshot and samples the RSS, the checked-out and overflow connections of
+every pool, the sessions opened by ``AppBuilder.get_db_session`` and not closed yet, the ``AsyncSession``
+objects still alive and the p99 of every operation in the interval.
+
+Samples taken during ``--warmup`` only serve as the baseline. The report then flags the allocation sites,
+and the process-wide series, that grew in at least ``--monotonic`` of the intervals and by more than
+``--min-growth`` bytes, and the operations whose p99 in the last quarter of the run is more than
+``--max-drift`` times that of the first quarter. It exits with status 1 when anything is flagged. Snapshots
+stall the event loop for a moment, which the p99 of their interval includes. The test creates its own
+``soak-`` users and deletes them and their transactions afterwards, then rebuilds the ledger totals, so the
+``DATABASE__*`` settings of the environment are never used::
+
+    python benchmarks/soak.py --duration 14400 --interval 60 --concurrency 32 --output soak.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+import uuid
+from collections.abc import AsyncIterator, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import fastapi
+import httpx
+from dotenv import dotenv_values
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.api.base import get_db_session
+from app.application import AppBuilder
+from app.database.models import OutboxDb, TransactionDb, TransactionUidDb, UserDb
+from app.database.repositories import LedgerRepository
+from app.settings import Settings
+from app.types import TransactionType
+
+
+PREFIX = "soak-"
+HISTORY = 200
+MIN_SITE_SIZE = 4096
+# Relative weights of the operations in the mix, each a method of ``Workload``.
+OPERATIONS = {
+    "deposit": 30,
+    "withdraw": 15,
+    "retry": 5,
+    "transfer": 5,
+    "balance": 30,
+    "historical": 5,
+    "lookup": 10,
+}
+IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>")
+
+
+@dataclass
+class Sample:
+    elapsed: float
+    rss: int
+    traced: int
+    checked_out: int
+    overflow: int
+    open_sessions: int
+    live_sessions: int
+    requests: int
+    errors: int
+    p99: dict[str, float]
+    sites: dict[str, int] = field(repr=False)
+
+
+@dataclass
+class Growth:
+    name: str
+    first: float
+    last: float
+    rising: float
+
+
+def rss() -> int:
+    """Resident set size of the process, the peak where ``/proc`` is not available."""
+    try:
+        pages = int(Path("/proc/self/statm").read_text(encoding="ascii").split()[1])
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def growth(name: str, values: list[float], monotonic: float, min_growth: float) -> Growth | None:
+    """Return the series' growth if it rose in at least ``monotonic`` of its steps and by more than ``min_growth``."""
+    if len(values) < 3 or values[-1] - values[0] <= min_growth:  # noqa: PLR2004
+        return None
+    steps = list(itertools.pairwise(values))
+    rising = sum(after >= before for before, after in steps) / len(steps)
+    if rising < monotonic:
+        return None
+    return Growth(name, values[0], values[-1], rising)
+
+
+def drift(samples: list[Sample]) -> dict[str, float]:
+    """p99 of every operation in the last quarter of the samples over that of the first quarter."""
+    ratios = {}
+    for operation in OPERATIONS:
+        p99 = [sample.p99[operation] for sample in samples if operation in sample.p99]
+        quarter = max(len(p99) // 4, 1)
+        if p99:
+            ratios[operation] = statistics.median(p99[-quarter:]) / statistics.median(p99[:quarter])
+    return ratios
+
+
+class SessionTracker:
+    """Counts the sessions ``get_db_session`` opened that are not closed yet."""
+
+    def __init__(self) -> None:
+        self.open = 0
+
+    def wrap(
+        self, dependency: Callable[[fastapi.Request], AsyncIterator[AsyncSession]]
+    ) -> Callable[[fastapi.Request], AsyncIterator[AsyncSession]]:
+        session_context = contextlib.asynccontextmanager(dependency)
+
+        async def tracked(request: fastapi.Request) -> AsyncIterator[AsyncSession]:
+            self.open += 1
+            try:
+                async with session_context(request) as session:
+                    yield session
+            finally:
+                self.open -= 1
+
+        return tracked
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, users: int, started: datetime):
+        self.client = client
+        self.users = users
+        self.started = started
+        self.uids: list[str] = []
+        self.latencies: dict[str, list[float]] = {operation: [] for operation in OPERATIONS}
+        self.requests = 0
+        self.errors = 0
+
+    def user_id(self) -> str:
+        return f"{PREFIX}{random.randrange(self.users)}"  # noqa: S311
+
+    def payment(self, transaction_type: TransactionType, amount: int) -> dict:
+        uid = f"{PREFIX}{uuid.uuid4().hex[:30]}"
+        self.uids.append(uid)
+        return {
+            "uid": uid,
+            "user_id": self.user_id(),
+            "amount": str(amount),
+            "type": transaction_type.value,
+            "created_at": datetime.now(UTC).isoformat(),
+        }
+
+    async def deposit(self) -> httpx.Response:
+        return await self.client.put("/api/transaction/", json=self.payment(TransactionType.DEPOSIT, 5))
+
+    async def withdraw(self) -> httpx.Response:
+        return await self.client.put("/api/transaction/", json=self.payment(TransactionType.WITHDRAW, 1))
+
+    async def retry(self) -> httpx.Response:
+        body = self.payment(TransactionType.DEPOSIT, 1)
+        await self.client.put("/api/transaction/", json=body)
+        return await self.client.put("/api/transaction/", json=body)
+
+    async def transfer(self) -> httpx.Response:
+        from_user_id, to_user_id = (f"{PREFIX}{number}" for number in random.sample(range(self.users), 2))
+        body = {
+            "uid": f"{PREFIX}{uuid.uuid4().hex[:30]}",
+            "from_user_id": from_user_id,
+            "to_user_id": to_user_id,
+            "amount": "1",
+            "created_at": datetime.now(UTC).isoformat(),
+        }
+        return await self.client.post("/api/transfer/", json=body)
+
+    async def balance(self) -> httpx.Response:
+        return await self.client.get(f"/api/user/{self.user_id()}/balance/")
+
+    async def historical(self) -> httpx.Response:
+        # Within the seeded history, so the rows a read sums do not grow with the run.
+        ts = self.started - timedelta(seconds=random.randrange(HISTORY))  # noqa: S311
+        return await self.client.get(f"/api/user/{self.user_id()}/balance/", params={"ts": ts.isoformat()})
+
+    async def lookup(self) -> httpx.Response:
+        uid = random.choice(self.uids[-10_000:]) if self.uids else f"{PREFIX}missing"  # noqa: S311
+        return await self.client.get(f"/api/transaction/{uid}")
+
+    async def client_loop(self, done: asyncio.Event) -> None:
+        operations, weights = list(OPERATIONS), list(OPERATIONS.values())
+        while not done.is_set():
+            operation = random.choices(operations, weights)[0]  # noqa: S311
+            started = time.perf_counter()
+            response = await getattr(self, operation)()
+            self.latencies[operation].append((time.perf_counter() - started) * 1000)
+            self.requests += 1
+            # Withdrawals over the balance and lookups of uids not committed yet are part of the mix.
+            if response.status_code >= 500:  # noqa: PLR2004
+                self.errors += 1
+            if len(self.uids) > 100_000:  # noqa: PLR2004
+                del self.uids[:50_000]
+            await asyncio.sleep(float(response.headers.get("Retry-After", 0)))
+
+    def take_latencies(self) -> dict[str, float]:
+        p99 = {
+            operation: statistics.quantiles(latencies, n=100)[-1]
+            for operation, latencies in self.latencies.items()
+            if len(latencies) > 1
+        }
+        for latencies in self.latencies.values():
+            latencies.clear()
+        return p99
+
+
+def sample(builder: AppBuilder, tracker: SessionTracker, workload: Workload, elapsed: float, key: str) -> Sample:
+    sites = {
+        str(statistic.traceback) if key == "lineno" else " <- ".join(map(str, statistic.traceback)): statistic.size
+        for statistic in tracemalloc.take_snapshot().statistics(key)
+        # The long tail of small sites would only cost memory here.
+        if statistic.size >= MIN_SITE_SIZE and not any(frame.filename in IGNORED_FILES for frame in statistic.traceback)
+    }
+    engines = builder._async_engines  # noqa: SLF001
+    result = Sample(
+        elapsed=elapsed,
+        rss=rss(),
+        traced=tracemalloc.get_traced_memory()[0],
+        checked_out=sum(engine.pool.checkedout() for engine in engines),
+        overflow=sum(max(engine.pool.overflow(), 0) for engine in engines),
+        open_sessions=tracker.open,
+        live_sessions=sum(isinstance(item, AsyncSession) for item in gc.get_objects()),
+        requests=workload.requests,
+        errors=workload.errors,
+        p99=workload.take_latencies(),
+        sites=sites,
+    )
+    print(  # noqa: T201
+        f"{elapsed:8.0f} s: rss {result.rss / 2**20:8.1f} MiB, traced {result.traced / 2**20:8.1f} MiB, "
+        f"checked out {result.checked_out:3d}, open sessions {result.open_sessions:3d}, "
+        f"live sessions {result.live_sessions:4d}, requests {result.requests:9d}, errors {result.errors:5d}, "
+        f"p99 {max(result.p99.values(), default=0):7.2f} ms"
+    )
+    return result
+
+
+def report(samples: list[Sample], args: argparse.Namespace) -> bool:
+    """Print what grew or drifted, return whether anything did."""
+    series = {
+        "rss": [float(sample.rss) for sample in samples],
+        "traced": [float(sample.traced) for sample in samples],
+    }
+    counts = {
+        "checked out connections": [float(sample.checked_out) for sample in samples],
+        "overflow connections": [float(sample.overflow) for sample in samples],
+        "open sessions": [float(sample.open_sessions) for sample in samples],
+        "live sessions": [float(sample.live_sessions) for sample in samples],
+    }
+    sites = {site for sample in samples for site in sample.sites}
+    grown = [
+        found
+        for name, values in series.items()
+        if (found := growth(name, values, args.monotonic, args.min_growth)) is not None
+    ]
+    # Objects rather than bytes: any steady rise is suspicious.
+    grown += [
+        found for name, values in counts.items() if (found := growth(name, values, args.monotonic, 0)) is not None
+    ]
+    leaking = sorted(
+        (
+            found
+            for site in sites
+            if (
+                found := growth(
+                    site, [float(sample.sites.get(site, 0)) for sample in samples], args.monotonic, args.min_growth
+                )
+            )
+            is not None
+        ),
+        key=lambda found: found.first - found.last,
+    )
+    drifted = {operation: ratio for operation, ratio in drift(samples).items() if ratio > args.max_drift}
+
+    print(f"\n{len(samples)} samples after the warm-up, {samples[-1].requests} requests")  # noqa: T201
+    for found in grown:
+        print(f"GROWING {found.name}: {found.first:.0f} -> {found.last:.0f}, rose in {found.rising:.0%}")  # noqa: T201
+    for found in leaking[: args.top]:
+        print(  # noqa: T201
+            f"GROWING {(found.last - found.first) / 1024:+10.1f} KiB, rose in {found.rising:4.0%}: {found.name}"
+        )
+    for operation, ratio in drift(samples).items():
+        flag = "DRIFTED" if operation in drifted else "p99"
+        print(f"{flag} {operation}: last quarter {ratio:.2f}x the first")  # noqa: T201
+    if not (grown or leaking or drifted):
+        print("Nothing grew or drifted.")  # noqa: T201
+    return bool(grown or leaking or drifted)
+
+
+def test_database(env_file: Path) -> dict[str, str]:
+    """Return the ``DATABASE__*`` settings of ``env_file``, empty if it names no database."""
+    values = {key: value for key, value in dotenv_values(env_file).items() if key.startswith("DATABASE__") and value}
+    return values if "DATABASE__DB_NAME" in values else {}
+
+
+async def soak(args: argparse.Namespace) -> bool:
+    settings = Settings()
+    engine = create_async_engine(settings.db_dsn, pool_size=1, max_overflow=0)
+    sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    started = datetime.now(UTC)
+    builder = AppBuilder()
+    tracker = SessionTracker()
+    builder.app.dependency_overrides[get_db_session] = tracker.wrap(builder.get_db_session)
+    try:
+        async with sessionmaker() as session:
+            session.add_all(UserDb(id=f"{PREFIX}{number}", name="soak") for number in range(args.users))
+            await session.flush()
+            for number in range(args.users):
+                session.add_all(
+                    TransactionDb(
+                        uid=f"{PREFIX}{uuid.uuid4().hex[:30]}",
+                        user_id=f"{PREFIX}{number}",
+                        type=TransactionType.DEPOSIT,
+                        amount=Decimal(1),
+                        created_at=started - timedelta(seconds=second),
+                    )
+                    for second in range(HISTORY)
+                )
+            await session.commit()
+
+        tracemalloc.start(args.frames)
+        async with (
+            builder.lifespan_manager(builder.app),
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=builder.app), base_url="http://soak") as client,
+        ):
+            await builder._warmup_task  # noqa: SLF001
+            workload = Workload(client, args.users, started)
+            done = asyncio.Event()
+            clients = [asyncio.create_task(workload.client_loop(done)) for _ in range(args.concurrency)]
+            samples = []
+            key = "lineno" if args.frames == 1 else "traceback"
+            began = time.perf_counter()
+            try:
+                for _ in range(int(args.duration // args.interval)):
+                    await asyncio.sleep(args.interval)
+                    elapsed = time.perf_counter() - began
+                    result = sample(builder, tracker, workload, elapsed, key)
+                    if elapsed >= args.warmup:
+                        samples.append(result)
+            finally:
+                done.set()
+                await asyncio.gather(*clients)
+        tracemalloc.stop()
+    finally:
+        async with sessionmaker() as session:
+            await session.execute(delete(OutboxDb).where(OutboxDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionDb).where(TransactionDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionUidDb).where(TransactionUidDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(UserDb).where(UserDb.id.startswith(PREFIX)))
+            # Takes the test's transactions out of the ledger totals again.
+            await LedgerRepository(session).rebuild()
+            await session.commit()
+        await engine.dispose()
+
+    if len(samples) < 3:  # noqa: PLR2004
+        print("Too few samples after the warm-up for a report.")  # noqa: T201
+        return True
+    flagged = report(samples, args)
+    if args.output:
+        args.output.write_text(json.dumps([asdict(sample) for sample in samples]), encoding="utf-8")
+    return flagged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=4 * 3600, help="seconds")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between samples")
+    parser.add_argument("--warmup", type=float, default=600, help="seconds before the baseline sample")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--frames", type=int, default=1, help="frames of every allocation site")
+    parser.add_argument("--monotonic", type=float, default=0.9, help="share of intervals a leak grows in")
+    parser.add_argument("--min-growth", type=float, default=256 * 1024, help="bytes a leak grows by")
+    parser.add_argument("--max-drift", type=float, default=1.5, help="p99 ratio of the last to the first quarter")
+    parser.add_argument("--top", type=int, default=20, help="growing allocation sites to print")
+    parser.add_argument("--output", type=Path, help="JSON file for the samples")
+    parser.add_argument("--env-file", type=Path, default=Path(".env.test"), help="settings of the test database")
+    arguments = parser.parse_args()
+    # The test writes to and rebuilds the ledger of its database, so it never runs against the configured one.
+    database = test_database(arguments.env_file)
+    if not database:
+        parser.error(f"{arguments.env_file} names no test database")
+    # Read by the application's own settings, every soak user lives in the one test database.
+    os.environ.update(database, SHARDING__SHARDS="[]", ADMISSION__USER_RATE="0")
+    raise SystemExit(1 if asyncio.run(soak(arguments)) else 0)
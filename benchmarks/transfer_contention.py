@@ -0,0 +1,158 @@
+"""Throughput of ``POST /api/transfer/`` with many concurrent transfers between a few users.
+
+Transfers run in both directions between every pair of a small set of users, through ``TransactionService``
+and ``run_in_transaction``. ``transfer`` is the service's one-transaction transfer under each concurrency
+strategy. ``legs`` adds the withdrawal and then the deposit with ``add_transaction`` in one database
+transaction, locking the payer's row first: opposite transfers then deadlock, which Postgres detects and
+``run_in_transaction`` retries. The total of the users' balances must not change. The benchmark creates its
+own ``bench-`` users in the configured database and deletes them afterwards::
+
+    python benchmarks/transfer_contention.py --users 8 --concurrency 32 --operations 4000
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+import uuid
+from datetime import UTC, datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database.concurrency import (
+    TRANSACTION_CONFLICTS,
+    TRANSACTION_RETRIES,
+    ConcurrencyStrategy,
+    run_in_transaction,
+)
+from app.database.models import OutboxDb, TransactionDb, TransactionUidDb, UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.exceptions import ConcurrentUpdateError, TransactionExceedsBalanceError
+from app.schemas import TransferAdd
+from app.services import TransactionService
+from app.services.transaction_service import transfer_legs
+from app.settings import Settings
+
+
+PREFIX = "bench-"
+BALANCE = Decimal(1_000_000)
+
+
+async def move(
+    sessionmaker: async_sessionmaker[AsyncSession], mode: str, strategy: ConcurrencyStrategy, users: int
+) -> str:
+    from_user, to_user = random.sample(range(users), 2)
+    data = TransferAdd(
+        uid=f"{PREFIX}{uuid.uuid4().hex[:30]}",
+        from_user_id=f"{PREFIX}{from_user}",
+        to_user_id=f"{PREFIX}{to_user}",
+        amount=Decimal(random.randint(1, 100)),  # noqa: S311
+        created_at=datetime.now(UTC),
+    )
+    async with sessionmaker() as session:
+        service = TransactionService(
+            transaction_repo=TransactionRepository(session),
+            user_repo=UserRepository(session, strategy=strategy),
+            outbox_repo=OutboxRepository(session),
+            ledger_repo=LedgerRepository(session),
+            db_session=session,
+        )
+
+        async def legs() -> None:
+            withdrawal, deposit = transfer_legs(data)
+            await service.add_transaction(withdrawal)
+            await service.add_transaction(deposit)
+
+        work = legs if mode == "legs" else (lambda: service.transfer(data))
+        try:
+            await run_in_transaction(session, work, strategy, max_attempts=10)
+        except TransactionExceedsBalanceError:
+            return "rejected"
+        except ConcurrentUpdateError:
+            return "failed"
+        return "ok"
+
+
+async def total_balance(sessionmaker: async_sessionmaker[AsyncSession]) -> Decimal:
+    async with sessionmaker() as session:
+        query = select(func.sum(UserDb.balance)).where(UserDb.id.startswith(PREFIX))
+        return (await session.execute(query)).scalar_one()
+
+
+async def run(  # noqa: PLR0913
+    sessionmaker: async_sessionmaker[AsyncSession],
+    mode: str,
+    strategy: ConcurrencyStrategy,
+    *,
+    users: int,
+    operations: int,
+    concurrency: int,
+) -> None:
+    async with sessionmaker() as session:
+        await session.execute(update(UserDb).where(UserDb.id.startswith(PREFIX)).values(balance=BALANCE, version=0))
+        await session.commit()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def operation() -> str:
+        async with semaphore:
+            started = time.perf_counter()
+            outcome = await move(sessionmaker, mode, strategy, users)
+            latencies.append((time.perf_counter() - started) * 1000)
+            return outcome
+
+    retries = TRANSACTION_RETRIES.value(strategy=strategy)
+    conflicts = TRANSACTION_CONFLICTS.value(strategy=strategy)
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(operation() for _ in range(operations)))
+    elapsed = time.perf_counter() - started
+
+    conserved = await total_balance(sessionmaker) == BALANCE * users
+    print(  # noqa: T201
+        f"{mode:>8} {strategy:>12}: {operations / elapsed:8.1f} transfers/s, "
+        f"p50 {statistics.median(latencies):7.2f} ms, p99 {statistics.quantiles(latencies, n=100)[-1]:7.2f} ms, "
+        f"conflicts {TRANSACTION_CONFLICTS.value(strategy=strategy) - conflicts:6.0f}, "
+        f"retries {TRANSACTION_RETRIES.value(strategy=strategy) - retries:6.0f}, "
+        f"gave up {outcomes.count('failed')}, balances {'conserved' if conserved else 'NOT CONSERVED'}"
+    )
+
+
+async def main(dsn: str, users: int, operations: int, concurrency: int) -> None:
+    engine = create_async_engine(dsn, pool_size=concurrency, max_overflow=0)
+    sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    try:
+        async with sessionmaker() as session:
+            session.add_all(UserDb(id=f"{PREFIX}{number}", name="bench") for number in range(users))
+            await session.commit()
+
+        sizes = {"users": users, "operations": operations, "concurrency": concurrency}
+        await run(sessionmaker, "legs", ConcurrencyStrategy.PESSIMISTIC, **sizes)
+        for strategy in ConcurrencyStrategy:
+            await run(sessionmaker, "transfer", strategy, **sizes)
+    finally:
+        async with sessionmaker() as session:
+            await session.execute(delete(OutboxDb).where(OutboxDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionDb).where(TransactionDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionUidDb).where(TransactionUidDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(UserDb).where(UserDb.id.startswith(PREFIX)))
+            # Takes the benchmark's transactions out of the ledger totals and volumes again.
+            await LedgerRepository(session).rebuild()
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=Settings().db_dsn.render_as_string(hide_password=False))
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=4_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    # Exhausted retries are counted in the "gave up" column instead.
+    logging.getLogger("app.database.concurrency").setLevel(logging.ERROR)
+    asyncio.run(main(args.dsn, args.users, args.operations, args.concurrency))
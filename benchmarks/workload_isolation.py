@@ -0,0 +1,149 @@
+"""Latency of ``PUT /api/transaction/`` while historical balance reads flood the service.
+
+Runs the application in-process against the configured database, with admission control and its lanes as
+configured, but without the per-user rate limit and the outbox dispatchers. Payments are timed alone, then
+again while ``--flood`` clients request balances with ``ts`` for users with long histories. Those reads are
+admitted to the analytics lane and sum every transaction of the user, so they cannot take the payment
+lane's connections. The benchmark creates its own ``bench-`` users and deletes them afterwards::
+
+    python benchmarks/workload_isolation.py --operations 2000 --concurrency 16 --flood 64
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import httpx
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.application import AppBuilder
+from app.database.models import OutboxDb, TransactionDb, TransactionUidDb, UserDb
+from app.database.repositories import LedgerRepository
+from app.settings import Settings
+from app.types import TransactionType
+
+
+PREFIX = "bench-"
+PAYERS = 100
+REPORTED = 20
+
+
+def percentiles(latencies: list[float]) -> str:
+    return f"p50 {statistics.median(latencies):7.2f} ms, p99 {statistics.quantiles(latencies, n=100)[-1]:7.2f} ms"
+
+
+async def pay(client: httpx.AsyncClient, operations: int, concurrency: int) -> list[float]:
+    latencies = []
+    remaining = iter(range(operations))
+
+    async def worker() -> None:
+        for _ in remaining:
+            body = {
+                "uid": f"{PREFIX}{uuid.uuid4().hex[:30]}",
+                "user_id": f"{PREFIX}{random.randrange(PAYERS)}",  # noqa: S311
+                "amount": "1",
+                "type": TransactionType.DEPOSIT.value,
+                "created_at": datetime.now(UTC).isoformat(),
+            }
+            started = time.perf_counter()
+            response = await client.put("/api/transaction/", json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+
+    async with asyncio.TaskGroup() as workers:
+        for _ in range(concurrency):
+            workers.create_task(worker())
+    return latencies
+
+
+async def flood(client: httpx.AsyncClient, clients: int, done: asyncio.Event) -> collections.Counter[int]:
+    statuses: collections.Counter[int] = collections.Counter()
+
+    async def reader() -> None:
+        while not done.is_set():
+            user_id = f"{PREFIX}reported-{random.randrange(REPORTED)}"  # noqa: S311
+            response = await client.get(f"/api/user/{user_id}/balance/", params={"ts": datetime.now(UTC).isoformat()})
+            statuses[response.status_code] += 1
+            # Like a well-behaved client, instead of spinning on the event loop the payments share.
+            await asyncio.sleep(float(response.headers.get("Retry-After", 0)))
+
+    await asyncio.gather(*(reader() for _ in range(clients)))
+    return statuses
+
+
+async def main(operations: int, concurrency: int, clients: int, history: int) -> None:
+    settings = Settings()
+    engine = create_async_engine(settings.db_dsn, pool_size=1, max_overflow=0)
+    sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    now = datetime.now(UTC)
+    builder = AppBuilder()
+    try:
+        async with sessionmaker() as session:
+            session.add_all(UserDb(id=f"{PREFIX}{number}", name="bench") for number in range(PAYERS))
+            session.add_all(UserDb(id=f"{PREFIX}reported-{number}", name="bench") for number in range(REPORTED))
+            await session.flush()
+            for number in range(REPORTED):
+                session.add_all(
+                    TransactionDb(
+                        uid=f"{PREFIX}{uuid.uuid4().hex[:30]}",
+                        user_id=f"{PREFIX}reported-{number}",
+                        type=TransactionType.DEPOSIT,
+                        amount=Decimal(1),
+                        created_at=now - timedelta(seconds=second),
+                    )
+                    for second in range(history)
+                )
+                await session.flush()
+            await session.commit()
+
+        async with (
+            builder.lifespan_manager(builder.app),
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=builder.app), base_url="http://bench") as client,
+        ):
+            await builder._warmup_task  # noqa: SLF001
+            await pay(client, concurrency, concurrency)
+
+            alone = await pay(client, operations, concurrency)
+            print(f"payments alone:        {percentiles(alone)}")  # noqa: T201
+
+            done = asyncio.Event()
+            reads = asyncio.create_task(flood(client, clients, done))
+            await asyncio.sleep(0.5)
+            try:
+                flooded = await pay(client, operations, concurrency)
+            finally:
+                done.set()
+                statuses = await reads
+            print(f"payments during flood: {percentiles(flooded)}")  # noqa: T201
+            print(f"historical reads: {dict(statuses)} by status")  # noqa: T201
+    finally:
+        async with sessionmaker() as session:
+            await session.execute(delete(OutboxDb).where(OutboxDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionDb).where(TransactionDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(TransactionUidDb).where(TransactionUidDb.user_id.startswith(PREFIX)))
+            await session.execute(delete(UserDb).where(UserDb.id.startswith(PREFIX)))
+            # Takes the benchmark's transactions out of the ledger totals again.
+            await LedgerRepository(session).rebuild()
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--flood", type=int, default=64, help="clients requesting historical balances")
+    parser.add_argument("--history", type=int, default=20_000, help="transactions of each reported user")
+    args = parser.parse_args()
+    # Read by the application's own settings.
+    os.environ["ADMISSION__USER_RATE"] = "0"
+    os.environ["OUTBOX__DISPATCHER"] = "False"
+    asyncio.run(main(args.operations, args.concurrency, args.flood, args.history))
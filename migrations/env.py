@@ -3,7 +3,9 @@ from logging.config import fileConfig
 from alembic import context
 from sqlalchemy import URL, create_engine
 
-from app.database.models import METADATA
+from app.database.models import METADATA, TransactionDb
+from app.database.partitions import is_partition_name
+from app.database.utils import Money
 from app.settings import Settings
 
 
@@ -26,6 +28,18 @@ if config.config_file_name is not None:
 target_metadata = METADATA
 
 
+def include_name(name, type_, parent_names) -> bool:  # noqa: ANN001, ARG001
+    # Partitions are created by ``app.jobs.partitions``, not by migrations.
+    return not (type_ == "table" and is_partition_name(TransactionDb.__tablename__, name))
+
+
+def render_item(type_, obj, autogen_context) -> str | bool:  # noqa: ANN001, ARG001
+    # Amounts are plain BIGINT columns in the database, migrations should not import application types.
+    if type_ == "type" and isinstance(obj, Money):
+        return "sa.BigInteger()"
+    return False
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -57,7 +71,12 @@ def run_migrations_online() -> None:
     connectable = create_engine(get_dsn())
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            render_item=render_item,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import enum
+import time
+import typing
+
+from app.exceptions import RateLimitExceededError, ServiceOverloadedError
+from app.metrics import Counter, Gauge
+from app.settings import Settings
+
+
+QUEUE_DEPTH: typing.Final = Gauge("admission_queue_depth", "Requests waiting for a database slot.")
+IN_FLIGHT: typing.Final = Gauge("admission_in_flight", "Requests holding a database slot.")
+SHED: typing.Final = Counter("admission_shed_total", "Requests rejected by admission control.")
+
+
+class Lane(enum.StrEnum):
+    """Workloads with their own connection pools and admission limits, so one cannot starve another."""
+
+    WRITE = "write"
+    READ = "read"
+    ANALYTICS = "analytics"
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` holders at a time, at most ``max_queue`` more waiting in FIFO order."""
+
+    def __init__(self, lane: Lane, limit: int, max_queue: int, queue_timeout: float, retry_after: float):
+        self.lane = lane
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._waiters: collections.deque[asyncio.Future[None]] = collections.deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            IN_FLIGHT.inc(lane=self.lane)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            SHED.inc(lane=self.lane, reason="queue_full")
+            raise ServiceOverloadedError(self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        QUEUE_DEPTH.inc(lane=self.lane)
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended, pass it on.
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                QUEUE_DEPTH.dec(lane=self.lane)
+            if isinstance(e, TimeoutError):
+                SHED.inc(lane=self.lane, reason="queue_timeout")
+                raise ServiceOverloadedError(self.retry_after) from e
+            raise
+
+    def release(self) -> None:
+        # A released slot goes straight to the oldest waiter, so ``in_flight`` only drops when nobody waits.
+        if self._waiters:
+            QUEUE_DEPTH.dec(lane=self.lane)
+            self._waiters.popleft().set_result(None)
+            return
+        self.in_flight -= 1
+        IN_FLIGHT.dec(lane=self.lane)
+
+
+class TokenBucket:
+    __slots__ = ("burst", "rate", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token, return 0 on success or the seconds until the next token is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class UserRateLimiter:
+    """One token bucket per user, the least recently seen users are forgotten beyond ``max_users``."""
+
+    def __init__(self, rate: float, burst: float, max_users: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: collections.OrderedDict[str, TokenBucket] = collections.OrderedDict()
+
+    def take(self, user_key: str) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(user_key)
+        if bucket is None:
+            bucket = self._buckets[user_key] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_key)
+        return bucket.take(now)
+
+
+class AdmissionController:
+    """Admits requests to the database pools: per-user rate limits first, then a slot in the request's lane."""
+
+    def __init__(self, limiters: dict[Lane, ConcurrencyLimiter], rate_limiter: UserRateLimiter | None = None):
+        self.limiters = limiters
+        self.rate_limiter = rate_limiter
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AdmissionController | None":
+        admission = settings.admission
+        if not admission.enabled:
+            return None
+
+        # A lane never admits more requests than its pool can give connections to.
+        limiters = {}
+        for lane in Lane:
+            pool = getattr(settings.lanes, lane)
+            limiters[lane] = ConcurrencyLimiter(
+                lane, pool.pool_size + pool.max_overflow, pool.queue_size, pool.queue_timeout, admission.retry_after
+            )
+        rate_limiter = None
+        if admission.user_rate > 0:
+            rate_limiter = UserRateLimiter(admission.user_rate, admission.user_burst, admission.max_users)
+        return cls(limiters, rate_limiter)
+
+    async def enter(self, lane: Lane, user_key: str) -> None:
+        if self.rate_limiter is not None:
+            retry_after = self.rate_limiter.take(user_key)
+            if retry_after:
+                SHED.inc(lane=lane, reason="rate_limited")
+                raise RateLimitExceededError(retry_after)
+        await self.limiters[lane].acquire()
+
+    def leave(self, lane: Lane) -> None:
+        self.limiters[lane].release()
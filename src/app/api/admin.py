@@ -0,0 +1,83 @@
+import asyncio
+import cProfile
+import secrets
+import threading
+import typing
+
+import fastapi
+from fastapi import Depends
+from fastapi.responses import PlainTextResponse
+from starlette import status
+
+from app.api.base import get_settings
+from app.exceptions import ProfilerBusyError
+from app.profiling import StackSampler, exclusive, profiled, pstats_dump
+from app.settings import Settings
+from app.types import ProfileFormat
+
+
+ROUTER: typing.Final = fastapi.APIRouter()
+
+
+def require_admin(
+    authorization: typing.Annotated[str | None, fastapi.Header()] = None,
+    settings: Settings = Depends(get_settings),
+) -> None:
+    token = settings.profiling.token.get_secret_value()
+    if not token or not secrets.compare_digest((authorization or "").encode(), f"Bearer {token}".encode()):
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@ROUTER.post("/profile", dependencies=[Depends(require_admin)], response_class=fastapi.Response)
+async def profile(
+    request: fastapi.Request,
+    seconds: typing.Annotated[float, fastapi.Query(gt=0, description="How long to profile the worker for")] = 10,
+    format: ProfileFormat = ProfileFormat.COLLAPSED,  # noqa: A002
+    x_profile_route: typing.Annotated[
+        str | None, fastapi.Header(description="Only sample stacks of this route, by endpoint name")
+    ] = None,
+    settings: Settings = Depends(get_settings),
+) -> fastapi.Response:
+    """Profile the worker that serves this request for ``seconds``.
+
+    ``collapsed`` samples the event loop's stack and returns one ``outer;inner count`` line per stack, for
+    flame graph tools. ``pstats`` runs ``cProfile`` over everything the event loop runs and returns the file
+    ``pstats.Stats`` reads. Both add overhead to the requests served meanwhile, ``pstats`` considerably.
+    """
+    if seconds > settings.profiling.max_seconds:
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {settings.profiling.max_seconds} seconds."
+        )
+    within = None
+    if x_profile_route is not None:
+        if format != ProfileFormat.COLLAPSED:
+            raise fastapi.HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Only collapsed stacks can be taken per route."
+            )
+        route = next((route for route in request.app.routes if getattr(route, "name", None) == x_profile_route), None)
+        if route is None:
+            raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Route not found.")
+        within = route.endpoint.__code__
+
+    try:
+        with exclusive():
+            if format == ProfileFormat.PSTATS:
+                cprofile = cProfile.Profile()
+                with profiled(cprofile):
+                    await asyncio.sleep(seconds)
+                return fastapi.Response(
+                    content=pstats_dump(cprofile),
+                    media_type="application/octet-stream",
+                    headers={"Content-Disposition": 'attachment; filename="profile.pstats"'},
+                )
+
+            # Endpoints run on the event loop's thread.
+            with StackSampler(threading.get_ident(), settings.profiling.interval, within) as sampler:
+                await asyncio.sleep(seconds)
+            return PlainTextResponse(sampler.collapsed(), headers={"X-Profile-Samples": str(sampler.samples)})
+    except ProfilerBusyError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
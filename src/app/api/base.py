@@ -1,10 +1,32 @@
-from fastapi import Depends
+import asyncio
+import contextlib
+import math
+import typing
+from collections.abc import AsyncIterator
+
+from fastapi import Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
 from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette import status
+
+from app.admission import AdmissionController, Lane
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.database.sharding import ShardRouter
+from app.deadlines import EXPIRED, deadline, time_left
+from app.exceptions import (
+    DeadlineExceededError,
+    RangeNotSatisfiableError,
+    RateLimitExceededError,
+    ServiceOverloadedError,
+)
+from app.services import LedgerService, ShardedLedgerService, ShardedUserService, TransactionService, UserService
+from app.services.balance_updates import BalanceSubscriptions
+from app.services.idempotency import TransactionReplays
+from app.services.reports import ReportRunner
+from app.settings import LanePool, Settings
+
 
-from app.database.repositories import TransactionRepository, UserRepository
-from app.services import TransactionService, UserService
-from app.settings import Settings
+NDJSON_MEDIA_TYPE: typing.Final = "application/x-ndjson"
 
 
 def get_settings() -> Settings:
@@ -19,10 +41,231 @@ def get_db_session() -> AsyncSessionType:
     raise NotImplementedError
 
 
+def get_request_session_maker() -> async_sessionmaker[AsyncSessionType]:
+    raise NotImplementedError
+
+
+def get_balance_subscriptions() -> BalanceSubscriptions:
+    raise NotImplementedError
+
+
+def get_transaction_replays() -> TransactionReplays:
+    raise NotImplementedError
+
+
+def get_admission_controller() -> AdmissionController | None:
+    raise NotImplementedError
+
+
+def get_report_runner() -> ReportRunner:
+    raise NotImplementedError
+
+
+def get_shard_sessions() -> dict[str, AsyncSessionType]:
+    raise NotImplementedError
+
+
+def get_shard_router() -> ShardRouter:
+    raise NotImplementedError
+
+
+async def _get_json_field(request: Request, name: str) -> str | None:
+    # Bulk bodies can be large: NDJSON is left for the route to stream and JSON arrays are not parsed twice.
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        return None
+    if (await request.body()).lstrip().startswith(b"{"):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and data.get(name):
+            return str(data[name])
+    return None
+
+
+async def get_request_user_id(request: Request) -> str | None:
+    """Return the user a request acts for: the ``user_id`` path parameter or JSON field.
+
+    A transfer acts for the user it withdraws from, ``from_user_id``.
+    """
+    if user_id := request.path_params.get("user_id"):
+        return str(user_id)
+    return await _get_json_field(request, "user_id") or await _get_json_field(request, "from_user_id")
+
+
+async def get_user_key(request: Request) -> str:
+    """Return the user a request acts for, else the client address."""
+    if user_id := await get_request_user_id(request):
+        return user_id
+    return request.client.host if request.client else ""
+
+
+async def get_request_shard(request: Request, shard_router: ShardRouter) -> str:
+    """Return the shard holding the data of the request's transaction or user."""
+    if not shard_router.sharded:
+        return shard_router.default_shard
+    if transaction_id := request.path_params.get("transaction_id"):
+        return await shard_router.shard_for_transaction(str(transaction_id))
+    # ``POST /api/user/`` names the user it creates ``id``.
+    if user_id := await get_request_user_id(request) or await _get_json_field(request, "id"):
+        return await shard_router.shard_for_user(user_id)
+    return shard_router.default_shard
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches ``etag``, compared weakly as RFC 9110 requires."""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def byte_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """Return the first and last byte a ``Range`` header asks for, ``None`` to send the whole content.
+
+    Only a single ``bytes`` range is served, other headers are ignored as RFC 9110 allows.
+    """
+    if range_header is None:
+        return None
+    unit, _, spec = range_header.partition("=")
+    first, dash, last = spec.strip().partition("-")
+    numbers = all(part.isdigit() for part in (first, last) if part)
+    if unit.strip().lower() != "bytes" or not dash or not numbers or not (first or last):
+        return None
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        # ``bytes=-N`` asks for the last N bytes.
+        start = max(size - int(last), 0) if int(last) else size
+        end = size - 1
+    if start >= size:
+        raise RangeNotSatisfiableError
+    return start, min(end, size - 1)
+
+
+def get_request_lane(request: Request) -> Lane:
+    """Return the lane whose connections serve the request, chosen by the route's ``admit_*`` dependency."""
+    return getattr(request.state, "lane", Lane.READ)
+
+
+def get_route_name(request: Request) -> str:
+    endpoint = request.scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unknown")
+
+
+def get_request_budget(request: Request, settings: Settings, lane: Lane) -> float | None:
+    """Return the seconds a request may take: the client's header, else its route's or lane's budget."""
+    deadlines = settings.deadlines
+    if not deadlines.enabled:
+        return None
+    if header := request.headers.get(deadlines.header):
+        try:
+            seconds = float(header)
+        except ValueError:
+            seconds = math.nan
+        if not math.isfinite(seconds) or seconds <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{deadlines.header} must be a positive number of seconds.",
+            )
+        return min(seconds, deadlines.max_timeout)
+    pool: LanePool = getattr(settings.lanes, lane)
+    return deadlines.routes.get(get_route_name(request), pool.deadline)
+
+
+def _deadline_expired(request: Request) -> HTTPException:
+    EXPIRED.inc(route=get_route_name(request), stage="admission")
+    return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(DeadlineExceededError()))
+
+
+async def _enter(request: Request, admission: AdmissionController | None, lane: Lane) -> None:
+    # Waiting in the lane's queue counts against the deadline, expired requests never reach the pool.
+    left = time_left()
+    if left is not None and left <= 0:
+        raise _deadline_expired(request)
+    try:
+        async with asyncio.timeout(left):
+            if admission is not None:
+                await admission.enter(lane, await get_user_key(request))
+    except TimeoutError as e:
+        raise _deadline_expired(request) from e
+    except ServiceOverloadedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        ) from e
+    except RateLimitExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        ) from e
+
+
+@contextlib.asynccontextmanager
+async def admit(
+    request: Request, admission: AdmissionController | None, lane: Lane, settings: Settings
+) -> AsyncIterator[None]:
+    # Route dependencies run before the endpoint's, so its sessions come from the lane's pool.
+    request.state.lane = lane
+    budget = get_request_budget(request, settings, lane)
+    with contextlib.nullcontext() if budget is None else deadline(budget):
+        await _enter(request, admission, lane)
+        try:
+            yield
+        finally:
+            if admission is not None:
+                admission.leave(lane)
+
+
+async def admit_read(
+    request: Request,
+    admission: AdmissionController | None = Depends(get_admission_controller),
+    settings: Settings = Depends(get_settings),
+) -> AsyncIterator[None]:
+    async with admit(request, admission, Lane.READ, settings):
+        yield
+
+
+async def admit_write(
+    request: Request,
+    admission: AdmissionController | None = Depends(get_admission_controller),
+    settings: Settings = Depends(get_settings),
+) -> AsyncIterator[None]:
+    async with admit(request, admission, Lane.WRITE, settings):
+        yield
+
+
+async def admit_analytics(
+    request: Request,
+    admission: AdmissionController | None = Depends(get_admission_controller),
+    settings: Settings = Depends(get_settings),
+) -> AsyncIterator[None]:
+    async with admit(request, admission, Lane.ANALYTICS, settings):
+        yield
+
+
+async def admit_historical_read(
+    request: Request,
+    admission: AdmissionController | None = Depends(get_admission_controller),
+    settings: Settings = Depends(get_settings),
+) -> AsyncIterator[None]:
+    # Balances at a point in time sum the user's transactions, current ones are a single row.
+    lane = Lane.ANALYTICS if request.query_params.get("ts") else Lane.READ
+    async with admit(request, admission, lane, settings):
+        yield
+
+
 def get_user_repo(
     db_session: AsyncSessionType = Depends(get_db_session),
+    settings: Settings = Depends(get_settings),
 ) -> UserRepository:
-    return UserRepository(db_session=db_session)
+    return UserRepository(db_session=db_session, strategy=settings.concurrency.strategy)
 
 
 def get_transaction_repo(
@@ -31,6 +274,19 @@ def get_transaction_repo(
     return TransactionRepository(db_session=db_session)
 
 
+def get_outbox_repo(
+    db_session: AsyncSessionType = Depends(get_db_session),
+) -> OutboxRepository:
+    return OutboxRepository(db_session=db_session)
+
+
+def get_ledger_repo(
+    db_session: AsyncSessionType = Depends(get_db_session),
+    settings: Settings = Depends(get_settings),
+) -> LedgerRepository:
+    return LedgerRepository(db_session=db_session, stripes=settings.ledger.stripes)
+
+
 def get_user_service(
     db_session: AsyncSessionType = Depends(get_db_session),
     user_repo: UserRepository = Depends(get_user_repo),
@@ -43,9 +299,53 @@ def get_user_service(
     )
 
 
-def get_transaction_service(
+def get_transaction_service(  # noqa: PLR0913
     db_session: AsyncSessionType = Depends(get_db_session),
     transaction_repo: TransactionRepository = Depends(get_transaction_repo),
     user_repo: UserRepository = Depends(get_user_repo),
+    outbox_repo: OutboxRepository = Depends(get_outbox_repo),
+    ledger_repo: LedgerRepository = Depends(get_ledger_repo),
+    replays: TransactionReplays = Depends(get_transaction_replays),
 ) -> TransactionService:
-    return TransactionService(transaction_repo=transaction_repo, user_repo=user_repo, db_session=db_session)
+    return TransactionService(
+        transaction_repo=transaction_repo,
+        user_repo=user_repo,
+        outbox_repo=outbox_repo,
+        ledger_repo=ledger_repo,
+        db_session=db_session,
+        replays=replays,
+    )
+
+
+def get_sharded_user_service(
+    db_sessions: dict[str, AsyncSessionType] = Depends(get_shard_sessions),
+    shard_router: ShardRouter = Depends(get_shard_router),
+    settings: Settings = Depends(get_settings),
+) -> ShardedUserService:
+    return ShardedUserService(
+        {
+            shard: UserService(
+                user_repo=UserRepository(db_session=db_session, strategy=settings.concurrency.strategy),
+                transaction_repo=TransactionRepository(db_session=db_session),
+                db_session=db_session,
+            )
+            for shard, db_session in db_sessions.items()
+        },
+        shard_router,
+    )
+
+
+def get_ledger_service(
+    db_sessions: dict[str, AsyncSessionType] = Depends(get_shard_sessions),
+    settings: Settings = Depends(get_settings),
+) -> ShardedLedgerService:
+    return ShardedLedgerService(
+        [
+            LedgerService(
+                ledger_repo=LedgerRepository(db_session=db_session, stripes=settings.ledger.stripes),
+                user_repo=UserRepository(db_session=db_session, strategy=settings.concurrency.strategy),
+                db_session=db_session,
+            )
+            for db_session in db_sessions.values()
+        ]
+    )
@@ -0,0 +1,32 @@
+import typing
+from datetime import date
+
+import fastapi
+from fastapi import Depends
+
+from app import schemas
+from app.api.base import admit_analytics, admit_read, get_ledger_service
+from app.services import ShardedLedgerService
+
+
+ROUTER: typing.Final = fastapi.APIRouter()
+
+
+@ROUTER.get("/ledger/liabilities", dependencies=[Depends(admit_read)])
+async def get_liabilities(ledger_service: ShardedLedgerService = Depends(get_ledger_service)) -> schemas.Liabilities:
+    return await ledger_service.get_liabilities()
+
+
+@ROUTER.get("/ledger/volume/{day}", dependencies=[Depends(admit_analytics)])
+async def get_daily_volumes(
+    day: date, ledger_service: ShardedLedgerService = Depends(get_ledger_service)
+) -> list[schemas.DailyVolume]:
+    return await ledger_service.get_daily_volumes(day)
+
+
+@ROUTER.get("/ledger/top-users", dependencies=[Depends(admit_analytics)])
+async def get_top_users(
+    limit: typing.Annotated[int, fastapi.Query(ge=1, le=1000, description="Number of users")] = 10,
+    ledger_service: ShardedLedgerService = Depends(get_ledger_service),
+) -> list[schemas.UserBalance]:
+    return await ledger_service.get_top_users(limit)
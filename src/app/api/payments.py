@@ -1,14 +1,43 @@
+import hashlib
 import typing
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
 from datetime import datetime
 
 import fastapi
 from fastapi import Depends
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from starlette import status
 
 from app import schemas
-from app.api.base import get_db_session, get_transaction_service, get_user_service
+from app.admission import AdmissionController, Lane
+from app.api.base import (
+    NDJSON_MEDIA_TYPE,
+    admit,
+    admit_analytics,
+    admit_historical_read,
+    admit_read,
+    admit_write,
+    etag_matches,
+    get_admission_controller,
+    get_balance_subscriptions,
+    get_db_session,
+    get_request_session_maker,
+    get_settings,
+    get_shard_router,
+    get_sharded_user_service,
+    get_transaction_service,
+    get_user_service,
+)
+from app.database.concurrency import is_unique_violation, run_in_transaction
+from app.database.repositories import UserRepository
+from app.database.sharding import ShardRouter
 from app.exceptions import (
+    ConcurrentUpdateError,
+    CrossShardTransferError,
     TransactionExceedsBalanceError,
     TransactionNotFoundError,
     TransactionProcessedError,
@@ -16,13 +45,27 @@ from app.exceptions import (
     UserNotFoundError,
     WrongTimeStampError,
 )
-from app.services import TransactionService, UserService
+from app.services import ShardedUserService, TransactionService, UserService
+from app.services.balance_updates import BalanceSubscriptions, BalanceUpdate, balance_events
+from app.services.transaction_service import transfer_legs
+from app.settings import Settings, Users
+from app.types import UserCreationStatus
 
 
 ROUTER: typing.Final = fastapi.APIRouter()
 
+# Transactions never change once written, so caches may keep them for good.
+TRANSACTION_CACHE_CONTROL: typing.Final = "public, max-age=31536000, immutable"
+# Balances change, caches must revalidate them with ``If-None-Match``.
+BALANCE_CACHE_CONTROL: typing.Final = "no-cache"
+
+
+def transaction_etag(transaction: schemas.Transaction) -> str:
+    # Built from the stored row, so the tag changes with the representation and no row has no tag.
+    return f'"{hashlib.sha256(transaction.model_dump_json().encode()).hexdigest()[:32]}"'
+
 
-@ROUTER.post("/user/")
+@ROUTER.post("/user/", dependencies=[Depends(admit_write)])
 async def create_user(
     data: schemas.UserCreate,
     user_service: UserService = Depends(get_user_service),
@@ -38,48 +81,291 @@ async def create_user(
         return user
 
 
-@ROUTER.get("/user/{user_id}/balance/")
+async def _ndjson_lines(request: fastapi.Request) -> AsyncIterator[bytes]:
+    """Yield the non-blank lines of the request body as they arrive."""
+    buffer = b""
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _iterate(items: Iterable[object]) -> AsyncIterator[object]:
+    for item in items:
+        yield item
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" if e["loc"] else e["msg"] for e in error.errors())
+
+
+async def _create_users(
+    items: AsyncIterable[object], user_service: ShardedUserService, settings: Users
+) -> list[schemas.UserCreationResult]:
+    """Create the valid items ``settings.bulk_chunk_size`` at a time, return a result per item in order."""
+    results: list[schemas.UserCreationResult] = []
+    pending: list[tuple[schemas.UserCreationResult, schemas.UserCreate]] = []
+    seen: set[str] = set()
+
+    async def flush() -> None:
+        created = await user_service.create_users([user for _, user in pending])
+        for result, user in pending:
+            result.status = UserCreationStatus.CREATED if user.id in created else UserCreationStatus.EXISTS
+        pending.clear()
+
+    async for item in items:
+        if len(results) == settings.bulk_max_items:
+            await flush()
+            raise fastapi.HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"More than {settings.bulk_max_items} users, the first {len(results)} were processed.",
+            )
+
+        try:
+            if isinstance(item, bytes):
+                user = schemas.UserCreate.model_validate_json(item)
+            else:
+                user = schemas.UserCreate.model_validate(item)
+        except ValidationError as e:
+            results.append(
+                schemas.UserCreationResult(
+                    index=len(results), status=UserCreationStatus.INVALID, detail=_validation_detail(e)
+                )
+            )
+            continue
+
+        result = schemas.UserCreationResult(index=len(results), id=user.id, status=UserCreationStatus.EXISTS)
+        results.append(result)
+        # A repeated id exists by the time its later copies would be inserted.
+        if user.id not in seen:
+            seen.add(user.id)
+            pending.append((result, user))
+            if len(pending) == settings.bulk_chunk_size:
+                await flush()
+
+    await flush()
+    return results
+
+
+@ROUTER.post(
+    "/users/bulk",
+    # Long-running provisioning must not take the connections payments need.
+    dependencies=[Depends(admit_analytics)],
+    response_model=list[schemas.UserCreationResult],
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": schemas.UserCreate.model_json_schema()}},
+                NDJSON_MEDIA_TYPE: {"schema": schemas.UserCreate.model_json_schema()},
+            }
+        }
+    },
+)
+async def create_users_bulk(
+    request: fastapi.Request,
+    user_service: ShardedUserService = Depends(get_sharded_user_service),
+    settings: Settings = Depends(get_settings),
+) -> list[schemas.UserCreationResult] | fastapi.Response:
+    """Create users from a JSON array or an NDJSON stream, answering in the same format with a result per item.
+
+    Users are committed a chunk at a time, so a failed request may have created some of them. Items that
+    already exist are reported as such, so the whole request can simply be sent again.
+    """
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        results = await _create_users(_ndjson_lines(request), user_service, settings.users)
+        content = "".join(f"{result.model_dump_json()}\n" for result in results)
+        return fastapi.Response(content=content, media_type=NDJSON_MEDIA_TYPE)
+
+    try:
+        items = await request.json()
+    except ValueError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid JSON.") from e
+    if not isinstance(items, list):
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Expected a JSON array of users."
+        )
+    if len(items) > settings.users.bulk_max_items:
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"More than {settings.users.bulk_max_items} users.",
+        )
+    return await _create_users(_iterate(items), user_service, settings.users)
+
+
+@ROUTER.get(
+    "/user/{user_id}/balance/", dependencies=[Depends(admit_historical_read)], response_model=schemas.UserBalance
+)
 async def get_user_balance(
     user_id: str,
+    response: fastapi.Response,
     ts: typing.Annotated[
         datetime | None, fastapi.Query(description="Timestamp in ISO format with timezone. Defaults to UTC.")
     ] = None,
+    if_none_match: typing.Annotated[str | None, fastapi.Header()] = None,
     user_service: UserService = Depends(get_user_service),
-) -> schemas.UserBalance:
+) -> schemas.UserBalance | fastapi.Response:
     try:
         balance = await user_service.get_balance(user_id=user_id, ts=ts)
     except UserNotFoundError as e:
         raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
     except WrongTimeStampError as e:
         raise fastapi.HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
-    else:
-        return balance
 
+    if balance.version is not None:
+        headers = {"ETag": f'"{balance.version}"', "Cache-Control": BALANCE_CACHE_CONTROL}
+        if etag_matches(if_none_match, headers["ETag"]):
+            return fastapi.Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+    return balance
+
+
+@ROUTER.get("/user/{user_id}/balance/stream")
+async def stream_user_balance(  # noqa: PLR0913
+    request: fastapi.Request,
+    user_id: str,
+    session_maker: async_sessionmaker[AsyncSessionType] = Depends(get_request_session_maker),
+    admission: AdmissionController | None = Depends(get_admission_controller),
+    subscriptions: BalanceSubscriptions = Depends(get_balance_subscriptions),
+    settings: Settings = Depends(get_settings),
+) -> StreamingResponse:
+    # The admission slot and the session are released here, before streaming starts: an open stream holds
+    # neither. Without an ``admit_*`` dependency the session maker is the read lane's.
+    async with admit(request, admission, Lane.READ, settings), session_maker() as db_session:
+        # Subscribe before reading, so no update committed after the read is missed. The read skips
+        # the coalesced ``get_balance``, whose shared query may have started before the subscription.
+        subscription = subscriptions.subscribe(user_id)
+        user = await UserRepository(db_session, strategy=settings.concurrency.strategy).get(user_id)
+    if user is None:
+        subscriptions.unsubscribe(subscription)
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(UserNotFoundError()))
+
+    events = balance_events(
+        subscriptions, subscription, BalanceUpdate(user.id, user.balance, user.version), settings.streams.heartbeat
+    )
+    return StreamingResponse(
+        events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@ROUTER.put("/transaction/")
-async def add_transaction(
+
+@ROUTER.put("/transaction/", dependencies=[Depends(admit_write)])
+async def add_transaction(  # noqa: PLR0913
     data: schemas.TransactionAdd,
+    response: fastapi.Response,
     transaction_service: TransactionService = Depends(get_transaction_service),
     db_session: AsyncSessionType = Depends(get_db_session),
+    shard_router: ShardRouter = Depends(get_shard_router),
+    settings: Settings = Depends(get_settings),
 ) -> schemas.Transaction:
+    """Add a transaction once, retries with the same uid and payload get the first response back.
+
+    A replayed response carries ``Idempotent-Replayed: true``, a different payload under a processed uid
+    is a conflict.
+    """
     try:
-        transaction = await transaction_service.add_transaction(data)
-        await db_session.commit()
+        replayed = transaction_service.replay_cached(data)
+        if replayed is None:
+            try:
+                await shard_router.claim([data])
+                transaction = await run_in_transaction(
+                    db_session,
+                    lambda: transaction_service.add_transaction(data),
+                    strategy=settings.concurrency.strategy,
+                    max_attempts=settings.concurrency.max_attempts,
+                    base_delay=settings.concurrency.retry_base_delay,
+                    max_delay=settings.concurrency.retry_max_delay,
+                )
+            except TransactionProcessedError:
+                replayed = await transaction_service.replay(data)
+            except IntegrityError as e:
+                # A retry that raced the first attempt past the uid check.
+                if not is_unique_violation(e):
+                    raise
+                replayed = await transaction_service.replay(data)
+            else:
+                return transaction_service.remember(transaction)
     except UserNotFoundError as e:
-        await db_session.rollback()
         raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
-    except TransactionProcessedError as e:
-        await db_session.rollback()
+    except (TransactionProcessedError, ConcurrentUpdateError) as e:
         raise fastapi.HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
     except TransactionExceedsBalanceError as e:
-        await db_session.rollback()
         raise fastapi.HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
-    else:
-        return transaction
+    response.headers["Idempotent-Replayed"] = "true"
+    return replayed
+
+
+@ROUTER.post("/transfer/", dependencies=[Depends(admit_write)])
+async def add_transfer(  # noqa: PLR0913
+    data: schemas.TransferAdd,
+    response: fastapi.Response,
+    transaction_service: TransactionService = Depends(get_transaction_service),
+    db_session: AsyncSessionType = Depends(get_db_session),
+    shard_router: ShardRouter = Depends(get_shard_router),
+    settings: Settings = Depends(get_settings),
+) -> schemas.Transfer:
+    """Move an amount from one user to another: a withdrawal and a deposit, added together or not at all.
+
+    Retries are answered like those of ``PUT /api/transaction/``.
+    """
+    if shard_router.sharded and (
+        await shard_router.shard_for_user(data.from_user_id) != await shard_router.shard_for_user(data.to_user_id)
+    ):
+        raise fastapi.HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(CrossShardTransferError()))
+    try:
+        try:
+            await shard_router.claim(transfer_legs(data))
+            transfer = await run_in_transaction(
+                db_session,
+                lambda: transaction_service.transfer(data),
+                strategy=settings.concurrency.strategy,
+                max_attempts=settings.concurrency.max_attempts,
+                base_delay=settings.concurrency.retry_base_delay,
+                max_delay=settings.concurrency.retry_max_delay,
+            )
+        except TransactionProcessedError:
+            replayed = await transaction_service.replay_transfer(data)
+        except IntegrityError as e:
+            if not is_unique_violation(e):
+                raise
+            replayed = await transaction_service.replay_transfer(data)
+        else:
+            transaction_service.remember(transfer.withdrawal)
+            transaction_service.remember(transfer.deposit)
+            return transfer
+    except UserNotFoundError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+    except (TransactionProcessedError, ConcurrentUpdateError) as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    except TransactionExceedsBalanceError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    response.headers["Idempotent-Replayed"] = "true"
+    return replayed
 
 
-@ROUTER.post("/transaction/{transaction_id}")
+@ROUTER.get("/transaction/{transaction_id}", dependencies=[Depends(admit_read)], response_model=schemas.Transaction)
 async def get_transaction(
+    transaction_id: str,
+    response: fastapi.Response,
+    if_none_match: typing.Annotated[str | None, fastapi.Header()] = None,
+    transaction_service: TransactionService = Depends(get_transaction_service),
+) -> schemas.Transaction | fastapi.Response:
+    try:
+        transaction = await transaction_service.get_transaction(transaction_id)
+    except TransactionNotFoundError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+
+    headers = {"ETag": transaction_etag(transaction), "Cache-Control": TRANSACTION_CACHE_CONTROL}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return fastapi.Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return transaction
+
+
+# The original lookup, kept for existing clients. POST responses are not cached, use GET.
+@ROUTER.post("/transaction/{transaction_id}", dependencies=[Depends(admit_read)], deprecated=True)
+async def get_transaction_legacy(
     transaction_id: str,
     transaction_service: TransactionService = Depends(get_transaction_service),
 ) -> schemas.Transaction:
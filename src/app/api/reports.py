@@ -0,0 +1,158 @@
+import asyncio
+import math
+import secrets
+import typing
+from collections.abc import AsyncIterator
+
+import fastapi
+from fastapi import Depends
+from fastapi.responses import StreamingResponse
+from starlette import status
+
+from app import schemas
+from app.api.base import byte_range, get_report_runner, get_settings
+from app.exceptions import (
+    RangeNotSatisfiableError,
+    ReportNotFoundError,
+    ReportNotReadyError,
+    ServiceOverloadedError,
+    TooManyReportsError,
+)
+from app.services.reports import ReportRunner, report_path
+from app.settings import Settings
+from app.types import ReportStatus
+
+
+ROUTER: typing.Final = fastapi.APIRouter()
+
+ReportId = typing.Annotated[str, fastapi.Path(pattern=r"^[0-9a-f]{32}$", description="Report ID")]
+
+CHUNK_SIZE: typing.Final = 64 * 1024
+
+
+def get_tenant(
+    request: fastapi.Request,
+    authorization: typing.Annotated[str | None, fastapi.Header()] = None,
+    settings: Settings = Depends(get_settings),
+) -> str:
+    """Return the tenant whose bearer token the request carries, the client address if no tenant has one."""
+    tokens = settings.reports.tenant_tokens
+    if not tokens:
+        return request.client.host if request.client else ""
+    credentials = (authorization or "").encode()
+    for tenant, token in tokens.items():
+        secret = token.get_secret_value()
+        if secret and secrets.compare_digest(credentials, f"Bearer {secret}".encode()):
+            return tenant
+    raise fastapi.HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid tenant token.",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def report_etag(report: schemas.Report) -> str:
+    # A report's file never changes once it is done.
+    return f'"r1-{report.id}-{report.size}"'
+
+
+async def _read(file: typing.BinaryIO, start: int, end: int) -> AsyncIterator[bytes]:
+    try:
+        await asyncio.to_thread(file.seek, start)
+        left = end - start + 1
+        while left > 0:
+            chunk = await asyncio.to_thread(file.read, min(CHUNK_SIZE, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+@ROUTER.post("/reports", status_code=status.HTTP_202_ACCEPTED)
+async def create_report(
+    data: schemas.ReportCreate,
+    response: fastapi.Response,
+    tenant: str = Depends(get_tenant),
+    report_runner: ReportRunner = Depends(get_report_runner),
+) -> schemas.Report:
+    """Queue a report and return it; poll ``GET /api/reports/{id}`` until it is done, then download it."""
+    try:
+        report = await report_runner.submit(tenant, data)
+    except TooManyReportsError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)) from e
+    except ServiceOverloadedError as e:
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        ) from e
+    response.headers["Location"] = f"/api/reports/{report.id}"
+    return report
+
+
+@ROUTER.get("/reports/{report_id}")
+async def get_report(
+    report_id: ReportId,
+    tenant: str = Depends(get_tenant),
+    report_runner: ReportRunner = Depends(get_report_runner),
+) -> schemas.Report:
+    try:
+        return await report_runner.get(tenant, report_id)
+    except ReportNotFoundError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+
+
+@ROUTER.get("/reports/{report_id}/download", response_class=StreamingResponse)
+async def download_report(
+    report_id: ReportId,
+    range_header: typing.Annotated[str | None, fastapi.Header(alias="Range")] = None,
+    if_range: typing.Annotated[str | None, fastapi.Header()] = None,
+    tenant: str = Depends(get_tenant),
+    report_runner: ReportRunner = Depends(get_report_runner),
+) -> StreamingResponse:
+    """Download a done report's CSV file, or the byte range the ``Range`` header asks for."""
+    try:
+        report = await report_runner.get(tenant, report_id)
+    except ReportNotFoundError as e:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+    if report.status != ReportStatus.DONE or report.size is None:
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(ReportNotReadyError(report.error or report.status.value))
+        )
+
+    etag = report_etag(report)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="report-{report_id}.csv"',
+    }
+    # A range of another version of the file would not fit what the client already has.
+    if if_range is not None and if_range.strip() != etag:
+        range_header = None
+    try:
+        requested = byte_range(range_header, report.size)
+    except RangeNotSatisfiableError as e:
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail=str(e),
+            headers={"Content-Range": f"bytes */{report.size}"},
+        ) from e
+
+    try:
+        file = await asyncio.to_thread(report_path(report_runner.directory, report_id).open, "rb")
+    except FileNotFoundError as e:
+        # Purged since the state was read.
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(ReportNotFoundError())) from e
+
+    start, end = requested if requested is not None else (0, report.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if requested is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{report.size}"
+    return StreamingResponse(
+        _read(file, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if requested is not None else status.HTTP_200_OK,
+        media_type="text/csv",
+        headers=headers,
+    )
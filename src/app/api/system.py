@@ -0,0 +1,27 @@
+import typing
+
+import fastapi
+from fastapi.responses import PlainTextResponse
+from starlette import status
+
+from app.metrics import REGISTRY
+
+
+ROUTER: typing.Final = fastapi.APIRouter()
+
+
+@ROUTER.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    return REGISTRY.render()
+
+
+@ROUTER.get("/live")
+async def live() -> dict[str, str]:
+    return {"status": "ok"}
+
+
+@ROUTER.get("/ready")
+async def ready(request: fastapi.Request) -> dict[str, str]:
+    if not request.app.state.ready:
+        raise fastapi.HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Warming up")
+    return {"status": "ok"}
@@ -1,24 +1,60 @@
+import asyncio
 import contextlib
 import logging
+import time
 import typing
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Awaitable, Callable
 
 import fastapi
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
 from starlette import status
 
-from app.api.base import get_db, get_db_session
-from app.api.payments import ROUTER
-from app.exceptions import INTERNAL_SERVER_ERROR_MSG
+from app.admission import AdmissionController, Lane
+from app.api import admin, ledger, payments, reports, system
+from app.api.base import (
+    get_admission_controller,
+    get_balance_subscriptions,
+    get_db,
+    get_db_session,
+    get_report_runner,
+    get_request_lane,
+    get_request_session_maker,
+    get_request_shard,
+    get_route_name,
+    get_settings,
+    get_shard_router,
+    get_shard_sessions,
+    get_transaction_replays,
+)
+from app.database.sharding import ShardRouter
+from app.database.warmup import warm_up
+from app.deadlines import EXPIRED, enforce_statement_timeouts
+from app.exceptions import INTERNAL_SERVER_ERROR_MSG, DeadlineExceededError
+from app.logs import LogListener, configure_logging, stop_logging
+from app.loop_monitor import LoopMonitor
+from app.metrics import Gauge
+from app.services.balance_updates import BalanceListener, BalanceSubscriptions
+from app.services.idempotency import TransactionReplays
+from app.services.outbox import FileSink, OutboxDispatcher, OutboxSink
+from app.services.reports import ReportRunner
 from app.settings import Settings
 
 
 logger = logging.getLogger(__name__)
 
+WARMUP_SECONDS: typing.Final = Gauge("app_warmup_seconds", "Time the last warm-up took before the worker got ready.")
 
-def include_routers(app: fastapi.FastAPI) -> None:
-    app.include_router(ROUTER, prefix="/api")
+
+def include_routers(app: fastapi.FastAPI, settings: Settings) -> None:
+    app.include_router(payments.ROUTER, prefix="/api")
+    app.include_router(ledger.ROUTER, prefix="/api")
+    app.include_router(reports.ROUTER, prefix="/api")
+    app.include_router(system.ROUTER)
+    # Not even routed unless enabled.
+    if settings.profiling.enabled:
+        app.include_router(admin.ROUTER, prefix="/admin")
 
 
 async def exception_handler(request: fastapi.Request, call_next) -> fastapi.Response:  # noqa: ANN001
@@ -31,36 +67,188 @@ async def exception_handler(request: fastapi.Request, call_next) -> fastapi.Resp
         )
 
 
+async def deadline_exceeded_handler(request: fastapi.Request, exc: Exception) -> fastapi.Response:
+    # Raised by the statement that ran out of time, in whichever service or repository issued it.
+    EXPIRED.inc(route=get_route_name(request), stage="database")
+    return JSONResponse({"detail": str(exc)}, status_code=status.HTTP_504_GATEWAY_TIMEOUT)
+
+
 class AppBuilder:
-    _async_engine: AsyncEngine
+    _async_engines: list[AsyncEngine]
+    # ``lane -> shard -> session maker``, every lane has its own pool on every shard.
+    _session_makers: dict[Lane, dict[str, async_sessionmaker[AsyncSessionType]]]
     _session_maker: async_sessionmaker[AsyncSessionType]
+    _warmup_task: asyncio.Task[None] | None = None
+    _log_listener: LogListener | None = None
 
     def __init__(self) -> None:
         self.settings = Settings()
+        # Extra warm-up steps, e.g. filling in-process caches, run after the connections are warm.
+        self.warmup_hooks: list[Callable[[], Awaitable[None]]] = [self.wait_for_balance_listeners]
+        self.balance_subscriptions = BalanceSubscriptions(self.settings.streams.buffer_size)
+        self.transaction_replays = TransactionReplays(self.settings.idempotency.replay_cache_size)
+        self.report_runner = ReportRunner(self.settings)
+        # Every shard notifies about the balances of its own users.
+        self.balance_listeners = [
+            BalanceListener(
+                dsn.set(drivername="postgresql").render_as_string(hide_password=False),
+                self.balance_subscriptions,
+                self.settings.streams.reconnect_delay,
+            )
+            for dsn in self.settings.shard_dsns.values()
+        ]
+        # Where the worker's outbox dispatchers deliver events, can be set before startup. Without a sink
+        # they do not run and events stay in the outbox.
+        self.outbox_sink: OutboxSink | None = None
+        if self.settings.outbox.file_path is not None:
+            self.outbox_sink = FileSink(self.settings.outbox.file_path)
+        self._tasks: list[asyncio.Task[None]] = []
         self.app: fastapi.FastAPI = fastapi.FastAPI(
             title=self.settings.service_name,
             debug=self.settings.debug,
             lifespan=self.lifespan_manager,
         )
 
+        self.admission = AdmissionController.from_settings(self.settings)
+        self.loop_monitor = LoopMonitor.from_settings(self.settings)
+        self.app.dependency_overrides[get_settings] = self.get_settings
+        self.app.dependency_overrides[get_admission_controller] = self.get_admission_controller
+        self.app.dependency_overrides[get_balance_subscriptions] = self.get_balance_subscriptions
+        self.app.dependency_overrides[get_transaction_replays] = self.get_transaction_replays
+        self.app.dependency_overrides[get_report_runner] = self.get_report_runner
         self.app.dependency_overrides[get_db] = self.get_async_session_maker
         self.app.dependency_overrides[get_db_session] = self.get_db_session
+        self.app.dependency_overrides[get_request_session_maker] = self.get_request_session_maker
+        self.app.dependency_overrides[get_shard_sessions] = self.get_shard_sessions
+        self.app.dependency_overrides[get_shard_router] = self.get_shard_router
         self.app.middleware("http")(exception_handler)
-        include_routers(self.app)
+        self.app.add_exception_handler(DeadlineExceededError, deadline_exceeded_handler)
+        include_routers(self.app, self.settings)
+        self.app.state.ready = False
+
+    def get_settings(self) -> Settings:
+        return self.settings
+
+    def get_admission_controller(self) -> AdmissionController | None:
+        return self.admission
+
+    def get_balance_subscriptions(self) -> BalanceSubscriptions:
+        return self.balance_subscriptions
+
+    def get_transaction_replays(self) -> TransactionReplays:
+        return self.transaction_replays
+
+    def get_report_runner(self) -> ReportRunner:
+        return self.report_runner
 
     async def get_async_session_maker(self) -> async_sessionmaker[AsyncSessionType]:
         return self._session_maker
 
-    async def get_db_session(self) -> AsyncIterator[AsyncSessionType]:
-        async with self._session_maker() as session:
+    async def get_request_session_maker(self, request: fastapi.Request) -> async_sessionmaker[AsyncSessionType]:
+        shard = await get_request_shard(request, self.shard_router)
+        return self._session_makers[get_request_lane(request)][shard]
+
+    async def get_db_session(self, request: fastapi.Request) -> AsyncIterator[AsyncSessionType]:
+        async with (await self.get_request_session_maker(request))() as session:
             yield session
 
+    async def get_shard_sessions(self, request: fastapi.Request) -> AsyncIterator[dict[str, AsyncSessionType]]:
+        async with contextlib.AsyncExitStack() as stack:
+            yield {
+                shard: await stack.enter_async_context(session_maker())
+                for shard, session_maker in self._session_makers[get_request_lane(request)].items()
+            }
+
+    def get_shard_router(self) -> ShardRouter:
+        return self.shard_router
+
+    def create_session_makers(
+        self, pool_size: int, max_overflow: int
+    ) -> dict[str, async_sessionmaker[AsyncSessionType]]:
+        """Open a pool of the given size on every shard."""
+        session_makers = {}
+        for shard, dsn in self.settings.shard_dsns.items():
+            engine = create_async_engine(dsn, pool_size=pool_size, max_overflow=max_overflow)
+            if self.settings.deadlines.enabled:
+                enforce_statement_timeouts(engine, self.settings.deadlines.slack)
+            self._async_engines.append(engine)
+            session_makers[shard] = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+        return session_makers
+
     async def init_async_resources(self) -> None:
-        self._async_engine = create_async_engine(self.settings.db_dsn)
-        self._session_maker = async_sessionmaker(bind=self._async_engine, expire_on_commit=False, autoflush=False)
+        # After the server configured logging, before anything logs from the event loop.
+        self._log_listener = configure_logging(self.settings)
+        self._async_engines = []
+        self._session_makers = {}
+        for lane in Lane:
+            pool = getattr(self.settings.lanes, lane)
+            self._session_makers[lane] = self.create_session_makers(pool.pool_size, pool.max_overflow)
+        # Shard lookups and uid claims are single short statements.
+        self.shard_router = ShardRouter(
+            self._session_makers[Lane.READ],
+            self.settings.sharding.virtual_nodes,
+            rebalancing=self.settings.sharding.rebalancing,
+            uid_cache_size=self.settings.sharding.uid_cache_size,
+            uid_miss_ttl=self.settings.sharding.uid_miss_ttl,
+        )
+        self._session_maker = self._session_makers[Lane.WRITE][self.shard_router.default_shard]
+        self._tasks = [asyncio.create_task(listener.run()) for listener in self.balance_listeners]
+        if self.loop_monitor is not None:
+            self._tasks.append(asyncio.create_task(self.loop_monitor.run()))
+        sink = self.outbox_sink
+        if self.settings.outbox.dispatcher and sink is None:
+            logger.warning("OUTBOX__DISPATCHER is set without a sink, outbox events are not delivered")
+        elif self.settings.outbox.dispatcher and sink is not None:
+            # A dispatcher uses one connection at a time, its own so that it never waits behind requests.
+            self._tasks.extend(
+                asyncio.create_task(OutboxDispatcher.from_settings(session_maker, sink, self.settings).run())
+                for session_maker in self.create_session_makers(pool_size=1, max_overflow=0).values()
+            )
+        self.report_runner.start()
+        self._warmup_task = asyncio.create_task(self.warm_up())
+
+    async def wait_for_balance_listeners(self) -> None:
+        for listener in self.balance_listeners:
+            await listener.listening.wait()
+
+    async def warm_up(self) -> None:
+        started = time.perf_counter()
+        while True:
+            try:
+                await asyncio.gather(
+                    *(
+                        warm_up(
+                            session_maker,
+                            min(self.settings.warmup.connections, getattr(self.settings.lanes, lane).pool_size),
+                            self.settings.concurrency.strategy,
+                        )
+                        for lane, session_makers in self._session_makers.items()
+                        for session_maker in session_makers.values()
+                    )
+                )
+                for hook in self.warmup_hooks:
+                    await hook()
+            except Exception:
+                logger.exception("Warm-up failed, retrying in %s s", self.settings.warmup.retry_delay)
+                await asyncio.sleep(self.settings.warmup.retry_delay)
+            else:
+                break
+
+        WARMUP_SECONDS.set(time.perf_counter() - started)
+        self.app.state.ready = True
 
     async def tear_down(self) -> None:
-        await self._async_engine.dispose()
+        self.app.state.ready = False
+        for task in (self._warmup_task, *self._tasks):
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        await self.report_runner.close()
+        for engine in self._async_engines:
+            await engine.dispose()
+        stop_logging(self._log_listener)
+        self._log_listener = None
 
     @contextlib.asynccontextmanager
     async def lifespan_manager(self, _: fastapi.FastAPI) -> typing.AsyncIterator[dict[str, typing.Any]]:
@@ -0,0 +1,115 @@
+"""Historical balances of many users at many points in time, computed in bulk with NumPy.
+
+Answering ``users x points`` balances with ``TransactionRepository.get_total_sum`` takes one query per pair.
+Instead, the users' transactions are streamed once, ordered by user and time, into three ``int64`` columns:
+user, timestamp in microseconds and signed amount in minor units. Their running sum then answers every pair
+with ``searchsorted``. Users are processed ``chunk_size`` at a time, so memory is bounded by the transactions
+of one chunk.
+
+Compacted months come from ``transactions_archive``, or as one transaction at the end of the month when they
+were compacted without archive, which is exactly when ``get_total_sum`` starts counting them.
+"""
+
+import typing
+from collections.abc import AsyncIterator, Sequence
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import BigInteger, ColumnElement, Select, SQLColumnExpression, cast, extract, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.database.expressions import period_end, signed_amount
+from app.database.models import TransactionAggregateDb, TransactionArchiveDb, TransactionDb, UserDb
+from app.utils import timezone_validator
+
+
+Int64Array: typing.TypeAlias = npt.NDArray[np.int64]
+
+_EPOCH: typing.Final = datetime(1970, 1, 1, tzinfo=UTC)
+_MICROSECOND: typing.Final = timedelta(microseconds=1)
+
+
+def to_micros(values: Sequence[datetime]) -> Int64Array:
+    return np.array([(timezone_validator(value) - _EPOCH) // _MICROSECOND for value in values], dtype=np.int64)
+
+
+def balances_at(users: Int64Array, micros: Int64Array, amounts: Int64Array, at: Int64Array) -> Int64Array:
+    """Return the balance of every user ``0..n-1`` at every time of ``at``, an ``(n, len(at))`` array.
+
+    ``users``, ``micros`` and ``amounts`` are the transactions' columns, ordered by user and then time; a
+    balance at a time includes the transactions made at that very time.
+    """
+    count = int(users[-1]) + 1 if len(users) else 0
+    # Timestamps are replaced by their rank among the distinct ones, so a (user, rank) pair fits one int64 key
+    # that increases along the transactions.
+    distinct = np.unique(micros)
+    span = len(distinct) + 1
+    keys = users * span + np.searchsorted(distinct, micros)
+    sums = np.concatenate(([0], np.cumsum(amounts, dtype=np.int64)))
+
+    codes = np.arange(count, dtype=np.int64)
+    firsts = np.searchsorted(keys, codes * span)
+    # A key below ``user * span + ranks`` belongs to an earlier user or to one of the user's transactions
+    # made at or before the point.
+    ranks = np.searchsorted(distinct, at, side="right")
+    ends = np.searchsorted(keys, codes[:, np.newaxis] * span + ranks[np.newaxis, :])
+    return sums[ends] - sums[firsts][:, np.newaxis]
+
+
+def _micros(created_at: SQLColumnExpression[datetime]) -> ColumnElement[int]:
+    return cast(extract("epoch", created_at) * 1_000_000, BigInteger)
+
+
+def _transactions(user_ids: Sequence[str]) -> Select[tuple[str, int, int]]:
+    rows = union_all(
+        *(
+            select(
+                table.user_id,
+                _micros(table.created_at).label("micros"),
+                cast(signed_amount(table), BigInteger).label("amount"),
+            ).where(table.user_id.in_(user_ids))
+            for table in (TransactionDb, TransactionArchiveDb)
+        ),
+        select(
+            TransactionAggregateDb.user_id,
+            _micros(period_end(TransactionAggregateDb.period_start)),
+            cast(TransactionAggregateDb.total, BigInteger),
+        ).where(TransactionAggregateDb.user_id.in_(user_ids), ~TransactionAggregateDb.archived),
+    ).subquery()
+    return select(rows).order_by(rows.c.user_id, rows.c.micros)
+
+
+async def stream_user_ids(db_session: AsyncSessionType, batch_size: int = 10_000) -> AsyncIterator[str]:
+    query = select(UserDb.id).order_by(UserDb.id).execution_options(yield_per=batch_size)
+    async for user_id in await db_session.stream_scalars(query):
+        yield user_id
+
+
+async def chunk_balances(
+    db_session: AsyncSessionType, user_ids: Sequence[str], at: Int64Array, batch_size: int = 10_000
+) -> Int64Array:
+    """Return the balances of ``user_ids`` at the times ``at``, in minor units, one row per user."""
+    # Users are numbered in the order their transactions arrive, which keeps the columns ordered by user
+    # whatever the database's collation. Users without transactions come last.
+    codes: dict[str, int] = {}
+    users, micros, amounts = [], [], []
+    result = await db_session.stream(_transactions(user_ids).execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        columns = tuple(zip(*partition, strict=True))
+        users.append(np.fromiter((codes.setdefault(user_id, len(codes)) for user_id in columns[0]), np.int64))
+        micros.append(np.array(columns[1], dtype=np.int64))
+        amounts.append(np.array(columns[2], dtype=np.int64))
+
+    empty = np.empty(0, dtype=np.int64)
+    balances = balances_at(
+        np.concatenate(users) if users else empty,
+        np.concatenate(micros) if micros else empty,
+        np.concatenate(amounts) if amounts else empty,
+        at,
+    )
+    for user_id in user_ids:
+        codes.setdefault(user_id, len(codes))
+    rows = np.zeros((len(codes), len(at)), dtype=np.int64)
+    rows[: len(balances)] = balances
+    return rows[[codes[user_id] for user_id in user_ids]]
@@ -0,0 +1,90 @@
+import asyncio
+import enum
+import logging
+import random
+import typing
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.exceptions import ConcurrentUpdateError
+from app.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+# serialization_failure and deadlock_detected: the transaction did nothing and can simply run again.
+RETRYABLE_SQLSTATES: typing.Final = frozenset({"40001", "40P01"})
+# unique_violation: a concurrent transaction inserted the same key and committed first.
+UNIQUE_VIOLATION: typing.Final = "23505"
+
+TRANSACTION_RETRIES: typing.Final = Counter(
+    "db_transaction_retries_total", "Database transactions re-run after a concurrency conflict."
+)
+TRANSACTION_CONFLICTS: typing.Final = Counter(
+    "db_transaction_conflicts_total", "Database transactions that hit a concurrency conflict, retried or not."
+)
+
+
+class ConcurrencyStrategy(enum.StrEnum):
+    PESSIMISTIC = "pessimistic"  # lock the user row with SELECT ... FOR UPDATE
+    OPTIMISTIC = "optimistic"  # compare-and-set on users.version
+    SERIALIZABLE = "serializable"  # SERIALIZABLE isolation, retry on serialization failures
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ConcurrentUpdateError):
+        return True
+    return isinstance(error, DBAPIError) and getattr(error.orig, "sqlstate", None) in RETRYABLE_SQLSTATES
+
+
+def is_unique_violation(error: Exception) -> bool:
+    return isinstance(error, IntegrityError) and getattr(error.orig, "sqlstate", None) == UNIQUE_VIOLATION
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff: a random delay up to ``base_delay * 2 ** attempt``."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))  # noqa: S311
+
+
+async def run_in_transaction(  # noqa: PLR0913
+    db_session: AsyncSessionType,
+    work: Callable[[], Awaitable[T]],
+    strategy: ConcurrencyStrategy,
+    *,
+    max_attempts: int = 5,
+    base_delay: float = 0.005,
+    max_delay: float = 0.1,
+) -> T:
+    """Run ``work`` and commit, re-running both after a concurrency conflict.
+
+    ``work`` must only touch the database through ``db_session``: a failed attempt is rolled back
+    completely before the next one starts. Business errors raised by ``work`` are not retried.
+    """
+    attempt = 0
+    while True:
+        try:
+            if strategy == ConcurrencyStrategy.SERIALIZABLE:
+                await db_session.connection(execution_options={"isolation_level": "SERIALIZABLE"})
+            result = await work()
+            await db_session.commit()
+        except Exception as e:
+            await db_session.rollback()
+            if not is_retryable(e):
+                raise
+
+            TRANSACTION_CONFLICTS.inc(strategy=strategy)
+            attempt += 1
+            if attempt >= max_attempts:
+                logger.warning("Giving up after %s conflicting attempts", attempt)
+                if isinstance(e, ConcurrentUpdateError):
+                    raise
+                raise ConcurrentUpdateError from e
+
+            TRANSACTION_RETRIES.inc(strategy=strategy)
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+        else:
+            return result
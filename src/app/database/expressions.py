@@ -0,0 +1,17 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import ColumnElement, SQLColumnExpression, case, func, text
+
+from app.database.models import TransactionArchiveDb, TransactionDb
+from app.types import TransactionType
+
+
+def signed_amount(table: type[TransactionDb] | type[TransactionArchiveDb]) -> ColumnElement[Decimal]:
+    """Sign the transaction amount: withdrawals count as negative."""
+    return case((table.type == TransactionType.WITHDRAW, -table.amount), else_=table.amount)
+
+
+def period_end(period_start: SQLColumnExpression[datetime]) -> ColumnElement[datetime]:
+    """Return the UTC start of the month after ``period_start``: compacted months count from there."""
+    return func.timezone("UTC", func.timezone("UTC", period_start) + text("interval '1 month'"))
@@ -0,0 +1,306 @@
+"""In-memory users and transactions behind the ``UserRepository`` and ``TransactionRepository`` interfaces.
+
+For tests, local benchmarks and serving historical balances without Postgres. Changes apply at once and
+cannot be rolled back. Each user's transactions are kept as time-ordered blocks of two ``array('q')`` columns,
+timestamps and running sums, with a Fenwick tree over the block totals. That is 16 bytes per transaction,
+plus the uid index when it is kept. ``get_total_sum`` then takes ``O(log n)``, and so does adding a
+transaction in time order. A backdated one also moves the tail of its block, which holds at most
+``2 * BLOCK_SIZE`` transactions.
+"""
+
+import bisect
+import heapq
+import sys
+import typing
+from array import array
+from collections.abc import Mapping, Sequence
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.database.expressions import period_end, signed_amount
+from app.database.models import TransactionAggregateDb, TransactionArchiveDb, TransactionDb, UserDb
+from app.exceptions import AmountExceedsBalanceError, TransactionProcessedError, UserNotFoundError
+from app.schemas import TransactionAdd, UserCreate
+from app.types import TransactionType
+from app.utils import from_minor_units, timezone_validator, to_minor_units
+
+
+BLOCK_SIZE: typing.Final = 512
+
+_EPOCH: typing.Final = datetime(1970, 1, 1, tzinfo=UTC)
+_MICROSECOND: typing.Final = timedelta(microseconds=1)
+
+
+def _to_micros(value: datetime) -> int:
+    return (timezone_validator(value) - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH + value * _MICROSECOND
+
+
+class FenwickTree:
+    """Prefix sums of a growing sequence of integers: updates, appends and prefix queries in ``O(log n)``."""
+
+    __slots__ = ("_tree",)
+
+    def __init__(self, values: Sequence[int] = ()):
+        # 1-indexed, node ``i`` holds the sum of the ``i & -i`` values ending at ``i``.
+        self._tree = array("q", [0, *values])
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self) -> int:
+        return len(self._tree) - 1
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def append(self, value: int) -> None:
+        i = len(self._tree)
+        self._tree.append(value + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+
+    def prefix(self, count: int) -> int:
+        """Sum of the first ``count`` values."""
+        total = 0
+        i = count
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class BalanceHistory:
+    """One user's transactions as time-ordered ``(microseconds, minor units)`` pairs with prefix sums."""
+
+    __slots__ = ("_block_ends", "_blocks_sums", "_blocks_times", "_totals")
+
+    def __init__(self) -> None:
+        self._blocks_times: list[array[int]] = []
+        # Running sums within each block, an amount is the difference to its predecessor.
+        self._blocks_sums: list[array[int]] = []
+        self._block_ends: list[int] = []
+        self._totals = FenwickTree()
+
+    def __len__(self) -> int:
+        return sum(len(times) for times in self._blocks_times)
+
+    def add(self, micros: int, amount: int) -> None:
+        block = bisect.bisect_right(self._block_ends, micros)
+        if block == len(self._blocks_times):
+            if not self._blocks_times or len(self._blocks_times[-1]) >= BLOCK_SIZE:
+                self._blocks_times.append(array("q", [micros]))
+                self._blocks_sums.append(array("q", [amount]))
+                self._block_ends.append(micros)
+                self._totals.append(amount)
+                return
+            block -= 1
+
+        times, sums = self._blocks_times[block], self._blocks_sums[block]
+        position = bisect.bisect_right(times, micros)
+        times.insert(position, micros)
+        sums.insert(position, (sums[position - 1] if position else 0) + amount)
+        for i in range(position + 1, len(sums)):
+            sums[i] += amount
+        self._block_ends[block] = times[-1]
+        self._totals.add(block, amount)
+        if len(times) > 2 * BLOCK_SIZE:
+            self._split(block)
+
+    def _split(self, block: int) -> None:
+        times, sums = self._blocks_times[block], self._blocks_sums[block]
+        middle = len(times) // 2
+        head = sums[middle - 1]
+        self._blocks_times[block : block + 1] = [times[:middle], times[middle:]]
+        self._blocks_sums[block : block + 1] = [sums[:middle], array("q", (total - head for total in sums[middle:]))]
+        self._block_ends[block : block + 1] = [times[middle - 1], times[-1]]
+        # Splits are rare, a block in the middle of the tree shifts every later index anyway.
+        self._totals = FenwickTree([block_sums[-1] for block_sums in self._blocks_sums])
+
+    def sum_until(self, micros: int) -> int:
+        """Sum of the amounts at or before ``micros``."""
+        block = bisect.bisect_right(self._block_ends, micros)
+        total = self._totals.prefix(block)
+        if block < len(self._blocks_times):
+            position = bisect.bisect_right(self._blocks_times[block], micros)
+            if position:
+                total += self._blocks_sums[block][position - 1]
+        return total
+
+    def total(self) -> int:
+        return self._totals.prefix(len(self._totals))
+
+
+class MemoryLedger:
+    """Users and transactions shared by the in-memory repositories.
+
+    ``keep_uids=False`` drops the uid index, the biggest part of a transaction's footprint. The ledger then
+    only serves balances: ``MemoryTransactionRepository.get`` finds nothing and duplicates are not detected.
+    """
+
+    def __init__(self, keep_uids: bool = True):
+        self.keep_uids = keep_uids
+        # ``id -> [name, balance in minor units, version]``
+        self.users: dict[str, list[typing.Any]] = {}
+        self.histories: dict[str, BalanceHistory] = {}
+        # ``uid -> (user_id, microseconds, signed minor units)``
+        self.transactions: dict[str, tuple[str, int, int]] = {}
+
+    def add_transaction(self, uid: str | None, user_id: str, micros: int, amount: int) -> None:
+        # Every transaction of a user shares one copy of the id.
+        user_id = sys.intern(user_id)
+        history = self.histories.get(user_id)
+        if history is None:
+            history = self.histories[user_id] = BalanceHistory()
+        history.add(micros, amount)
+        if uid is not None and self.keep_uids:
+            self.transactions[uid] = (user_id, micros, amount)
+
+    async def load(self, db_session: AsyncSessionType, batch_size: int = 10_000) -> None:
+        """Load every user and transaction from Postgres, streaming ``batch_size`` rows at a time.
+
+        Compacted months come from ``transactions_archive``, or as one transaction at the end of the month
+        when they were compacted without archive, which is when ``get_total_sum`` starts counting them. Such a
+        month is then also counted after an ``after`` within it, where ``get_total_sum`` leaves it out.
+        """
+        users = await db_session.stream(
+            select(UserDb.id, UserDb.name, UserDb.balance, UserDb.version).execution_options(yield_per=batch_size)
+        )
+        async for user_id, name, balance, version in users:
+            self.users[user_id] = [name, to_minor_units(balance), version]
+
+        rows = union_all(
+            *(
+                select(table.uid, table.user_id, table.created_at, signed_amount(table).label("amount"))
+                for table in (TransactionDb, TransactionArchiveDb)
+            ),
+            select(
+                null(),
+                TransactionAggregateDb.user_id,
+                period_end(TransactionAggregateDb.period_start),
+                TransactionAggregateDb.total,
+            ).where(~TransactionAggregateDb.archived),
+        ).subquery()
+        # Ordered by time within each user, so every transaction takes the append path.
+        query = select(rows).order_by(rows.c.user_id, rows.c.created_at).execution_options(yield_per=batch_size)
+        async for uid, user_id, created_at, amount in await db_session.stream(query):
+            self.add_transaction(uid, user_id, _to_micros(created_at), to_minor_units(amount))
+
+
+class MemoryUserRepository:
+    """``UserRepository`` over a ``MemoryLedger``, returning detached ``UserDb`` rows."""
+
+    def __init__(self, ledger: MemoryLedger):
+        self.ledger = ledger
+
+    def _row(self, user_id: str) -> UserDb | None:
+        user = self.ledger.users.get(user_id)
+        if user is None:
+            return None
+        name, balance, version = user
+        return UserDb(id=user_id, name=name, balance=from_minor_units(balance), version=version)
+
+    async def create(self, data: UserCreate) -> UserDb | None:
+        if data.id in self.ledger.users:
+            return None
+        self.ledger.users[data.id] = [data.name, 0, 0]
+        return self._row(data.id)
+
+    async def create_many(self, users: Sequence[UserCreate]) -> set[str]:
+        return {user.id for user in users if await self.create(user) is not None}
+
+    async def get(self, user_id: str) -> UserDb | None:
+        return self._row(user_id)
+
+    async def exists(self, user_id: str) -> bool:
+        return user_id in self.ledger.users
+
+    async def get_top_by_balance(self, limit: int) -> Sequence[UserDb]:
+        top = heapq.nlargest(limit, self.ledger.users.items(), key=lambda item: item[1][1])
+        return [typing.cast(UserDb, self._row(user_id)) for user_id, _ in top]
+
+    async def update_balance(self, user_id: str, amount: Decimal) -> None:
+        user = self.ledger.users.get(user_id)
+        if user is None:
+            raise UserNotFoundError
+
+        balance = user[1] + to_minor_units(amount)
+        if balance < 0:
+            raise AmountExceedsBalanceError
+        user[1] = balance
+        user[2] += 1
+
+    async def update_balances(self, amounts: Mapping[str, Decimal]) -> None:
+        balances = []
+        for user_id, amount in amounts.items():
+            user = self.ledger.users.get(user_id)
+            if user is None:
+                raise UserNotFoundError
+            balances.append(user[1] + to_minor_units(amount))
+        if any(balance < 0 for balance in balances):
+            raise AmountExceedsBalanceError
+        for user_id, amount in amounts.items():
+            await self.update_balance(user_id, amount)
+
+
+class MemoryTransactionRepository:
+    """``TransactionRepository`` over a ``MemoryLedger``, returning detached ``TransactionDb`` rows."""
+
+    def __init__(self, ledger: MemoryLedger):
+        self.ledger = ledger
+
+    async def add(self, data: TransactionAdd) -> TransactionDb:
+        if data.user_id not in self.ledger.users:
+            raise UserNotFoundError
+        if data.uid in self.ledger.transactions:
+            raise TransactionProcessedError
+
+        amount = to_minor_units(data.amount)
+        signed = -amount if data.type == TransactionType.WITHDRAW else amount
+        self.ledger.add_transaction(data.uid, data.user_id, _to_micros(data.created_at), signed)
+        return TransactionDb(**data.model_dump())
+
+    async def add_many(self, transactions: Sequence[TransactionAdd]) -> None:
+        # Checked up front, so that none of the transactions is added if one cannot be.
+        if any(transaction.user_id not in self.ledger.users for transaction in transactions):
+            raise UserNotFoundError
+        if any(transaction.uid in self.ledger.transactions for transaction in transactions):
+            raise TransactionProcessedError
+        for transaction in transactions:
+            await self.add(transaction)
+
+    async def get(self, uid: str) -> TransactionDb | None:
+        transaction = self.ledger.transactions.get(uid)
+        if transaction is None:
+            return None
+        user_id, micros, amount = transaction
+        return TransactionDb(
+            uid=uid,
+            user_id=user_id,
+            amount=from_minor_units(abs(amount)),
+            type=TransactionType.WITHDRAW if amount < 0 else TransactionType.DEPOSIT,
+            created_at=_from_micros(micros),
+        )
+
+    async def exists(self, uid: str) -> bool:
+        return uid in self.ledger.transactions
+
+    async def get_total_sum(
+        self, user_id: str, after: datetime | None = None, before: datetime | None = None
+    ) -> Decimal:
+        history = self.ledger.histories.get(user_id)
+        if history is None:
+            return Decimal(0)
+
+        total = history.total() if before is None else history.sum_until(_to_micros(before))
+        if after is not None:
+            total -= history.sum_until(_to_micros(after) - 1)
+        return from_minor_units(total)
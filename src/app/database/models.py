@@ -1,13 +1,15 @@
 import logging
 import typing
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 
 import sqlalchemy as sa
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column, relationship
 
 from app.types import TransactionType
-from .utils import utcnow
+from .partitions import create_initial_partitions
+from .utils import Money, utcnow
 
 
 logger = logging.getLogger(__name__)
@@ -26,12 +28,17 @@ class UserDb(Base):
     id: Mapped[str] = mapped_column(sa.String(36), primary_key=True)
     name: Mapped[str] = mapped_column(sa.String(255), nullable=False)
     balance: Mapped[Decimal] = mapped_column(
-        sa.DECIMAL(10, 2),
+        Money,
         nullable=False,
         default=Decimal(0),
     )
+    # Bumped on every balance update, compared by ``ConcurrencyStrategy.OPTIMISTIC``.
+    version: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0, server_default="0")
 
-    __table_args__ = (sa.CheckConstraint("balance >= 0", name="balance_check"),)
+    __table_args__ = (
+        sa.CheckConstraint("balance >= 0", name="balance_check"),
+        sa.Index("ix_users_balance", "balance"),
+    )
 
     transactions: Mapped["TransactionDb"] = relationship(back_populates="user")
 
@@ -42,8 +49,116 @@ class TransactionDb(Base):
     uid: Mapped[str] = mapped_column(sa.String(36), primary_key=True)
     user_id: Mapped[str] = mapped_column(sa.String(36), sa.ForeignKey(UserDb.id), nullable=False)
     type: Mapped[TransactionType] = mapped_column(sa.Enum(TransactionType), nullable=False)
-    amount: Mapped[Decimal] = mapped_column(sa.DECIMAL(10, 2), sa.CheckConstraint("amount >= 0"), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), nullable=False)
+    amount: Mapped[Decimal] = mapped_column(Money, sa.CheckConstraint("amount >= 0"), nullable=False)
+    # Part of the table's primary key because Postgres requires the partition key in it.
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), primary_key=True)
     processed_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), default=utcnow())
 
+    __table_args__ = (
+        sa.Index("ix_transactions_user_id_created_at", "user_id", "created_at"),
+        # Finds the users touched since the last balance reconciliation.
+        sa.Index("ix_transactions_processed_at", "processed_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # Transactions are still identified by ``uid`` alone, e.g. for ``session.get(TransactionDb, uid)``.
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, typing.Any]:  # noqa: N805
+        return {"primary_key": [cls.__table__.c.uid]}
+
     user: Mapped["UserDb"] = relationship(back_populates="transactions")
+
+
+# Every uid ever given to a transaction of the user, archived or compacted ones included. ``transactions``
+# can only be unique on ``(uid, created_at)``, since Postgres requires the partition key in its primary key.
+class TransactionUidDb(Base):
+    __tablename__ = "transaction_uids"
+
+    uid: Mapped[str] = mapped_column(sa.String(36), primary_key=True)
+    user_id: Mapped[str] = mapped_column(sa.String(36), sa.ForeignKey(UserDb.id), nullable=False)
+
+    __table_args__ = (sa.Index("ix_transaction_uids_user_id", "user_id"),)
+
+
+# The user of every transaction uid on any shard, kept on the first one, see ``ShardRouter``. Users live on
+# other shards too, so ``user_id`` has no foreign key.
+class TransactionOwnerDb(Base):
+    __tablename__ = "transaction_owners"
+
+    uid: Mapped[str] = mapped_column(sa.String(36), primary_key=True)
+    user_id: Mapped[str] = mapped_column(sa.String(36), nullable=False)
+
+
+# Raw transactions moved out of ``transactions`` by ``TransactionRepository.compact``.
+class TransactionArchiveDb(Base):
+    __tablename__ = "transactions_archive"
+
+    uid: Mapped[str] = mapped_column(sa.String(36), primary_key=True)
+    user_id: Mapped[str] = mapped_column(sa.String(36), sa.ForeignKey(UserDb.id), nullable=False)
+    type: Mapped[TransactionType] = mapped_column(sa.Enum(TransactionType), nullable=False)
+    amount: Mapped[Decimal] = mapped_column(Money, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), nullable=False)
+    processed_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (sa.Index("ix_transactions_archive_user_id_created_at", "user_id", "created_at"),)
+
+
+# Signed total of one user's compacted transactions for one month.
+class TransactionAggregateDb(Base):
+    __tablename__ = "transaction_aggregates"
+
+    user_id: Mapped[str] = mapped_column(sa.String(36), sa.ForeignKey(UserDb.id), primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), primary_key=True)
+    total: Mapped[Decimal] = mapped_column(Money, nullable=False)
+    transactions_count: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    # Whether every row behind ``total`` is still available in ``transactions_archive``.
+    archived: Mapped[bool] = mapped_column(sa.Boolean, nullable=False)
+
+
+# Ledger-wide totals maintained by every transaction, split into stripes so concurrent
+# transactions update different rows. A total is the sum over its stripes.
+class LedgerTotalDb(Base):
+    __tablename__ = "ledger_totals"
+
+    stripe: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    liabilities: Mapped[Decimal] = mapped_column(Money, nullable=False)
+
+
+class DailyVolumeDb(Base):
+    __tablename__ = "daily_volumes"
+
+    # UTC date of the transactions' ``created_at``.
+    day: Mapped[date] = mapped_column(sa.Date, primary_key=True)
+    type: Mapped[TransactionType] = mapped_column(sa.Enum(TransactionType), primary_key=True)
+    stripe: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    amount: Mapped[Decimal] = mapped_column(Money, nullable=False)
+    transactions_count: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+
+
+# Events written in the same database transaction as the change they describe, see ``app.services.outbox``.
+class OutboxDb(Base):
+    __tablename__ = "outbox"
+
+    # Per user, ids follow commit order: events are written after the user's row is locked.
+    id: Mapped[int] = mapped_column(sa.BigInteger, sa.Identity(), primary_key=True)
+    user_id: Mapped[str] = mapped_column(sa.String(36), nullable=False)
+    event_type: Mapped[str] = mapped_column(sa.String(64), nullable=False)
+    payload: Mapped[dict[str, typing.Any]] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), nullable=False, default=sa.func.now())
+
+    __table_args__ = (sa.Index("ix_outbox_user_id_id", "user_id", "id"),)
+
+
+# How far incremental jobs have got, e.g. the ``processed_at`` up to which balances were reconciled.
+class JobWatermarkDb(Base):
+    __tablename__ = "job_watermarks"
+
+    job: Mapped[str] = mapped_column(sa.String(64), primary_key=True)
+    watermark: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), nullable=False)
+
+
+@sa.event.listens_for(sa.Table, "after_create")
+def create_transaction_partitions(target: sa.Table, connection: sa.Connection, **_: object) -> None:
+    # Listens on every table, not just ``TransactionDb.__table__``, so tables created by Alembic get partitions too.
+    if target.name == TransactionDb.__tablename__:
+        create_initial_partitions(target, connection)
@@ -0,0 +1,199 @@
+import re
+import typing
+from datetime import UTC, datetime
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+DEFAULT_PARTITION_SUFFIX: typing.Final = "default"
+INITIAL_MONTHS_BEHIND: typing.Final = 1
+INITIAL_MONTHS_AHEAD: typing.Final = 3
+
+_PARTITION_NAME_RE: typing.Final = re.compile(rf"_(y(?P<year>\d{{4}})m(?P<month>\d{{2}})|{DEFAULT_PARTITION_SUFFIX})$")
+
+
+def month_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(UTC) if ts.tzinfo is not None else ts.replace(tzinfo=UTC)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def iter_months(start: datetime, end: datetime) -> typing.Iterator[datetime]:
+    """Yield month starts from the month of ``start`` up to and including the month of ``end``."""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_y{month:%Y}m{month:%m}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_{DEFAULT_PARTITION_SUFFIX}"
+
+
+def partition_month(table: str, name: str) -> datetime | None:
+    """Return the month a partition of ``table`` covers, ``None`` for the default partition or foreign names."""
+    if not name.startswith(table):
+        return None
+    match = _PARTITION_NAME_RE.fullmatch(name, len(table))
+    if match is None or match["year"] is None:
+        return None
+    return datetime(int(match["year"]), int(match["month"]), 1, tzinfo=UTC)
+
+
+def is_partition_name(table: str, name: str) -> bool:
+    return name.startswith(table) and _PARTITION_NAME_RE.fullmatch(name, len(table)) is not None
+
+
+def _create_partition_sql(table: str, month: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def _create_default_partition_sql(table: str) -> str:
+    return f"CREATE TABLE IF NOT EXISTS {default_partition_name(table)} PARTITION OF {table} DEFAULT"
+
+
+def create_initial_partitions(target: sa.Table, connection: Connection) -> None:
+    """Give a freshly created partitioned table a default and a few monthly partitions."""
+    current = month_start(datetime.now(tz=UTC))
+    connection.execute(sa.text(_create_default_partition_sql(target.name)))
+    for month in iter_months(add_months(current, -INITIAL_MONTHS_BEHIND), add_months(current, INITIAL_MONTHS_AHEAD)):
+        connection.execute(sa.text(_create_partition_sql(target.name, month)))
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> list[str]:
+    result = await conn.execute(
+        sa.text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return list(result.scalars())
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    result = await conn.execute(
+        sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": table},
+    )
+    return result.scalar_one_or_none() == "p"
+
+
+async def ensure_default_partition(conn: AsyncConnection, table: str) -> None:
+    await conn.execute(sa.text(_create_default_partition_sql(table)))
+
+
+async def ensure_partitions(conn: AsyncConnection, table: str, start: datetime, end: datetime) -> list[str]:
+    """Create the monthly partitions covering ``start``..``end``, returning the names of the new ones.
+
+    Rows that already landed in the default partition for a month are moved into the new partition,
+    so the default partition only ever holds data that is waiting for this maintenance step.
+    """
+    # Table and partition names come from the models and this module, never from user input.
+    existing = set(await list_partitions(conn, table))
+    default = default_partition_name(table)
+    created = []
+    for month in iter_months(start, end):
+        name = partition_name(table, month)
+        if name in existing:
+            continue
+
+        lower, upper = month, add_months(month, 1)
+        has_rows = (
+            default in existing
+            and (
+                await conn.execute(
+                    sa.text(
+                        f"SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= :lower AND created_at < :upper)"  # noqa: S608
+                    ),
+                    {"lower": lower, "upper": upper},
+                )
+            ).scalar_one()
+        )
+
+        if not has_rows:
+            await conn.execute(sa.text(_create_partition_sql(table, month)))
+        else:
+            await conn.execute(sa.text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            await conn.execute(
+                sa.text(
+                    f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :lower AND created_at < :upper "  # noqa: S608
+                    f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+                ),
+                {"lower": lower, "upper": upper},
+            )
+            await conn.execute(
+                sa.text(
+                    f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+                )
+            )
+        created.append(name)
+
+    return created
+
+
+async def ensure_default_partition_drained(conn: AsyncConnection, table: str) -> list[str]:
+    """Give every month that still has rows in the default partition its own partition."""
+    query = f"SELECT min(created_at), max(created_at) FROM {default_partition_name(table)}"  # noqa: S608
+    bounds = (await conn.execute(sa.text(query))).one()
+    if bounds[0] is None:
+        return []
+    return await ensure_partitions(conn, table, bounds[0], bounds[1])
+
+
+async def create_brin_indexes(conn: AsyncConnection, table: str, older_than: datetime) -> list[str]:
+    """Add a BRIN index on ``created_at`` to every partition whose range ends before ``older_than``.
+
+    Old partitions are append-only and physically ordered by time, so a BRIN index is a few pages
+    and lets bounded historical queries skip most of the partition.
+    """
+    created = []
+    for name in await list_partitions(conn, table):
+        month = partition_month(table, name)
+        if month is None or add_months(month, 1) > older_than:
+            continue
+        index_name = f"{name}_created_at_brin"
+        exists = (await conn.execute(sa.text("SELECT to_regclass(:name)"), {"name": index_name})).scalar_one()
+        if exists is None:
+            await conn.execute(sa.text(f"CREATE INDEX {index_name} ON {name} USING brin (created_at)"))
+            created.append(index_name)
+    return created
+
+
+async def convert_to_partitioned(conn: AsyncConnection, table: sa.Table) -> bool:
+    """Rebuild an existing plain ``table`` as its partitioned definition, keeping all rows.
+
+    Runs inside the caller's transaction, so the conversion is atomic. Returns ``False`` when
+    the table is already partitioned.
+    """
+    if await is_partitioned(conn, table.name):
+        return False
+
+    legacy = f"{table.name}_unpartitioned"
+    await conn.execute(sa.text(f"ALTER TABLE {table.name} RENAME TO {legacy}"))
+    await conn.execute(sa.text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table.name}_pkey TO {legacy}_pkey"))
+    for index in table.indexes:
+        await conn.execute(sa.text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {legacy}_{index.name}"))
+
+    await conn.run_sync(table.create, checkfirst=True)
+
+    columns = ", ".join(column.name for column in table.columns)
+    await conn.execute(sa.text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {legacy}"))  # noqa: S608
+    await ensure_default_partition_drained(conn, table.name)
+    await conn.execute(sa.text(f"DROP TABLE {legacy}"))
+
+    return True
@@ -1,10 +1,16 @@
 from .base_repository import BaseRepository
+from .ledger_repository import LedgerRepository
+from .outbox_repository import OutboxRepository
+from .reconciliation_repository import ReconciliationRepository
 from .transaction_repository import TransactionRepository
 from .user_repository import UserRepository
 
 
 __all__ = [
     "BaseRepository",
+    "LedgerRepository",
+    "OutboxRepository",
+    "ReconciliationRepository",
     "UserRepository",
     "TransactionRepository",
 ]
@@ -0,0 +1,114 @@
+import random
+from collections.abc import Sequence
+from datetime import UTC, date, datetime
+from decimal import Decimal
+
+from sqlalchemy import Row, delete, func, literal, select, text, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.sql.dml import ReturningInsert
+
+from app.database.models import DailyVolumeDb, LedgerTotalDb, TransactionArchiveDb, TransactionDb, UserDb
+from app.types import TransactionType
+from .base_repository import BaseRepository
+
+
+class LedgerRepository(BaseRepository):
+    def __init__(self, db_session: AsyncSessionType, stripes: int = 16):
+        super().__init__(db_session)
+        self.stripes = stripes
+
+    async def record(self, type_: TransactionType, amount: Decimal, created_at: datetime) -> None:
+        """Add a transaction to the ledger totals, in one statement on one randomly chosen stripe."""
+        stripe = random.randrange(self.stripes)  # noqa: S311
+        totals = self._add_liabilities(stripe, -amount if type_ == TransactionType.WITHDRAW else amount)
+
+        volumes = pg_insert(DailyVolumeDb).values(
+            day=created_at.astimezone(UTC).date(), type=type_, stripe=stripe, amount=amount, transactions_count=1
+        )
+        volumes = volumes.on_conflict_do_update(
+            index_elements=[DailyVolumeDb.day, DailyVolumeDb.type, DailyVolumeDb.stripe],
+            set_={
+                "amount": DailyVolumeDb.amount + volumes.excluded.amount,
+                "transactions_count": DailyVolumeDb.transactions_count + volumes.excluded.transactions_count,
+            },
+        )
+
+        # Postgres runs every data-modifying CTE exactly once, whether or not the outer query reads it.
+        totals_cte = totals.cte("totals")
+        await self.db_session.execute(select(func.count()).select_from(totals_cte).add_cte(volumes.cte("volumes")))
+
+    async def record_transfer(self, amount: Decimal, created_at: datetime) -> None:
+        """Add a transfer's two legs to the daily volumes, the liabilities do not change."""
+        stripe = random.randrange(self.stripes)  # noqa: S311
+        day = created_at.astimezone(UTC).date()
+        volumes = pg_insert(DailyVolumeDb).values(
+            [
+                {"day": day, "type": type_, "stripe": stripe, "amount": amount, "transactions_count": 1}
+                for type_ in (TransactionType.WITHDRAW, TransactionType.DEPOSIT)
+            ]
+        )
+        volumes = volumes.on_conflict_do_update(
+            index_elements=[DailyVolumeDb.day, DailyVolumeDb.type, DailyVolumeDb.stripe],
+            set_={
+                "amount": DailyVolumeDb.amount + volumes.excluded.amount,
+                "transactions_count": DailyVolumeDb.transactions_count + volumes.excluded.transactions_count,
+            },
+        )
+        await self.db_session.execute(volumes)
+
+    async def adjust_liabilities(self, amount: Decimal) -> None:
+        """Add ``amount`` to the liabilities alone, for balances changed without a transaction."""
+        await self.db_session.execute(self._add_liabilities(random.randrange(self.stripes), amount))  # noqa: S311
+
+    @staticmethod
+    def _add_liabilities(stripe: int, amount: Decimal) -> ReturningInsert[tuple[int]]:
+        totals = pg_insert(LedgerTotalDb).values(stripe=stripe, liabilities=amount)
+        return totals.on_conflict_do_update(
+            index_elements=[LedgerTotalDb.stripe],
+            set_={"liabilities": LedgerTotalDb.liabilities + totals.excluded.liabilities},
+        ).returning(LedgerTotalDb.stripe)
+
+    async def get_liabilities(self) -> Decimal:
+        total = (await self.db_session.execute(select(func.sum(LedgerTotalDb.liabilities)))).scalar_one()
+        return total if total is not None else Decimal(0)
+
+    async def get_daily_volumes(self, day: date) -> Sequence[Row[tuple[TransactionType, Decimal, int]]]:
+        query = (
+            select(
+                DailyVolumeDb.type,
+                func.sum(DailyVolumeDb.amount).label("amount"),
+                func.sum(DailyVolumeDb.transactions_count).label("transactions_count"),
+            )
+            .where(DailyVolumeDb.day == day)
+            .group_by(DailyVolumeDb.type)
+        )
+        return (await self.db_session.execute(query)).all()
+
+    async def rebuild(self) -> None:
+        """Recompute the totals from ``users`` and every stored transaction.
+
+        Concurrent transactions wait for the rebuild on their ``record`` and are added on top of it. Volumes
+        of months compacted without archive cannot be recomputed and are dropped.
+        """
+        await self.db_session.execute(
+            text(f"LOCK TABLE {LedgerTotalDb.__tablename__}, {DailyVolumeDb.__tablename__} IN EXCLUSIVE MODE")
+        )
+        await self.db_session.execute(delete(LedgerTotalDb))
+        await self.db_session.execute(delete(DailyVolumeDb))
+
+        liabilities = select(literal(0), func.coalesce(func.sum(UserDb.balance), 0))
+        await self.db_session.execute(pg_insert(LedgerTotalDb).from_select(["stripe", "liabilities"], liabilities))
+
+        transactions = union_all(
+            *(select(table.created_at, table.type, table.amount) for table in (TransactionDb, TransactionArchiveDb))
+        ).subquery()
+        day = func.date(func.timezone("UTC", transactions.c.created_at))
+        await self.db_session.execute(
+            pg_insert(DailyVolumeDb).from_select(
+                ["day", "type", "stripe", "amount", "transactions_count"],
+                select(day, transactions.c.type, literal(0), func.sum(transactions.c.amount), func.count()).group_by(
+                    day, transactions.c.type
+                ),
+            )
+        )
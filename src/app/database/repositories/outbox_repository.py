@@ -0,0 +1,43 @@
+import typing
+from collections.abc import Sequence
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.orm import aliased
+
+from app.database.models import OutboxDb
+from .base_repository import BaseRepository
+
+
+class OutboxRepository(BaseRepository):
+    async def add(self, user_id: str, event_type: str, payload: dict[str, typing.Any]) -> OutboxDb:
+        event = OutboxDb(user_id=user_id, event_type=event_type, payload=payload)
+        self.db_session.add(event)
+
+        return event
+
+    async def claim(self, max_users: int, limit: int) -> Sequence[OutboxDb]:
+        """Lock and return up to ``limit`` pending events of up to ``max_users`` users, oldest first.
+
+        A user's events are claimed by one transaction at a time: it holds the lock on the user's oldest
+        event, which is what every other claim would need as well and skips instead. So each user's events
+        are delivered in order, while concurrent dispatchers move on to other users.
+        """
+        earlier = aliased(OutboxDb)
+        heads = (
+            select(OutboxDb.user_id)
+            .where(~exists().where(earlier.user_id == OutboxDb.user_id, earlier.id < OutboxDb.id))
+            .order_by(OutboxDb.id)
+            .limit(max_users)
+            .with_for_update(skip_locked=True)
+        )
+        user_ids = (await self.db_session.execute(heads)).scalars().all()
+        if not user_ids:
+            return []
+
+        events = (
+            select(OutboxDb).where(OutboxDb.user_id.in_(user_ids)).order_by(OutboxDb.id).limit(limit).with_for_update()
+        )
+        return (await self.db_session.execute(events)).scalars().all()
+
+    async def delete(self, ids: Sequence[int]) -> None:
+        await self.db_session.execute(delete(OutboxDb).where(OutboxDb.id.in_(ids)))
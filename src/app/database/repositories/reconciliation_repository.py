@@ -0,0 +1,87 @@
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import DateTime, Row, Select, Text, cast, func, select, type_coerce, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.database.expressions import signed_amount
+from app.database.models import JobWatermarkDb, TransactionAggregateDb, TransactionDb, UserDb
+from app.database.utils import Money, utcnow
+from .base_repository import BaseRepository
+from .user_repository import BALANCE_CHANNEL
+
+
+def _drift_query(user_ids: Sequence[str]) -> Select[tuple[str, Decimal, Decimal]]:
+    # Compacted transactions are counted through their monthly aggregates, their archived rows are copies.
+    raw = select(func.sum(signed_amount(TransactionDb))).where(TransactionDb.user_id == UserDb.id)
+    compacted = select(func.sum(TransactionAggregateDb.total)).where(TransactionAggregateDb.user_id == UserDb.id)
+    expected = type_coerce(
+        func.coalesce(raw.scalar_subquery(), 0) + func.coalesce(compacted.scalar_subquery(), 0), Money
+    )
+    # One statement reads the balances and the transactions from the same snapshot.
+    return (
+        select(UserDb.id, UserDb.balance, expected.label("expected"))
+        .where(UserDb.id.in_(user_ids), UserDb.balance != expected)
+        .order_by(UserDb.id)
+    )
+
+
+class ReconciliationRepository(BaseRepository):
+    async def now(self) -> datetime:
+        # The same clock ``transactions.processed_at`` is filled from.
+        return (await self.db_session.execute(select(cast(utcnow(), DateTime(timezone=True))))).scalar_one()
+
+    async def get_watermark(self, job: str) -> datetime | None:
+        query = select(JobWatermarkDb.watermark).where(JobWatermarkDb.job == job)
+        return (await self.db_session.execute(query)).scalar_one_or_none()
+
+    async def set_watermark(self, job: str, watermark: datetime) -> None:
+        statement = pg_insert(JobWatermarkDb).values(job=job, watermark=watermark)
+        statement = statement.on_conflict_do_update(
+            index_elements=[JobWatermarkDb.job], set_={"watermark": statement.excluded.watermark}
+        )
+        await self.db_session.execute(statement)
+
+    async def get_user_ids(self, after: str, limit: int) -> Sequence[str]:
+        query = select(UserDb.id).where(UserDb.id > after).order_by(UserDb.id).limit(limit)
+        return (await self.db_session.execute(query)).scalars().all()
+
+    async def stream_touched_user_ids(self, since: datetime, batch_size: int) -> AsyncIterator[Sequence[str]]:
+        """Yield the users with transactions processed since ``since``, ``batch_size`` at a time."""
+        query = select(TransactionDb.user_id).where(TransactionDb.processed_at >= since).distinct()
+        result = await self.db_session.stream_scalars(query.execution_options(yield_per=batch_size))
+        async for user_ids in result.partitions():
+            yield user_ids
+
+    async def find_drift(self, user_ids: Sequence[str]) -> Sequence[Row[tuple[str, Decimal, Decimal]]]:
+        """Return ``(id, balance, expected)`` of the users whose balance is not their transactions' sum."""
+        return (await self.db_session.execute(_drift_query(user_ids))).all()
+
+    async def repair(self, user_ids: Sequence[str]) -> list[tuple[str, Decimal, Decimal]]:
+        """Set drifted balances to their transactions' sum, return ``(id, previous, balance)`` of those changed.
+
+        The users stay locked until the database transaction ends. Balances are bumped and notified like
+        ``UserRepository.update_balance`` does. A sum below zero cannot be stored and is left for a human.
+        """
+        # Locked first, so the sums are read after every concurrent update of these users has committed.
+        lock = select(UserDb.id).where(UserDb.id.in_(user_ids)).order_by(UserDb.id).with_for_update()
+        await self.db_session.execute(lock)
+
+        drift = _drift_query(user_ids).subquery()
+        repaired = (
+            update(UserDb)
+            .where(UserDb.id == drift.c.id, drift.c.expected >= 0)
+            .values(balance=drift.c.expected, version=UserDb.version + 1)
+            .returning(UserDb.id, drift.c.balance.label("previous"), UserDb.balance, UserDb.version)
+            .cte("repaired")
+        )
+        payload = func.json_build_object(
+            "user_id", repaired.c.id, "balance", repaired.c.balance, "version", repaired.c.version
+        )
+        query = select(
+            repaired.c.id, repaired.c.previous, repaired.c.balance, func.pg_notify(BALANCE_CHANNEL, payload.cast(Text))
+        ).order_by(repaired.c.id)
+        return [
+            (user_id, previous, balance) for user_id, previous, balance, _ in (await self.db_session.execute(query))
+        ]
@@ -1,45 +1,211 @@
+from collections.abc import AsyncIterator, Sequence
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import func, select
+from sqlalchemy import (
+    Select,
+    Subquery,
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    null,
+    or_,
+    select,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 
-from app.database.models import TransactionDb
+from app.database.concurrency import is_unique_violation
+from app.database.expressions import period_end, signed_amount
+from app.database.models import TransactionAggregateDb, TransactionArchiveDb, TransactionDb, TransactionUidDb
+from app.database.partitions import add_months, month_start
+from app.exceptions import TransactionProcessedError
 from app.schemas import TransactionAdd
 from app.types import TransactionType
 from .base_repository import BaseRepository
 
 
+def _raw_sum(
+    table: type[TransactionDb] | type[TransactionArchiveDb],
+    user_id: str,
+    after: datetime | None,
+    before: datetime | None,
+) -> Select[tuple[Decimal]]:
+    query = select(func.sum(signed_amount(table)).label("total")).where(table.user_id == user_id)
+    if after is not None:
+        query = query.where(table.created_at >= after)
+    if before is not None:
+        query = query.where(table.created_at <= before)
+    return query
+
+
+def _statement(user_id: str, after: datetime | None, before: datetime | None) -> Subquery:
+    """Select the user's transactions and months compacted without archive: ``uid, type, amount, created_at``."""
+    month_end = period_end(TransactionAggregateDb.period_start)
+    compacted = select(
+        null().label("uid"), null().label("type"), TransactionAggregateDb.total, month_end.label("created_at")
+    ).where(TransactionAggregateDb.user_id == user_id, ~TransactionAggregateDb.archived)
+    if after is not None:
+        compacted = compacted.where(month_end >= after)
+    if before is not None:
+        compacted = compacted.where(month_end <= before)
+
+    parts = []
+    for table in (TransactionDb, TransactionArchiveDb):
+        query = select(table.uid, table.type, table.amount, table.created_at).where(table.user_id == user_id)
+        if after is not None:
+            query = query.where(table.created_at >= after)
+        if before is not None:
+            query = query.where(table.created_at <= before)
+        parts.append(query)
+    return union_all(*parts, compacted).subquery()
+
+
 class TransactionRepository(BaseRepository):
+    async def _add_uids(self, transactions: Sequence[TransactionAdd]) -> None:
+        """Record the transactions' uids, raise ``TransactionProcessedError`` if one is taken.
+
+        An insert of the same uid by a concurrent transaction makes this wait until that one commits or
+        rolls back, so of two requests reusing a uid only one can commit.
+        """
+        try:
+            await self.db_session.execute(
+                insert(TransactionUidDb),
+                [{"uid": transaction.uid, "user_id": transaction.user_id} for transaction in transactions],
+            )
+        except IntegrityError as e:
+            if not is_unique_violation(e):
+                raise
+            raise TransactionProcessedError from e
+
     async def add(self, data: TransactionAdd) -> TransactionDb:
+        await self._add_uids([data])
         transaction = TransactionDb(**data.model_dump())
         self.db_session.add(transaction)
 
         return transaction
 
-    async def get(self, uid: str) -> TransactionDb | None:
-        return await self.db_session.get(TransactionDb, uid)
+    async def add_many(self, transactions: Sequence[TransactionAdd]) -> None:
+        """Insert the transactions with one multi-row statement."""
+        await self._add_uids(transactions)
+        await self.db_session.execute(
+            insert(TransactionDb).values([transaction.model_dump() for transaction in transactions])
+        )
+
+    async def get(self, uid: str) -> TransactionDb | TransactionArchiveDb | None:
+        transaction = await self.db_session.get(TransactionDb, uid)
+        if transaction is None:
+            return await self.db_session.get(TransactionArchiveDb, uid)
+        return transaction
+
+    async def exists(self, uid: str) -> bool:
+        query = union_all(
+            select(TransactionDb.uid).where(TransactionDb.uid == uid),
+            select(TransactionArchiveDb.uid).where(TransactionArchiveDb.uid == uid),
+        )
+        return (await self.db_session.execute(query)).first() is not None
 
     async def get_total_sum(
         self, user_id: str, after: datetime | None = None, before: datetime | None = None
     ) -> Decimal:
-        query_amount_by_type = select(TransactionDb.type, func.sum(TransactionDb.amount)).where(
-            TransactionDb.user_id == user_id
-        )
+        # Compacted months are read from their aggregate when the bounds cover them completely
+        # and from the archive otherwise, recent months always come from the raw rows.
+        parts = [_raw_sum(TransactionDb, user_id, after, before)]
 
+        first_full = None
         if after is not None:
-            query_amount_by_type = query_amount_by_type.where(TransactionDb.created_at >= after)
-        if before is not None:
-            query_amount_by_type = query_amount_by_type.where(TransactionDb.created_at <= before)
+            first_full = month_start(after) if month_start(after) == after else add_months(month_start(after), 1)
+        end_full = month_start(before) if before is not None else None
+
+        aggregates = select(func.sum(TransactionAggregateDb.total).label("total")).where(
+            TransactionAggregateDb.user_id == user_id
+        )
+        if first_full is not None:
+            aggregates = aggregates.where(TransactionAggregateDb.period_start >= first_full)
+        if end_full is not None:
+            aggregates = aggregates.where(TransactionAggregateDb.period_start < end_full)
+        parts.append(aggregates)
+
+        partial = []
+        if first_full is not None:
+            partial.append(TransactionArchiveDb.created_at < first_full)
+        if end_full is not None:
+            partial.append(TransactionArchiveDb.created_at >= end_full)
+        if partial:
+            parts.append(_raw_sum(TransactionArchiveDb, user_id, after, before).where(or_(*partial)))
+
+        totals = union_all(*parts).subquery()
+        total_sum = (await self.db_session.execute(select(func.sum(totals.c.total)))).scalar_one()
+
+        return total_sum if total_sum is not None else Decimal(0)
+
+    async def count_statement(self, user_id: str, after: datetime | None = None, before: datetime | None = None) -> int:
+        statement = _statement(user_id, after, before)
+        return (await self.db_session.execute(select(func.count()).select_from(statement))).scalar_one()
 
-        query_amount_by_type = query_amount_by_type.group_by(TransactionDb.type)
+    async def stream_statement(
+        self, user_id: str, after: datetime | None = None, before: datetime | None = None, batch_size: int = 1_000
+    ) -> AsyncIterator[tuple[str | None, TransactionType | None, Decimal, datetime]]:
+        """Yield the user's transactions between ``after`` and ``before`` in the order they were made.
 
-        result = (await self.db_session.execute(query_amount_by_type)).all()
+        A month compacted without archive is one row without uid and type, its signed total made at the
+        month's end.
+        """
+        statement = _statement(user_id, after, before)
+        query = select(statement).order_by(statement.c.created_at, statement.c.uid)
+        result = await self.db_session.stream(query.execution_options(yield_per=batch_size))
+        async for uid, type_, amount, created_at in result:
+            yield uid, type_, amount, created_at
 
-        total_sum = Decimal(0)
-        for row in result:
-            if row[0] == TransactionType.WITHDRAW:
-                total_sum -= row[1]
-            elif row[0] == TransactionType.DEPOSIT:
-                total_sum += row[1]
+    async def compact(self, before: datetime, archive: bool = True) -> int:
+        """Fold the transactions created before ``before`` into per-user monthly aggregates.
+
+        ``before`` is rounded down to a month start so only whole months are compacted. With ``archive``
+        the raw rows are moved to ``transactions_archive``, otherwise they are dropped and
+        ``get_total_sum`` can no longer split those months by a bound inside them.
+        """
+        before = month_start(before)
+        moved = (
+            delete(TransactionDb)
+            .where(TransactionDb.created_at < before)
+            .returning(*TransactionDb.__table__.c)
+            .cte("moved")
+        )
+
+        archived = (
+            insert(TransactionArchiveDb)
+            .from_select(
+                [column.name for column in moved.c],
+                select(*moved.c).where(literal(archive)),
+            )
+            .cte("archived")
+        )
+
+        period = func.date_trunc("month", func.timezone("UTC", moved.c.created_at))
+        signed_amount = case((moved.c.type == TransactionType.WITHDRAW, -moved.c.amount), else_=moved.c.amount)
+        upsert = pg_insert(TransactionAggregateDb).from_select(
+            ["user_id", "period_start", "total", "transactions_count", "archived"],
+            select(
+                moved.c.user_id,
+                func.timezone("UTC", period),
+                func.sum(signed_amount),
+                func.count(),
+                literal(archive),
+            ).group_by(moved.c.user_id, period),
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[TransactionAggregateDb.user_id, TransactionAggregateDb.period_start],
+            set_={
+                "total": TransactionAggregateDb.total + upsert.excluded.total,
+                "transactions_count": TransactionAggregateDb.transactions_count + upsert.excluded.transactions_count,
+                "archived": and_(TransactionAggregateDb.archived, upsert.excluded.archived),
+            },
+        )
 
-        return total_sum
+        # Postgres runs every data-modifying CTE exactly once, whether or not the outer query reads it.
+        query = select(func.count()).select_from(moved).add_cte(archived).add_cte(upsert.cte("aggregated"))
+        return (await self.db_session.execute(query)).scalar_one()
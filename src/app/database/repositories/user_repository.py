@@ -1,27 +1,126 @@
+import typing
+from collections.abc import Mapping, Sequence
 from decimal import Decimal
 
+from sqlalchemy import BigInteger, String, Text, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.database.concurrency import ConcurrencyStrategy
 from app.database.models import UserDb
-from app.exceptions import AmountExceedsBalanceError, UserNotFoundError
+from app.database.utils import Money
+from app.exceptions import AmountExceedsBalanceError, ConcurrentUpdateError, UserNotFoundError
 from app.schemas import UserCreate
 from .base_repository import BaseRepository
 
 
+# Receives ``{"user_id": ..., "balance": <minor units>, "version": ...}`` when a balance update commits.
+BALANCE_CHANNEL: typing.Final = "balance_updates"
+
+
 class UserRepository(BaseRepository):
-    async def create(self, data: UserCreate) -> UserDb:
-        user = UserDb(**data.model_dump())
-        self.db_session.add(user)
+    def __init__(self, db_session: AsyncSessionType, strategy: ConcurrencyStrategy = ConcurrencyStrategy.PESSIMISTIC):
+        super().__init__(db_session)
+        self.strategy = strategy
+
+    async def create(self, data: UserCreate) -> UserDb | None:
+        """Insert the user, return ``None`` if a user with its id already exists.
 
-        return user
+        A single statement both checks and inserts, so concurrent creations of one id cannot both succeed.
+        """
+        statement = (
+            pg_insert(UserDb)
+            .values(**data.model_dump())
+            .on_conflict_do_nothing(index_elements=[UserDb.id])
+            .returning(UserDb)
+        )
+        return (await self.db_session.execute(statement)).scalar_one_or_none()
+
+    async def create_many(self, users: Sequence[UserCreate]) -> set[str]:
+        """Insert the users with one multi-row statement, return the ids of those that did not exist yet."""
+        if not users:
+            return set()
+        statement = (
+            pg_insert(UserDb)
+            .values([user.model_dump() for user in users])
+            .on_conflict_do_nothing(index_elements=[UserDb.id])
+            .returning(UserDb.id)
+        )
+        return set((await self.db_session.execute(statement)).scalars())
 
     async def get(self, user_id: str) -> UserDb | None:
         return await self.db_session.get(UserDb, user_id)
 
+    async def exists(self, user_id: str) -> bool:
+        return (await self.db_session.execute(select(UserDb.id).where(UserDb.id == user_id))).first() is not None
+
+    async def get_top_by_balance(self, limit: int) -> Sequence[UserDb]:
+        # Reads ``limit`` entries of ``ix_users_balance`` from its high end, however many users there are.
+        query = select(UserDb).order_by(UserDb.balance.desc()).limit(limit)
+        return (await self.db_session.execute(query)).scalars().all()
+
     async def update_balance(self, user_id: str, amount: Decimal) -> None:
-        user = await self.db_session.get(UserDb, user_id)
+        query = select(UserDb).where(UserDb.id == user_id).execution_options(populate_existing=True)
+        if self.strategy == ConcurrencyStrategy.PESSIMISTIC:
+            query = query.with_for_update()
+
+        user = (await self.db_session.execute(query)).scalar_one_or_none()
         if user is None:
             raise UserNotFoundError
 
         if user.balance + amount < 0:
             raise AmountExceedsBalanceError
 
-        user.balance = UserDb.balance + amount
+        statement = update(UserDb).where(UserDb.id == user_id)
+        if self.strategy == ConcurrencyStrategy.OPTIMISTIC:
+            statement = statement.where(UserDb.version == user.version)
+        updated = (
+            statement.values(balance=UserDb.balance + amount, version=UserDb.version + 1)
+            .returning(UserDb.id, UserDb.balance, UserDb.version)
+            .cte("updated")
+        )
+
+        # Postgres delivers the notification only if the transaction commits.
+        payload = func.json_build_object(
+            "user_id", updated.c.id, "balance", updated.c.balance, "version", updated.c.version
+        )
+        notified = await self.db_session.execute(select(func.pg_notify(BALANCE_CHANNEL, payload.cast(Text))))
+        if notified.first() is None:
+            raise ConcurrentUpdateError
+
+    async def update_balances(self, amounts: Mapping[str, Decimal]) -> None:
+        """Add ``amounts`` to the balances of several users at once, each checked like ``update_balance``.
+
+        The rows are read, and with ``PESSIMISTIC`` locked, in ``id`` order: transactions updating the same
+        users in opposite directions wait for each other instead of deadlocking. One ``UPDATE`` then changes
+        every balance.
+        """
+        user_ids = sorted(amounts)
+        query = select(UserDb.id, UserDb.balance, UserDb.version).where(UserDb.id.in_(user_ids)).order_by(UserDb.id)
+        if self.strategy == ConcurrencyStrategy.PESSIMISTIC:
+            query = query.with_for_update()
+
+        users = {user.id: user for user in await self.db_session.execute(query)}
+        if len(users) < len(user_ids):
+            raise UserNotFoundError
+        if any(users[user_id].balance + amounts[user_id] < 0 for user_id in user_ids):
+            raise AmountExceedsBalanceError
+
+        changes = values(
+            column("id", String), column("amount", Money()), column("version", BigInteger), name="changes"
+        ).data([(user_id, amounts[user_id], users[user_id].version) for user_id in user_ids])
+        statement = update(UserDb).where(UserDb.id == changes.c.id)
+        if self.strategy == ConcurrencyStrategy.OPTIMISTIC:
+            statement = statement.where(UserDb.version == changes.c.version)
+        updated = (
+            statement.values(balance=UserDb.balance + changes.c.amount, version=UserDb.version + 1)
+            .returning(UserDb.id, UserDb.balance, UserDb.version)
+            .cte("updated")
+        )
+
+        payload = func.json_build_object(
+            "user_id", updated.c.id, "balance", updated.c.balance, "version", updated.c.version
+        )
+        notified = await self.db_session.execute(select(func.pg_notify(BALANCE_CHANNEL, payload.cast(Text))))
+        if len(notified.all()) < len(user_ids):
+            raise ConcurrentUpdateError
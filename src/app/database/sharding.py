@@ -0,0 +1,248 @@
+import asyncio
+import bisect
+import collections
+import hashlib
+import logging
+import time
+import typing
+from collections.abc import Iterable, Sequence
+
+from sqlalchemy import Table, delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.models import (
+    OutboxDb,
+    TransactionAggregateDb,
+    TransactionArchiveDb,
+    TransactionDb,
+    TransactionOwnerDb,
+    TransactionUidDb,
+    UserDb,
+)
+from app.database.repositories import TransactionRepository, UserRepository
+from app.exceptions import TransactionProcessedError
+from app.metrics import Counter
+from app.schemas import TransactionAdd
+
+
+logger = logging.getLogger(__name__)
+
+UID_LOOKUPS: typing.Final = Counter("shard_uid_lookups_total", "Transaction uid to user lookups by how they resolved.")
+
+# Everything stored per user, moved along with the user row.
+USER_TABLES: typing.Final = (TransactionDb, TransactionArchiveDb, TransactionUidDb, TransactionAggregateDb, OutboxDb)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing: adding or removing a node only moves the keys of the ring arcs it gains or loses."""
+
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int):
+        points = sorted((_hash(f"{node}#{number}"), node) for node in nodes for number in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        return self._nodes[bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)]
+
+
+class ShardRouter:
+    """Maps users and transactions to the shard holding them.
+
+    A user lives on the shard the ring assigns them. While ``rebalancing``, users may still be on another
+    shard, so each lookup checks the owner first and then the rest. A transaction lives with its user: the
+    first shard keeps the user of every uid, recorded by ``claim`` before the transaction is added, which
+    also keeps uids unique across shards. Users of looked up or claimed uids are remembered, the least
+    recently used beyond ``uid_cache_size``; unknown uids are remembered for ``uid_miss_ttl`` seconds.
+    """
+
+    def __init__(
+        self,
+        session_makers: dict[str, async_sessionmaker[AsyncSessionType]],
+        virtual_nodes: int,
+        *,
+        rebalancing: bool = False,
+        uid_cache_size: int = 100_000,
+        uid_miss_ttl: float = 1.0,
+    ):
+        self.session_makers = session_makers
+        self.default_shard = next(iter(session_makers))
+        self.ring = HashRing(session_makers, virtual_nodes)
+        self.rebalancing = rebalancing
+        self.uid_cache_size = uid_cache_size
+        self.uid_miss_ttl = uid_miss_ttl
+        # A uid's user never changes, so remembered users stay valid while users move between shards.
+        self._uid_users: collections.OrderedDict[str, str] = collections.OrderedDict()
+        self._missing_uids: collections.OrderedDict[str, float] = collections.OrderedDict()
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.session_makers) > 1
+
+    async def shard_for_user(self, user_id: str) -> str:
+        owner = self.ring.node_for(user_id)
+        if not self.rebalancing or not self.sharded:
+            return owner
+
+        for shard in (owner, *(shard for shard in self.session_makers if shard != owner)):
+            async with self.session_makers[shard]() as db_session:
+                if await UserRepository(db_session).exists(user_id):
+                    return shard
+        return owner
+
+    async def shard_for_transaction(self, uid: str) -> str:
+        if not self.sharded:
+            return self.default_shard
+
+        user_id = await self._transaction_user(uid)
+        if user_id is None:
+            return self.default_shard
+        return await self.shard_for_user(user_id)
+
+    async def claim(self, transactions: Sequence[TransactionAdd]) -> None:
+        """Record the users of the transactions' uids, raise ``TransactionProcessedError`` if one is another's.
+
+        Claims are committed at once, so a uid stays its user's even if adding the transaction then fails.
+        """
+        if not self.sharded:
+            return
+
+        uids = [transaction.uid for transaction in transactions]
+        async with self.session_makers[self.default_shard]() as db_session:
+            await db_session.execute(
+                pg_insert(TransactionOwnerDb)
+                .values([{"uid": transaction.uid, "user_id": transaction.user_id} for transaction in transactions])
+                .on_conflict_do_nothing()
+            )
+            await db_session.commit()
+            # A separate statement, so it sees the claims of concurrent requests the insert waited for.
+            query = select(TransactionOwnerDb.uid, TransactionOwnerDb.user_id).where(TransactionOwnerDb.uid.in_(uids))
+            users: dict[str, str] = dict((await db_session.execute(query)).tuples().all())
+
+        for uid, user_id in users.items():
+            self._remember(uid, user_id)
+        if any(users.get(transaction.uid) != transaction.user_id for transaction in transactions):
+            raise TransactionProcessedError
+
+    async def _transaction_user(self, uid: str) -> str | None:
+        if (user_id := self._uid_users.get(uid)) is not None:
+            self._uid_users.move_to_end(uid)
+            UID_LOOKUPS.inc(result="cached")
+            return user_id
+        if (expires := self._missing_uids.get(uid)) is not None:
+            if expires > time.monotonic():
+                UID_LOOKUPS.inc(result="cached_missing")
+                return None
+            del self._missing_uids[uid]
+
+        async with self.session_makers[self.default_shard]() as db_session:
+            user_id = await db_session.scalar(select(TransactionOwnerDb.user_id).where(TransactionOwnerDb.uid == uid))
+        if user_id is None and self.rebalancing:
+            # Uids of transactions added before the shard list changed are recorded by the rebalance job.
+            user_id = await self._search_transaction_user(uid)
+        if user_id is None:
+            UID_LOOKUPS.inc(result="missing")
+            self._missing_uids[uid] = time.monotonic() + self.uid_miss_ttl
+            if len(self._missing_uids) > self.uid_cache_size:
+                self._missing_uids.popitem(last=False)
+            return None
+
+        UID_LOOKUPS.inc(result="found")
+        self._remember(uid, user_id)
+        return user_id
+
+    def _remember(self, uid: str, user_id: str) -> None:
+        self._missing_uids.pop(uid, None)
+        self._uid_users[uid] = user_id
+        self._uid_users.move_to_end(uid)
+        if len(self._uid_users) > self.uid_cache_size:
+            self._uid_users.popitem(last=False)
+
+    async def _search_transaction_user(self, uid: str) -> str | None:
+        async def find(session_maker: async_sessionmaker[AsyncSessionType]) -> str | None:
+            async with session_maker() as db_session:
+                transaction = await TransactionRepository(db_session).get(uid)
+                return None if transaction is None else transaction.user_id
+
+        found = await asyncio.gather(*(find(session_maker) for session_maker in self.session_makers.values()))
+        return next((user_id for user_id in found if user_id is not None), None)
+
+
+async def record_transaction_users(
+    session_makers: dict[str, async_sessionmaker[AsyncSessionType]], directory: str, batch_size: int
+) -> int:
+    """Record the user of every shard's transaction uids on the ``directory`` shard, return how many were new."""
+    recorded = 0
+    for session_maker in session_makers.values():
+        last_uid = ""
+        while True:
+            async with session_maker() as db_session:
+                query = (
+                    select(TransactionUidDb.uid, TransactionUidDb.user_id)
+                    .where(TransactionUidDb.uid > last_uid)
+                    .order_by(TransactionUidDb.uid)
+                    .limit(batch_size)
+                )
+                rows = (await db_session.execute(query)).all()
+            if not rows:
+                break
+            last_uid = rows[-1].uid
+
+            async with session_makers[directory]() as db_session, db_session.begin():
+                statement = (
+                    pg_insert(TransactionOwnerDb)
+                    .values([{"uid": row.uid, "user_id": row.user_id} for row in rows])
+                    .on_conflict_do_nothing()
+                    .returning(TransactionOwnerDb.uid)
+                )
+                recorded += len((await db_session.execute(statement)).all())
+    return recorded
+
+
+async def move_user(
+    source: async_sessionmaker[AsyncSessionType], target: async_sessionmaker[AsyncSessionType], user_id: str
+) -> bool:
+    """Move a user and everything stored for them from ``source`` to ``target``, return whether it was there.
+
+    The user row stays locked on ``source`` until both sides commit, so no transaction of the user commits
+    meanwhile; requests waiting for the lock fail with ``UserNotFoundError`` and can be retried. ``target``
+    commits first: if ``source`` then fails to, the user is on both shards and the copy on ``target``, the
+    one routing prefers, wins when the move is repeated. Ledger totals stay on ``source``: they are summed
+    over every shard, so that sum does not change.
+    """
+    async with source() as source_session, source_session.begin():
+        user_query = select(UserDb.__table__).where(UserDb.id == user_id).with_for_update()
+        user = (await source_session.execute(user_query)).mappings().one_or_none()
+        if user is None:
+            return False
+
+        rows: dict[Table, list[dict[str, typing.Any]]] = {}
+        for model in USER_TABLES:
+            table = typing.cast("Table", model.__table__)
+            query = select(table).where(table.c.user_id == user_id)
+            rows[table] = [dict(row) for row in (await source_session.execute(query)).mappings()]
+        # Outbox ids are per database, the target numbers the events anew in their original order.
+        outbox = typing.cast("Table", OutboxDb.__table__)
+        rows[outbox] = [
+            {key: value for key, value in row.items() if key != "id"}
+            for row in sorted(rows[outbox], key=lambda row: row["id"])
+        ]
+
+        async with target() as target_session, target_session.begin():
+            if not await UserRepository(target_session).exists(user_id):
+                await target_session.execute(insert(typing.cast("Table", UserDb.__table__)), [dict(user)])
+                for table, table_rows in rows.items():
+                    if table_rows:
+                        await target_session.execute(insert(table), table_rows)
+            else:
+                logger.warning("User %s is already on the target shard, dropping the source copy", user_id)
+
+            for table in rows:
+                await source_session.execute(delete(table).where(table.c.user_id == user_id))
+            await source_session.execute(delete(UserDb).where(UserDb.id == user_id))
+    return True
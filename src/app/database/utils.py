@@ -1,6 +1,11 @@
+from decimal import Decimal
+
+from sqlalchemy import Dialect
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql import expression
-from sqlalchemy.types import DateTime
+from sqlalchemy.types import BigInteger, DateTime, TypeDecorator
+
+from app.utils import from_minor_units, to_minor_units
 
 
 class utcnow(expression.FunctionElement):  # noqa: N801
@@ -11,3 +16,21 @@ class utcnow(expression.FunctionElement):  # noqa: N801
 @compiles(utcnow, "postgresql")
 def pg_utcnow(element, compiler, **kw):  # noqa: ANN201, ANN003, ARG001, ANN001
     return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+class Money(TypeDecorator[Decimal]):
+    """A ``Decimal`` amount stored as a ``BIGINT`` number of minor units (cents)."""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: Decimal | None, dialect: Dialect) -> int | None:  # noqa: ARG002
+        return None if value is None else to_minor_units(Decimal(value))
+
+    def process_result_value(self, value: int | Decimal | None, dialect: Dialect) -> Decimal | None:  # noqa: ARG002
+        # ``SUM`` over ``BIGINT`` returns ``NUMERIC``, so sums arrive as ``Decimal``.
+        return None if value is None else from_minor_units(value)
+
+    @property
+    def python_type(self) -> type[Decimal]:
+        return Decimal
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import typing
+import uuid
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import asyncpg
+from sqlalchemy import ClauseElement, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.concurrency import ConcurrencyStrategy
+from app.database.models import TransactionDb, TransactionUidDb, UserDb
+from app.database.repositories import TransactionRepository, UserRepository
+from app.types import TransactionType
+
+
+logger = logging.getLogger(__name__)
+
+
+def _prepared_statements(user_id: str, strategy: ConcurrencyStrategy) -> Sequence[ClauseElement]:
+    """Build the hot statements that lock or write rows: the warm-up prepares them but never runs them."""
+    locked = select(UserDb).where(UserDb.id == user_id)
+    if strategy == ConcurrencyStrategy.PESSIMISTIC:
+        locked = locked.with_for_update()
+    return (
+        locked,
+        insert(UserDb).values(id=user_id, name="warmup"),
+        update(UserDb)
+        .where(UserDb.id == user_id, UserDb.version == 0)
+        .values(balance=UserDb.balance + Decimal(1), version=UserDb.version + 1)
+        .returning(UserDb.id, UserDb.balance, UserDb.version),
+        insert(TransactionUidDb).values(uid=user_id, user_id=user_id),
+        insert(TransactionDb).values(
+            uid=user_id, user_id=user_id, amount=Decimal(1), type=TransactionType.DEPOSIT, created_at=datetime.now(UTC)
+        ),
+    )
+
+
+async def warm_up_session(db_session: AsyncSessionType, strategy: ConcurrencyStrategy) -> None:
+    """Run the hot reads once on the session's connection and prepare the hot writes without running them.
+
+    This opens the connection, loads asyncpg's type codecs and fills SQLAlchemy's compiled cache for the
+    reads. Nothing is written or locked, so the warm-up is safe while other workers serve traffic.
+    """
+    await db_session.execute(text("SELECT 1"))
+    # The id matches no row: the reads find nothing and the prepared writes are never executed.
+    user_id = f"warmup-{uuid.uuid4().hex[:29]}"
+    try:
+        await UserRepository(db_session, strategy=strategy).get(user_id)
+        transaction_repo = TransactionRepository(db_session)
+        await transaction_repo.get(user_id)
+        await transaction_repo.get_total_sum(user_id, before=datetime.now(UTC))
+
+        connection = await db_session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = typing.cast(asyncpg.Connection, raw_connection.driver_connection)
+        for statement in _prepared_statements(user_id, strategy):
+            # ``prepare`` only parses the statement on the server and loads the codecs of its parameters.
+            await driver_connection.prepare(str(statement.compile(dialect=connection.dialect)))
+    finally:
+        await db_session.rollback()
+
+
+async def warm_up(
+    session_maker: async_sessionmaker[AsyncSessionType], connections: int, strategy: ConcurrencyStrategy
+) -> None:
+    """Open ``connections`` pooled connections at once and warm each of them up."""
+
+    async def warm_up_one() -> None:
+        async with session_maker() as db_session:
+            await warm_up_session(db_session, strategy)
+
+    # Concurrent sessions make the pool open and hand out distinct connections.
+    await asyncio.gather(*(warm_up_one() for _ in range(connections)))
+    logger.info("Warmed up %s database connections", connections)
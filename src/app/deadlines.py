@@ -0,0 +1,90 @@
+"""Request deadlines carried in a context variable down to every database statement.
+
+A request gets its route's latency budget, or the shorter or longer one its client asks for, as a deadline
+when it is admitted. Statements run under it get a ``statement_timeout`` no longer than the time left, so a
+query the client has stopped waiting for is cancelled by Postgres instead of holding its connection.
+"""
+
+import contextlib
+import contextvars
+import math
+import time
+import typing
+from collections.abc import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.exceptions import DeadlineExceededError
+from app.metrics import Counter
+
+
+EXPIRED: typing.Final = Counter(
+    "request_deadline_expired_total", "Requests that ran out of time, by route and by where they were stopped."
+)
+
+QUERY_CANCELED_SQLSTATE: typing.Final = "57014"
+
+_DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+# ``Connection.info`` key of the ``statement_timeout`` in seconds set in the connection's current transaction.
+_STATEMENT_TIMEOUT: typing.Final = "deadline_statement_timeout"
+_SET_STATEMENT_TIMEOUT: typing.Final = "SELECT set_config('statement_timeout', $1, true)"
+
+
+def time_left() -> float | None:
+    """Seconds until the current deadline, ``None`` without one."""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextlib.contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Run the block with a deadline ``seconds`` from now, or the current one if that is sooner."""
+    current = _DEADLINE.get()
+    new = time.monotonic() + seconds
+    token = _DEADLINE.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def enforce_statement_timeouts(engine: AsyncEngine, slack: float) -> None:
+    """Run every statement issued under a deadline with a ``statement_timeout`` bounded by the time left.
+
+    The timeout is set with ``SET LOCAL`` semantics, so it ends with the transaction. Setting it costs a round
+    trip, so it is only set again once the timeout in force would let a statement overrun the deadline by more
+    than ``slack`` seconds. Statements issued after the deadline fail without reaching Postgres.
+    """
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def forget_timeout(conn: Connection) -> None:
+        conn.info.pop(_STATEMENT_TIMEOUT, None)
+
+    @event.listens_for(engine.sync_engine, "rollback_savepoint")
+    def forget_savepoint_timeout(conn: Connection, *_: object) -> None:
+        # The timeout may have been set inside the savepoint and rolled back with it.
+        conn.info.pop(_STATEMENT_TIMEOUT, None)
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def set_timeout(conn: Connection, *_: object) -> None:
+        deadline = _DEADLINE.get()
+        if deadline is None:
+            return
+        now = time.monotonic()
+        if deadline <= now:
+            raise DeadlineExceededError
+
+        timeout = conn.info.get(_STATEMENT_TIMEOUT)
+        if timeout is None or now + timeout - deadline > slack:
+            milliseconds = max(1, math.floor((deadline - now) * 1000))
+            conn.connection.cursor().execute(_SET_STATEMENT_TIMEOUT, (str(milliseconds),))
+            conn.info[_STATEMENT_TIMEOUT] = milliseconds / 1000
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def translate_timeout(context: ExceptionContext) -> None:
+        if _DEADLINE.get() is None:
+            return
+        if getattr(context.original_exception, "sqlstate", None) == QUERY_CANCELED_SQLSTATE:
+            raise DeadlineExceededError from context.original_exception
@@ -38,3 +38,51 @@ class AmountExceedsBalanceError(CustomError):
 
 class TransactionExceedsBalanceError(CustomError):
     custom_message = "Transaction exceeds balance"
+
+
+class CrossShardTransferError(CustomError):
+    custom_message = "Transfers between users on different shards are not supported"
+
+
+class ConcurrentUpdateError(CustomError):
+    custom_message = "Concurrent update, try again"
+
+
+class ServiceOverloadedError(CustomError):
+    custom_message = "Service is overloaded, try again later"
+
+    def __init__(self, retry_after: float, message: str | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceededError(CustomError):
+    custom_message = "Too many requests"
+
+    def __init__(self, retry_after: float, message: str | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(CustomError):
+    custom_message = "Request deadline exceeded"
+
+
+class ProfilerBusyError(CustomError):
+    custom_message = "A profile is already being taken"
+
+
+class ReportNotFoundError(CustomError):
+    custom_message = "Report not found"
+
+
+class ReportNotReadyError(CustomError):
+    custom_message = "Report is not ready"
+
+
+class TooManyReportsError(CustomError):
+    custom_message = "Too many reports in progress, wait for one to finish"
+
+
+class RangeNotSatisfiableError(CustomError):
+    custom_message = "Requested range not satisfiable"
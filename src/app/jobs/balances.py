@@ -0,0 +1,197 @@
+"""Balances of many users at many points in time, e.g. for risk runs.
+
+Each chunk of users has its transactions streamed once and every ``(user, point)`` pair answered with NumPy,
+see ``app.database.batch_balances``, instead of one ``get_total_sum`` query per pair. Writes ``user_id,ts,
+balance`` CSV rows, for every user or those listed one per line in ``--users``, shard by shard; listed users
+are looked up on the shard the hash ring assigns them. With ``--verify N``, N random pairs of every chunk are
+checked against ``TransactionRepository.get_total_sum``; exits with status 1 when one differs::
+
+    python -m app.jobs.balances --at 2024-01-31T23:59:59Z 2024-02-29T23:59:59Z --output balances.csv
+    python -m app.jobs.balances --users users.txt --at 2024-01-31T23:59:59Z --verify 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import dataclasses
+import logging
+import random
+import sys
+import typing
+from collections.abc import AsyncIterator, Callable, Iterable, Sequence
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from sqlalchemy import URL
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database.batch_balances import chunk_balances, stream_user_ids, to_micros
+from app.database.repositories import TransactionRepository
+from app.database.sharding import HashRing
+from app.settings import Settings
+from app.utils import from_minor_units, timezone_validator
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Mismatch:
+    user_id: str
+    ts: datetime
+    balance: Decimal
+    expected: Decimal
+
+
+@dataclasses.dataclass
+class BalancesReport:
+    users: int = 0
+    verified: int = 0
+    mismatches: list[Mismatch] = dataclasses.field(default_factory=list)
+
+
+async def _chunks(
+    session_maker: async_sessionmaker[AsyncSessionType], user_ids: Iterable[str] | None, chunk_size: int
+) -> AsyncIterator[list[str]]:
+    if user_ids is not None:
+        chunk = []
+        for user_id in user_ids:
+            chunk.append(user_id)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+
+    async with session_maker() as session:
+        chunk = []
+        async for user_id in stream_user_ids(session):
+            chunk.append(user_id)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+async def compute_balances(  # noqa: PLR0913
+    dsn: URL,
+    at: Sequence[datetime],
+    output: typing.TextIO,
+    *,
+    user_ids: Iterable[str] | None = None,
+    chunk_size: int = 5_000,
+    verify: int = 0,
+    header: bool = True,
+    progress: Callable[[int], None] | None = None,
+) -> BalancesReport:
+    """Write the balances of the database's users at ``at`` to ``output``.
+
+    ``progress`` is called with the number of users done after every chunk.
+    """
+    at = [timezone_validator(ts) for ts in at]
+    at_micros = to_micros(at)
+    # One connection lists the users while the other reads each chunk's transactions.
+    engine = create_async_engine(dsn, pool_size=2, max_overflow=0)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    report = BalancesReport()
+    writer = csv.writer(output)
+    if header:
+        writer.writerow(["user_id", "ts", "balance"])
+    try:
+        async for chunk in _chunks(session_maker, user_ids, chunk_size):
+            async with session_maker() as session:
+                balances = await chunk_balances(session, chunk, at_micros)
+                for user_id, row in zip(chunk, balances.tolist(), strict=True):
+                    writer.writerows(
+                        (user_id, ts.isoformat(), from_minor_units(balance))
+                        for ts, balance in zip(at, row, strict=True)
+                    )
+                report.users += len(chunk)
+                if progress is not None:
+                    progress(report.users)
+
+                repo = TransactionRepository(session)
+                pairs = len(chunk) * len(at)
+                for pair in random.sample(range(pairs), min(verify, pairs)):
+                    user, point = divmod(pair, len(at))
+                    balance = from_minor_units(int(balances[user, point]))
+                    expected = await repo.get_total_sum(chunk[user], before=at[point])
+                    report.verified += 1
+                    if balance != expected:
+                        report.mismatches.append(Mismatch(chunk[user], at[point], balance, expected))
+                        logger.warning(
+                            "Balance of user %s at %s is %s in bulk, %s by get_total_sum",
+                            chunk[user],
+                            at[point],
+                            balance,
+                            expected,
+                        )
+    finally:
+        await engine.dispose()
+
+    logger.info(
+        "Computed %s balances of %s users, %s of %s verified ones differ",
+        report.users * len(at),
+        report.users,
+        len(report.mismatches),
+        report.verified,
+    )
+    return report
+
+
+async def compute_shard_balances(  # noqa: PLR0913
+    settings: Settings,
+    at: Sequence[datetime],
+    output: typing.TextIO,
+    *,
+    user_ids: Sequence[str] | None = None,
+    chunk_size: int = 5_000,
+    verify: int = 0,
+) -> BalancesReport:
+    """Write the balances of the users of every shard at ``at`` to ``output``, see ``compute_balances``."""
+    ring = HashRing(settings.shard_dsns, settings.sharding.virtual_nodes)
+    report = BalancesReport()
+    for index, (shard, dsn) in enumerate(settings.shard_dsns.items()):
+        shard_user_ids = (
+            None if user_ids is None else [user_id for user_id in user_ids if ring.node_for(user_id) == shard]
+        )
+        shard_report = await compute_balances(
+            dsn, at, output, user_ids=shard_user_ids, chunk_size=chunk_size, verify=verify, header=index == 0
+        )
+        report.users += shard_report.users
+        report.verified += shard_report.verified
+        report.mismatches.extend(shard_report.mismatches)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--at", type=datetime.fromisoformat, nargs="+", required=True, help="points in time")
+    parser.add_argument("--users", type=Path, help="file with one user id per line, every user by default")
+    parser.add_argument("--output", type=Path, help="CSV file to write, standard output by default")
+    parser.add_argument("--chunk-size", type=int, default=5_000, help="users whose transactions are held at once")
+    parser.add_argument("--verify", type=int, default=0, help="random pairs per chunk checked with get_total_sum")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    user_ids = None
+    if args.users is not None:
+        user_ids = [line.strip() for line in args.users.read_text().splitlines() if line.strip()]
+    output_file = args.output.open("w", newline="") if args.output is not None else contextlib.nullcontext(sys.stdout)
+    with output_file as output:
+        report = asyncio.run(
+            compute_shard_balances(
+                Settings(), args.at, output, user_ids=user_ids, chunk_size=args.chunk_size, verify=args.verify
+            )
+        )
+    if report.mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Cold-history compaction of the ``transactions`` table.
+
+Folds transactions older than ``COMPACTION__HORIZON_MONTHS`` into per-user monthly totals, one month
+per database transaction, oldest first, on every shard in turn::
+
+    python -m app.jobs.compaction
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import UTC, datetime
+
+from sqlalchemy import URL, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database.models import TransactionDb
+from app.database.partitions import add_months, iter_months, month_start
+from app.database.repositories import TransactionRepository
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+async def compact_shard(dsn: URL, horizon: datetime, archive: bool) -> int:
+    engine = create_async_engine(dsn)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    compacted = 0
+    try:
+        async with session_maker() as session:
+            oldest = (await session.execute(select(func.min(TransactionDb.created_at)))).scalar_one()
+        if oldest is None or oldest >= horizon:
+            return 0
+
+        for month in iter_months(oldest, add_months(horizon, -1)):
+            async with session_maker() as session, session.begin():
+                count = await TransactionRepository(session).compact(before=add_months(month, 1), archive=archive)
+            logger.info("Compacted %s transactions of %s", count, f"{month:%Y-%m}")
+            compacted += count
+    finally:
+        await engine.dispose()
+
+    return compacted
+
+
+async def compact(settings: Settings, horizon_months: int, archive: bool) -> int:
+    horizon = add_months(month_start(datetime.now(tz=UTC)), -horizon_months)
+    compacted = 0
+    for shard, dsn in settings.shard_dsns.items():
+        logger.info("Compacting shard %s", shard)
+        compacted += await compact_shard(dsn, horizon, archive)
+    return compacted
+
+
+def main() -> None:
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--horizon-months", type=int, default=settings.compaction.horizon_months)
+    parser.add_argument("--no-archive", dest="archive", action="store_false", default=settings.compaction.archive)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(compact(settings, args.horizon_months, args.archive))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Rebuild of the ledger-wide totals.
+
+Recomputes total liabilities from ``users`` and the daily volumes from every stored transaction, in one
+database transaction per shard. Run it once after the ``ledger_totals`` and ``daily_volumes`` tables are created on
+an existing database; transactions committed meanwhile wait for it and are counted on top::
+
+    python -m app.jobs.ledger
+"""
+
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database.repositories import LedgerRepository
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+async def rebuild(settings: Settings) -> None:
+    for shard, dsn in settings.shard_dsns.items():
+        engine = create_async_engine(dsn)
+        session_maker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+        try:
+            async with session_maker() as session, session.begin():
+                await LedgerRepository(session, stripes=settings.ledger.stripes).rebuild()
+            logger.info("Rebuilt the ledger totals of shard %s", shard)
+        finally:
+            await engine.dispose()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(rebuild(Settings()))
+
+
+if __name__ == "__main__":
+    main()
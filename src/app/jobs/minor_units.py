@@ -0,0 +1,73 @@
+"""One-off conversion of money columns from ``DECIMAL`` to ``BIGINT`` minor units.
+
+Every column that is still ``NUMERIC`` is rewritten in place as ``round(value * 100)``, all in one
+database transaction per shard. The rewrite locks each table for its duration, so run it in a maintenance window
+and before ``alembic revision --autogenerate``: autogenerate would otherwise emit a plain type change
+that keeps ``12.34`` as ``12`` instead of ``1234``::
+
+    python -m app.jobs.minor_units
+"""
+
+import asyncio
+import logging
+import typing
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from app.database.models import TransactionAggregateDb, TransactionArchiveDb, TransactionDb, UserDb
+from app.settings import Settings
+from app.utils import MINOR_UNITS
+
+
+logger = logging.getLogger(__name__)
+
+MONEY_COLUMNS: typing.Final = (
+    UserDb.__table__.c.balance,
+    TransactionDb.__table__.c.amount,
+    TransactionArchiveDb.__table__.c.amount,
+    TransactionAggregateDb.__table__.c.total,
+)
+
+
+async def convert_column(conn: AsyncConnection, table: str, column: str) -> bool:
+    data_type = await conn.scalar(
+        sa.text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    )
+    if data_type != "numeric":
+        return False
+
+    await conn.execute(
+        sa.text(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE bigint USING round({column} * {10**MINOR_UNITS})::bigint"
+        )
+    )
+    return True
+
+
+async def convert(conn: AsyncConnection) -> list[str]:
+    return [
+        f"{column.table.name}.{column.name}"
+        for column in MONEY_COLUMNS
+        if await convert_column(conn, column.table.name, column.name)
+    ]
+
+
+async def main(settings: Settings) -> None:
+    for shard, dsn in settings.shard_dsns.items():
+        engine = create_async_engine(dsn)
+        try:
+            async with engine.begin() as conn:
+                converted = await convert(conn)
+            logger.info("Converted to minor units on shard %s: %s", shard, ", ".join(converted) or "none")
+        finally:
+            await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(Settings()))
@@ -0,0 +1,61 @@
+"""Standalone outbox dispatcher.
+
+Delivers committed outbox events of every shard to ``OUTBOX__FILE_PATH`` until interrupted, with
+``--dispatchers`` per shard. Any number of these can run next to the dispatchers of the app workers, they
+split the pending users between them::
+
+    python -m app.jobs.outbox --dispatchers 4
+"""
+
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.services.outbox import FileSink, OutboxDispatcher
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+async def dispatch(settings: Settings, file_path: Path, dispatchers: int) -> None:
+    engines = [create_async_engine(dsn, pool_size=dispatchers, max_overflow=0) for dsn in settings.shard_dsns.values()]
+    session_makers = [async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False) for engine in engines]
+    sink = FileSink(file_path)
+    try:
+        logger.info(
+            "Delivering outbox events to %s with %s dispatchers on each of %s shards",
+            file_path,
+            dispatchers,
+            len(engines),
+        )
+        await asyncio.gather(
+            *(
+                OutboxDispatcher.from_settings(session_maker, sink, settings).run()
+                for session_maker in session_makers
+                for _ in range(dispatchers)
+            )
+        )
+    finally:
+        for engine in engines:
+            await engine.dispose()
+
+
+def main() -> None:
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file-path", type=Path, default=settings.outbox.file_path)
+    parser.add_argument("--dispatchers", type=int, default=1)
+    args = parser.parse_args()
+    if args.file_path is None:
+        parser.error("--file-path or OUTBOX__FILE_PATH is required")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(dispatch(settings, args.file_path, args.dispatchers))
+
+
+if __name__ == "__main__":
+    main()
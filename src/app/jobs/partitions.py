@@ -0,0 +1,75 @@
+"""Partition maintenance for the ``transactions`` table.
+
+Run it periodically (e.g. daily from cron) so future months always have a partition ready. Every shard is
+maintained in turn::
+
+    python -m app.jobs.partitions            # create upcoming partitions, add BRIN indexes to old ones
+    python -m app.jobs.partitions --convert  # one-off: rebuild an existing plain table as partitioned
+    python -m app.jobs.partitions --record-uids  # after migrating: record the uids of existing transactions
+"""
+
+import argparse
+import asyncio
+import logging
+import typing
+from datetime import UTC, datetime
+
+from sqlalchemy import Table, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from app.database import partitions
+from app.database.models import TransactionArchiveDb, TransactionDb, TransactionUidDb
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+async def record_uids(conn: AsyncConnection) -> int:
+    """Record the uids of transactions added before ``transaction_uids`` existed, return how many were new."""
+    known = union_all(*(select(table.uid, table.user_id) for table in (TransactionDb, TransactionArchiveDb)))
+    query = insert(TransactionUidDb).from_select(["uid", "user_id"], known).on_conflict_do_nothing()
+    return (await conn.execute(query)).rowcount
+
+
+async def maintain(settings: Settings, convert: bool = False, record: bool = False) -> None:
+    table = typing.cast(Table, TransactionDb.__table__)
+    current = partitions.month_start(datetime.now(tz=UTC))
+
+    for shard, dsn in settings.shard_dsns.items():
+        engine = create_async_engine(dsn)
+        try:
+            async with engine.begin() as conn:
+                if convert and await partitions.convert_to_partitioned(conn, table):
+                    logger.info("Converted %s to a partitioned table on shard %s", table.name, shard)
+                if record:
+                    logger.info("Recorded %s transaction uids on shard %s", await record_uids(conn), shard)
+
+                await partitions.ensure_default_partition(conn, table.name)
+                created = await partitions.ensure_default_partition_drained(conn, table.name)
+                created += await partitions.ensure_partitions(
+                    conn, table.name, current, partitions.add_months(current, settings.partitions.months_ahead)
+                )
+                logger.info("Created partitions on shard %s: %s", shard, ", ".join(created) or "none")
+
+                indexes = await partitions.create_brin_indexes(
+                    conn, table.name, partitions.add_months(current, -settings.partitions.brin_after_months)
+                )
+                logger.info("Created BRIN indexes on shard %s: %s", shard, ", ".join(indexes) or "none")
+        finally:
+            await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--convert", action="store_true", help="convert an existing unpartitioned table first")
+    parser.add_argument("--record-uids", action="store_true", help="record the uids of existing transactions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(maintain(Settings(), convert=args.convert, record=args.record_uids))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Online rebalancing of users across shards.
+
+Records the user of every transaction uid in the first shard's directory, see ``ShardRouter``, then moves
+every user who is not on the shard the hash ring assigns them, one user per database transaction.
+Run it after changing ``SHARDING__SHARDS``, with the app workers already on the new shard list and
+``SHARDING__REBALANCING=true`` so they find users wherever they are meanwhile; switch that back off once
+it is done::
+
+    python -m app.jobs.rebalance
+    python -m app.jobs.rebalance --dry-run
+"""
+
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database.models import UserDb
+from app.database.sharding import HashRing, move_user, record_transaction_users
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+async def rebalance(settings: Settings, batch_size: int, dry_run: bool) -> int:
+    engines = {shard: create_async_engine(dsn) for shard, dsn in settings.shard_dsns.items()}
+    session_makers = {
+        shard: async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+        for shard, engine in engines.items()
+    }
+    ring = HashRing(session_makers, settings.sharding.virtual_nodes)
+    moved = 0
+    try:
+        if not dry_run:
+            recorded = await record_transaction_users(session_makers, next(iter(session_makers)), batch_size)
+            logger.info("Recorded %s transaction uids in the directory", recorded)
+        for shard, session_maker in session_makers.items():
+            last_id = ""
+            while True:
+                async with session_maker() as session:
+                    query = select(UserDb.id).where(UserDb.id > last_id).order_by(UserDb.id).limit(batch_size)
+                    user_ids = (await session.execute(query)).scalars().all()
+                if not user_ids:
+                    break
+                last_id = user_ids[-1]
+
+                for user_id in user_ids:
+                    owner = ring.node_for(user_id)
+                    if owner == shard:
+                        continue
+                    if not dry_run:
+                        await move_user(session_maker, session_makers[owner], user_id)
+                    moved += 1
+            logger.info("Checked shard %s, %s users to move so far", shard, moved)
+    finally:
+        for engine in engines.values():
+            await engine.dispose()
+
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="only count the users that would move")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    moved = asyncio.run(rebalance(Settings(), args.batch_size, args.dry_run))
+    logger.info("%s %s users", "Would move" if args.dry_run else "Moved", moved)
+
+
+if __name__ == "__main__":
+    main()
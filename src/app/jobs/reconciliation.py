@@ -0,0 +1,189 @@
+"""Incremental reconciliation of user balances against their transactions.
+
+Verifies that ``users.balance`` equals the signed sum of the user's transactions, for the users with
+transactions processed since the last run; the first run, and every run with ``--full``, checks every user.
+Batches of users are verified in parallel, each by one statement. With ``--repair`` drifted balances are set
+to their transactions' sum and the liabilities total is corrected by the difference. Every shard is checked
+in turn, against the watermark stored on it. Cheap enough to run every minute; exits with status 1 when it
+finds drift it did not repair::
+
+    python -m app.jobs.reconciliation
+    python -m app.jobs.reconciliation --repair
+    python -m app.jobs.reconciliation --full
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import logging
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import URL
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database.repositories import LedgerRepository, ReconciliationRepository
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+JOB = "reconciliation"
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Drift:
+    user_id: str
+    balance: Decimal
+    expected: Decimal
+
+
+@dataclasses.dataclass
+class ReconciliationReport:
+    checked: int = 0
+    drift: list[Drift] = dataclasses.field(default_factory=list)
+    repaired: int = 0
+
+
+async def _batches(
+    session_maker: async_sessionmaker[AsyncSessionType], since: datetime | None, batch_size: int
+) -> AsyncIterator[Sequence[str]]:
+    async with session_maker() as session:
+        repo = ReconciliationRepository(session)
+        if since is not None:
+            async for user_ids in repo.stream_touched_user_ids(since, batch_size):
+                yield user_ids
+            return
+
+        last_id = ""
+        while user_ids := await repo.get_user_ids(after=last_id, limit=batch_size):
+            last_id = user_ids[-1]
+            yield user_ids
+
+
+async def _check(
+    session_maker: async_sessionmaker[AsyncSessionType],
+    user_ids: Sequence[str],
+    report: ReconciliationReport,
+    *,
+    repair: bool,
+    stripes: int,
+) -> None:
+    async with session_maker() as session, session.begin():
+        repo = ReconciliationRepository(session)
+        drift = [Drift(*row) for row in await repo.find_drift(user_ids)]
+        report.checked += len(user_ids)
+        report.drift.extend(drift)
+        for item in drift:
+            logger.warning(
+                "Balance of user %s is %s, their transactions sum to %s", item.user_id, item.balance, item.expected
+            )
+        if not drift or not repair:
+            return
+
+        repaired = await repo.repair([item.user_id for item in drift])
+        if repaired:
+            await LedgerRepository(session, stripes).adjust_liabilities(
+                sum((balance - previous for _, previous, balance in repaired), Decimal(0))
+            )
+        report.repaired += len(repaired)
+
+
+async def reconcile_shard(  # noqa: PLR0913
+    dsn: URL,
+    report: ReconciliationReport,
+    *,
+    full: bool,
+    repair: bool,
+    batch_size: int,
+    concurrency: int,
+    overlap: float,
+    stripes: int,
+) -> datetime | None:
+    """Check the users of one shard into ``report``, return the time the scan started from, ``None`` if in full.
+
+    The shard keeps its own watermark, next to the transactions it covers.
+    """
+    # One more connection than batches checked at once, for the query listing the users.
+    engine = create_async_engine(dsn, pool_size=concurrency + 1, max_overflow=0)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    try:
+        async with session_maker() as session:
+            repo = ReconciliationRepository(session)
+            started = await repo.now()
+            watermark = None if full else await repo.get_watermark(JOB)
+        # Transactions stamp ``processed_at`` when they start, so ones running at the last watermark are
+        # committed with an older value. Re-scanning ``overlap`` seconds catches them.
+        since = None if watermark is None else watermark - timedelta(seconds=overlap)
+
+        slots = asyncio.Semaphore(concurrency)
+        async with asyncio.TaskGroup() as tasks:
+            async for user_ids in _batches(session_maker, since, batch_size):
+                await slots.acquire()
+                task = tasks.create_task(_check(session_maker, user_ids, report, repair=repair, stripes=stripes))
+                task.add_done_callback(lambda _: slots.release())
+
+        # Only a run that got through every batch moves the watermark.
+        async with session_maker() as session, session.begin():
+            await ReconciliationRepository(session).set_watermark(JOB, started)
+    finally:
+        await engine.dispose()
+    return since
+
+
+async def reconcile(  # noqa: PLR0913
+    settings: Settings, *, full: bool, repair: bool, batch_size: int, concurrency: int, overlap: float
+) -> ReconciliationReport:
+    report = ReconciliationReport()
+    for shard, dsn in settings.shard_dsns.items():
+        checked, drifted, repaired = report.checked, len(report.drift), report.repaired
+        since = await reconcile_shard(
+            dsn,
+            report,
+            full=full,
+            repair=repair,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            overlap=overlap,
+            stripes=settings.ledger.stripes,
+        )
+        logger.info(
+            "Checked %s users of shard %s %s, %s drifted, %s repaired",
+            report.checked - checked,
+            shard,
+            "in full" if since is None else f"touched since {since:%Y-%m-%d %H:%M:%S}",
+            len(report.drift) - drifted,
+            report.repaired - repaired,
+        )
+    return report
+
+
+def main() -> None:
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="check every user, not only those touched")
+    parser.add_argument("--repair", action="store_true", help="set drifted balances to their transactions' sum")
+    parser.add_argument("--batch-size", type=int, default=settings.reconciliation.batch_size)
+    parser.add_argument("--concurrency", type=int, default=settings.reconciliation.concurrency)
+    parser.add_argument("--overlap", type=float, default=settings.reconciliation.overlap)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = asyncio.run(
+        reconcile(
+            settings,
+            full=args.full,
+            repair=args.repair,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            overlap=args.overlap,
+        )
+    )
+    if len(report.drift) > report.repaired:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Logging off the event loop.
+
+The root logger gets a single ``QueueHandler``: a record is formatted into its message on the calling thread
+and put on a bounded queue, and a ``QueueListener`` thread serializes it to JSON and writes it to the handlers
+the server configured. When the writer falls behind, records are dropped and counted instead of blocking the
+event loop. Records below WARNING from high-volume loggers, e.g. ``sqlalchemy.engine`` with
+``DATABASE__ECHO``, can be sampled before they are queued.
+"""
+
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import typing
+from datetime import UTC, datetime
+
+from app.metrics import Counter
+from app.settings import Settings
+
+
+DROPPED: typing.Final = Counter("log_records_dropped_total", "Log records dropped because the log queue was full.")
+SAMPLED_OUT: typing.Final = Counter("log_records_sampled_out_total", "Log records left out by sampling.")
+
+# Attributes every record has, anything else was passed with ``extra``.
+_RECORD_ATTRIBUTES: typing.Final = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the record's ``extra`` fields next to the standard ones."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on a bounded queue without ever waiting, the records that do not fit are dropped."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is rendered here, while its arguments are as they were logged. The traceback and
+        # the JSON are formatted on the listener's thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc(level=record.levelname)
+
+
+class LogListener(logging.handlers.QueueListener):
+    """Writes the queued records with the server's handlers, remembering the formatters they came with."""
+
+    def __init__(self, records: queue.Queue[logging.LogRecord], *handlers: logging.Handler):
+        super().__init__(records, *handlers, respect_handler_level=True)
+        self.formatters = {handler: handler.formatter for handler in handlers}
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every ``1 / rate``-th record below WARNING of each sampled logger and its children."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.intervals = {name: max(round(1 / rate), 1) if rate > 0 else 0 for name, rate in rates.items()}
+        self._counters = {name: itertools.count() for name in rates}
+        self._lock = threading.Lock()
+
+    def _sampled_logger(self, name: str) -> str | None:
+        while name:
+            if name in self.intervals:
+                return name
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.intervals:
+            return True
+        sampled = self._sampled_logger(record.name)
+        if sampled is None:
+            return True
+        interval = self.intervals[sampled]
+        with self._lock:
+            keep = interval > 0 and next(self._counters[sampled]) % interval == 0
+        if not keep:
+            SAMPLED_OUT.inc(logger=sampled)
+        return keep
+
+
+def configure_logging(settings: Settings) -> LogListener | None:
+    """Route the root logger through a queue, return the started listener to stop at shutdown.
+
+    The handlers the server configured on the root logger, or a stderr handler, move behind the listener.
+    """
+    config = settings.logging
+    if settings.database.echo:
+        # ``echo=True`` would add its own handler writing to stdout on the calling thread.
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+    if not config.queue:
+        return None
+
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, DroppingQueueHandler)]
+    if not handlers:
+        handlers = [logging.StreamHandler(sys.stderr)]
+    records: queue.Queue[logging.LogRecord] = queue.Queue(config.queue_size)
+    listener = LogListener(records, *handlers)
+    if config.json_format:
+        for handler in handlers:
+            handler.setFormatter(JsonFormatter())
+
+    queue_handler = DroppingQueueHandler(records)
+    if config.sampling:
+        queue_handler.addFilter(SamplingFilter(config.sampling))
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener: LogListener | None) -> None:
+    """Write out the queued records and give the root logger its handlers back, with their own formatters."""
+    if listener is None:
+        return
+    while True:
+        try:
+            listener.stop()
+            break
+        except queue.Full:
+            # The end-of-queue marker does not fit yet, the listener is still writing.
+            time.sleep(0.01)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        handler.setFormatter(listener.formatters[handler])
+        root.addHandler(handler)
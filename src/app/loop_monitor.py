@@ -0,0 +1,123 @@
+"""Event loop lag and blocking callback monitor.
+
+A heartbeat task sleeps ``interval`` seconds at a time and measures how much later than that it wakes up:
+the event loop's scheduling lag, which every request on the worker waits for too. A watchdog thread checks
+the heartbeat. When the loop has not come back for ``threshold`` seconds past the interval, the watchdog
+captures the loop thread's stack, which shows the call blocking it, e.g. synchronous I/O or heavy
+``Decimal`` or Pydantic work. Works the same under uvloop.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import logging
+import statistics
+import sys
+import threading
+import time
+import traceback
+import typing
+
+from app.metrics import Counter, Gauge, Histogram
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+LAG: typing.Final = Histogram(
+    "event_loop_lag_seconds",
+    "How much later than scheduled the event loop ran the monitor's heartbeat.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LAG_QUANTILES: typing.Final = Gauge(
+    "event_loop_lag_quantile_seconds", "Event loop lag percentiles over the monitor's latest measurements."
+)
+SLOW_CALLBACKS: typing.Final = Counter(
+    "event_loop_slow_callbacks_total", "Times the event loop was blocked for longer than the threshold."
+)
+
+QUANTILES: typing.Final = (0.5, 0.9, 0.99)
+STACK_LIMIT: typing.Final = 40
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class SlowCallback:
+    duration: float
+    stack: str
+
+
+class LoopMonitor:
+    """Measures the running loop's lag and records the stacks of callbacks blocking it.
+
+    Either run ``run()`` as a task, or use the monitor as an async context manager around the code to watch.
+    """
+
+    def __init__(self, interval: float, threshold: float, window: int = 600, history: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: collections.deque[float] = collections.deque(maxlen=window)
+        self.slow_callbacks: collections.deque[SlowCallback] = collections.deque(maxlen=history)
+        self._beat = time.monotonic()
+        self._stack: str | None = None
+        self._stop = threading.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LoopMonitor | None":
+        event_loop = settings.event_loop
+        if not event_loop.monitor:
+            return None
+        return cls(event_loop.interval, event_loop.threshold, event_loop.window)
+
+    async def __aenter__(self) -> typing.Self:
+        self._task = asyncio.create_task(self.run())
+        # Let the heartbeat take its first beat before the watched code runs.
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def run(self) -> None:
+        loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._beat = time.monotonic()
+        watchdog = threading.Thread(target=self._watch, args=(loop_thread,), name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                scheduled = time.monotonic()
+                await asyncio.sleep(self.interval)
+                self._beat = time.monotonic()
+                self._record(max(0.0, self._beat - scheduled - self.interval))
+        finally:
+            self._stop.set()
+            watchdog.join()
+
+    def _record(self, lag: float) -> None:
+        LAG.observe(lag)
+        self.lags.append(lag)
+        if len(self.lags) > 1:
+            cuts = statistics.quantiles(self.lags, n=100, method="inclusive")
+            for q in QUANTILES:
+                LAG_QUANTILES.set(cuts[round(q * 100) - 1], quantile=str(q))
+
+        stack, self._stack = self._stack, None
+        if stack is not None:
+            SLOW_CALLBACKS.inc()
+            self.slow_callbacks.append(SlowCallback(lag, stack))
+            logger.warning("Event loop was blocked for %.3f s by:\n%s", lag, stack)
+
+    def _watch(self, loop_thread: int) -> None:
+        # Checks often enough to catch the loop while it is still blocked, at most once per heartbeat.
+        beat_seen = None
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            if beat == beat_seen or time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(loop_thread)  # noqa: SLF001
+            if frame is not None:
+                self._stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+                beat_seen = beat
@@ -0,0 +1,173 @@
+import bisect
+import math
+import typing
+from collections.abc import Callable, Iterable
+
+
+DEFAULT_BUCKETS: typing.Final = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    body = ",".join(f'{name}="{value}"' for name, value in key)
+    return f"{{{body}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type_: typing.ClassVar[str] = "untyped"
+
+    def __init__(self, name: str, documentation: str, registry: "Registry | None" = None):
+        self.name = name
+        self.documentation = documentation
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def samples(self) -> Iterable[tuple[str, LabelKey, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_ = "counter"
+
+    def __init__(self, name: str, documentation: str, registry: "Registry | None" = None):
+        super().__init__(name, documentation, registry)
+        self._values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Iterable[tuple[str, LabelKey, float]]:
+        return ((self.name, key, value) for key, value in self._values.items())
+
+
+class Gauge(Metric):
+    """A value that goes up and down, either set explicitly or read from ``callback`` at render time."""
+
+    type_ = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        registry: "Registry | None" = None,
+        callback: Callable[[], float] | None = None,
+    ):
+        super().__init__(name, documentation, registry)
+        self._values: dict[LabelKey, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        if self.callback is not None and not labels:
+            return self.callback()
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Iterable[tuple[str, LabelKey, float]]:
+        if self.callback is not None:
+            return [(self.name, (), self.callback())]
+        return ((self.name, key, value) for key, value in self._values.items())
+
+
+class Histogram(Metric):
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        registry: "Registry | None" = None,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, registry)
+        self.buckets = (*sorted(buckets), math.inf)
+        self._counts: dict[LabelKey, list[int]] = {}
+        self._sums: dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(_label_key(labels), ()))
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Estimate the ``q`` quantile by linear interpolation inside the matching bucket."""
+        counts = self._counts.get(_label_key(labels))
+        if not counts:
+            return math.nan
+        rank = q * sum(counts)
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-2]
+
+    def samples(self) -> Iterable[tuple[str, LabelKey, float]]:
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", (*key, ("le", _format_value(bucket))), cumulative
+            yield f"{self.name}_sum", key, self._sums[key]
+            yield f"{self.name}_count", key, cumulative
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            msg = f"Metric {metric.name} is already registered"
+            raise ValueError(msg)
+        self._metrics[metric.name] = metric
+
+    def unregister(self, metric: Metric) -> None:
+        self._metrics.pop(metric.name, None)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY: typing.Final = Registry()
@@ -0,0 +1,102 @@
+"""Profiling a live worker with the standard library only.
+
+``StackSampler`` reads the event loop thread's stack from a helper thread every few milliseconds and counts
+the stacks it sees, in the collapsed format flame graph tools read (``outer;inner count``). Nothing runs
+while no profile is being taken.
+"""
+
+import collections
+import contextlib
+import cProfile
+import marshal
+import sys
+import threading
+import typing
+from collections.abc import Iterator
+from pathlib import Path
+from types import CodeType, FrameType
+
+from app.exceptions import ProfilerBusyError
+
+
+_PROFILING: typing.Final = threading.Lock()
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the stacks of thread ``thread_id``, sampled every ``interval`` seconds.
+
+    With ``within`` only stacks running that code object are counted, e.g. one route's endpoint.
+    """
+
+    def __init__(self, thread_id: int, interval: float, within: CodeType | None = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.within = within
+        self.samples = 0
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def __enter__(self) -> typing.Self:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            if frame is not None:
+                self.sample(frame)
+
+    def sample(self, frame: FrameType | None) -> None:
+        names = []
+        found = self.within is None
+        while frame is not None:
+            names.append(_frame_name(frame))
+            found = found or frame.f_code is self.within
+            frame = frame.f_back
+        if found:
+            self.samples += 1
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+@contextlib.contextmanager
+def exclusive() -> Iterator[None]:
+    """Hold the worker's only profiling slot: profiles taken at once would each see the other's overhead."""
+    if not _PROFILING.acquire(blocking=False):
+        raise ProfilerBusyError
+    try:
+        yield
+    finally:
+        _PROFILING.release()
+
+
+@contextlib.contextmanager
+def profiled(profile: cProfile.Profile) -> Iterator[None]:
+    """Profile the calling thread, which for an endpoint is everything the event loop runs."""
+    try:
+        profile.enable()
+    except ValueError as e:
+        # Another profiler, e.g. a debugger or coverage, holds the thread.
+        raise ProfilerBusyError(str(e)) from e
+    try:
+        yield
+    finally:
+        profile.disable()
+
+
+def pstats_dump(profile: cProfile.Profile) -> bytes:
+    """Return the bytes ``Profile.dump_stats`` writes, which ``pstats.Stats`` and snakeviz read."""
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from typing import Annotated
 
@@ -6,7 +6,7 @@ import pydantic
 from pydantic import AfterValidator, BaseModel, Field
 
 from app.utils import timezone_validator
-from .types import TransactionType
+from .types import ReportKind, ReportStatus, TransactionType, UserCreationStatus
 
 
 class Base(BaseModel):
@@ -23,10 +23,18 @@ class UserCreate(Base):
     name: str
 
 
+class UserCreationResult(Base):
+    index: int = Field(description="Position of the item in the request")
+    id: str | None = Field(default=None, description="User ID, missing for items without one")
+    status: UserCreationStatus = Field(description="Whether the user was created, already existed or is invalid")
+    detail: str | None = Field(default=None, description="Why the item is invalid")
+
+
 class UserBalance(Base):
     user_id: str = Field(description="User ID")
     balance: Decimal = Field(description="User balance")
     ts: datetime | None = Field(exclude=True, default=None, description="Timestamp")
+    version: int | None = Field(exclude=True, default=None, description="User's balance version, for current balances")
 
 
 class Transaction(Base):
@@ -43,3 +51,72 @@ class TransactionAdd(Base):
     amount: Decimal = Field(description="Transaction amount", gt=0)
     created_at: Annotated[datetime, AfterValidator(timezone_validator)] = Field(description="Transaction created at")
     type: TransactionType = Field(description="Transaction type")
+
+
+class TransferAdd(Base):
+    uid: str = Field(description="Transfer UID")
+    from_user_id: str = Field(description="ID of the user the amount is withdrawn from")
+    to_user_id: str = Field(description="ID of the user the amount is deposited to")
+    amount: Decimal = Field(description="Transfer amount", gt=0)
+    created_at: Annotated[datetime, AfterValidator(timezone_validator)] = Field(description="Transfer created at")
+
+    @pydantic.model_validator(mode="after")
+    def check_users_differ(self) -> "TransferAdd":
+        if self.from_user_id == self.to_user_id:
+            msg = "A user cannot transfer to themselves"
+            raise ValueError(msg)
+        return self
+
+
+class Transfer(Base):
+    uid: str = Field(description="Transfer UID")
+    withdrawal: Transaction = Field(description="Transaction withdrawing the amount from the sender")
+    deposit: Transaction = Field(description="Transaction depositing the amount to the recipient")
+
+
+class Liabilities(Base):
+    total: Decimal = Field(description="Sum of all user balances")
+
+
+class DailyVolume(Base):
+    day: date = Field(description="UTC date")
+    type: TransactionType = Field(description="Transaction type")
+    amount: Decimal = Field(description="Total amount of the day's transactions of this type")
+    transactions_count: int = Field(description="Number of the day's transactions of this type")
+
+
+class ReportCreate(Base):
+    kind: ReportKind = Field(description="A user's statement, or every user's balances at points in time")
+    user_id: str | None = Field(default=None, description="User whose statement to generate")
+    after: Annotated[datetime, AfterValidator(timezone_validator)] | None = Field(
+        default=None, description="Start of the statement, inclusive"
+    )
+    before: Annotated[datetime, AfterValidator(timezone_validator)] | None = Field(
+        default=None, description="End of the statement, inclusive"
+    )
+    at: list[Annotated[datetime, AfterValidator(timezone_validator)]] = Field(
+        default=[], max_length=1000, description="Points in time of the balances"
+    )
+
+    @pydantic.model_validator(mode="after")
+    def check_parameters(self) -> "ReportCreate":
+        if self.kind == ReportKind.STATEMENT and self.user_id is None:
+            msg = "A statement needs a user_id"
+            raise ValueError(msg)
+        if self.kind == ReportKind.BALANCES and not self.at:
+            msg = "Balances need at least one point in time in at"
+            raise ValueError(msg)
+        return self
+
+
+class Report(Base):
+    id: str = Field(description="Report ID")
+    tenant: str = Field(description="Tenant that requested the report")
+    request: ReportCreate = Field(description="What the report contains")
+    status: ReportStatus = Field(description="Whether the report is queued, running, done or failed")
+    progress: float = Field(default=0.0, description="Share of the report's work done, from 0 to 1")
+    created_at: datetime = Field(description="Report requested at")
+    started_at: datetime | None = Field(default=None, description="Report started running at")
+    finished_at: datetime | None = Field(default=None, description="Report done or failed at")
+    size: int | None = Field(default=None, description="Size of the CSV file in bytes, once done")
+    error: str | None = Field(default=None, description="Why the report failed")
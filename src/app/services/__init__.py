@@ -1,8 +1,12 @@
+from .ledger_service import LedgerService, ShardedLedgerService
 from .transaction_service import TransactionService
-from .user_service import UserService
+from .user_service import ShardedUserService, UserService
 
 
 __all__ = [
+    "LedgerService",
+    "ShardedLedgerService",
+    "ShardedUserService",
     "TransactionService",
     "UserService",
 ]
@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import json
+import logging
+import typing
+from collections.abc import AsyncIterator
+from decimal import Decimal
+
+import asyncpg
+
+from app.database.repositories.user_repository import BALANCE_CHANNEL
+from app.metrics import Counter, Gauge
+from app.schemas import UserBalance
+from app.utils import from_minor_units
+
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBERS: typing.Final = Gauge("balance_stream_subscribers", "Open balance update streams.")
+DROPPED: typing.Final = Counter(
+    "balance_stream_dropped_total", "Balance updates dropped because a subscriber's buffer was full."
+)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class BalanceUpdate:
+    user_id: str
+    balance: Decimal
+    version: int
+
+
+class Subscription:
+    """Updates for one stream, the oldest are dropped once ``buffer_size`` are waiting."""
+
+    __slots__ = ("_event", "_updates", "closed", "user_id")
+
+    def __init__(self, user_id: str, buffer_size: int):
+        self.user_id = user_id
+        self.closed = False
+        self._updates: collections.deque[BalanceUpdate] = collections.deque(maxlen=buffer_size)
+        self._event = asyncio.Event()
+
+    def push(self, update: BalanceUpdate) -> None:
+        if len(self._updates) == self._updates.maxlen:
+            DROPPED.inc()
+        self._updates.append(update)
+        self._event.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._event.set()
+
+    async def get(self, max_wait: float) -> BalanceUpdate | None:
+        """Return the next update, or ``None`` when ``max_wait`` passes first or the subscription is closed."""
+        if not self._updates and not self.closed:
+            self._event.clear()
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(max_wait):
+                    await self._event.wait()
+        return self._updates.popleft() if self._updates else None
+
+
+class BalanceSubscriptions:
+    """In-process registry fanning balance updates out to the streams of their user."""
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._subscriptions: dict[str, set[Subscription]] = {}
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.buffer_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.remove(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+        SUBSCRIBERS.dec()
+
+    def publish(self, update: BalanceUpdate) -> None:
+        for subscription in self._subscriptions.get(update.user_id, ()):
+            subscription.push(update)
+
+    def close_all(self) -> None:
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+
+
+class BalanceListener:
+    """Holds the worker's ``LISTEN`` connection and publishes every notification to ``subscriptions``.
+
+    When the connection is lost every stream is closed, since updates may have been missed; SSE clients
+    reconnect on their own and start again from the current balance.
+    """
+
+    def __init__(self, dsn: str, subscriptions: BalanceSubscriptions, reconnect_delay: float):
+        self.dsn = dsn
+        self.subscriptions = subscriptions
+        self.reconnect_delay = reconnect_delay
+        self.listening = asyncio.Event()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+            except (OSError, asyncpg.PostgresError):
+                logger.exception("Could not open the balance updates connection")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            terminated = asyncio.Event()
+            connection.add_termination_listener(lambda _, terminated=terminated: terminated.set())
+            try:
+                await connection.add_listener(BALANCE_CHANNEL, self._on_notification)
+                self.listening.set()
+                await terminated.wait()
+                logger.warning("Balance updates connection lost")
+            finally:
+                self.listening.clear()
+                self.subscriptions.close_all()
+                await connection.close(timeout=self.reconnect_delay)
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _on_notification(self, _connection: object, _pid: int, _channel: str, payload: object) -> None:
+        try:
+            data = json.loads(str(payload))
+            update = BalanceUpdate(data["user_id"], from_minor_units(data["balance"]), data["version"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Malformed balance update: %s", payload)
+            return
+        self.subscriptions.publish(update)
+
+
+async def balance_events(
+    subscriptions: BalanceSubscriptions, subscription: Subscription, initial: BalanceUpdate, heartbeat: float
+) -> AsyncIterator[str]:
+    """Server-sent events: the current balance, then every newer one, with comments as keep-alives."""
+    try:
+        version = -1
+        update: BalanceUpdate | None = initial
+        while not subscription.closed:
+            if update is None:
+                yield ": keep-alive\n\n"
+            elif update.version > version:
+                # Notifications can arrive after a read that already saw them.
+                version = update.version
+                data = UserBalance(user_id=update.user_id, balance=update.balance).model_dump_json()
+                yield f"event: balance\nid: {version}\ndata: {data}\n\n"
+            update = await subscription.get(heartbeat)
+    finally:
+        subscriptions.unsubscribe(subscription)
@@ -0,0 +1,53 @@
+"""Replays of ``PUT /api/transaction/`` retries.
+
+A client that lost the response to a transaction it added sends the same request again. The transaction's
+row is the durable record of the first attempt: a retry carrying the same payload gets that transaction back
+instead of a conflict, one carrying a different payload under the same uid still conflicts.
+``TransactionReplays`` keeps the latest transactions of the worker so that retries, which mostly follow the
+first attempt closely, are answered without a query.
+"""
+
+import collections
+import typing
+from datetime import UTC
+
+from app import schemas
+from app.metrics import Counter
+from app.types import TransactionType
+from app.utils import to_minor_units
+
+
+REPLAYS: typing.Final = Counter("idempotent_replays_total", "Retried transactions answered with the first response.")
+
+Fingerprint: typing.TypeAlias = tuple[str, TransactionType, int, float]
+
+
+def fingerprint(transaction: schemas.TransactionAdd | schemas.Transaction) -> Fingerprint:
+    """Return what a retry must repeat to be the same transaction: everything but the uid, normalized."""
+    created_at = transaction.created_at.astimezone(UTC).timestamp()
+    return transaction.user_id, transaction.type, to_minor_units(transaction.amount), created_at
+
+
+class TransactionReplays:
+    """The latest ``max_size`` transactions added on the worker, least recently used first out."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._transactions: collections.OrderedDict[str, schemas.Transaction] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def get(self, uid: str) -> schemas.Transaction | None:
+        transaction = self._transactions.get(uid)
+        if transaction is not None:
+            self._transactions.move_to_end(uid)
+        return transaction
+
+    def remember(self, transaction: schemas.Transaction) -> None:
+        if self.max_size <= 0:
+            return
+        self._transactions[transaction.uid] = transaction
+        self._transactions.move_to_end(transaction.uid)
+        if len(self._transactions) > self.max_size:
+            self._transactions.popitem(last=False)
@@ -0,0 +1,63 @@
+import asyncio
+import heapq
+import itertools
+from collections.abc import Sequence
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.database.repositories import LedgerRepository, UserRepository
+from app.schemas import DailyVolume, Liabilities, UserBalance
+from app.types import TransactionType
+
+
+class LedgerService:
+    def __init__(self, ledger_repo: LedgerRepository, user_repo: UserRepository, db_session: AsyncSessionType):
+        self.ledger_repo = ledger_repo
+        self.user_repo = user_repo
+        self.db_session = db_session
+
+    async def get_liabilities(self) -> Liabilities:
+        return Liabilities(total=await self.ledger_repo.get_liabilities())
+
+    async def get_daily_volumes(self, day: date) -> list[DailyVolume]:
+        volumes = {
+            row.type: DailyVolume(day=day, type=row.type, amount=row.amount, transactions_count=row.transactions_count)
+            for row in await self.ledger_repo.get_daily_volumes(day)
+        }
+        return [
+            volumes.get(type_, DailyVolume(day=day, type=type_, amount=Decimal(0), transactions_count=0))
+            for type_ in TransactionType
+        ]
+
+    async def get_top_users(self, limit: int) -> list[UserBalance]:
+        users = await self.user_repo.get_top_by_balance(limit)
+        return [UserBalance(user_id=user.id, balance=user.balance) for user in users]
+
+
+class ShardedLedgerService:
+    """Ledger-wide values over every shard, each shard keeps the totals of the transactions stored on it."""
+
+    def __init__(self, services: Sequence[LedgerService]):
+        self.services = services
+
+    async def get_liabilities(self) -> Liabilities:
+        totals = await asyncio.gather(*(service.get_liabilities() for service in self.services))
+        return Liabilities(total=sum((total.total for total in totals), Decimal(0)))
+
+    async def get_daily_volumes(self, day: date) -> list[DailyVolume]:
+        shard_volumes = await asyncio.gather(*(service.get_daily_volumes(day) for service in self.services))
+        return [
+            DailyVolume(
+                day=day,
+                type=volumes[0].type,
+                amount=sum((volume.amount for volume in volumes), Decimal(0)),
+                transactions_count=sum(volume.transactions_count for volume in volumes),
+            )
+            for volumes in zip(*shard_volumes, strict=True)
+        ]
+
+    async def get_top_users(self, limit: int) -> list[UserBalance]:
+        shard_users = await asyncio.gather(*(service.get_top_users(limit) for service in self.services))
+        return heapq.nlargest(limit, itertools.chain.from_iterable(shard_users), key=lambda user: user.balance)
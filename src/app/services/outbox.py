@@ -0,0 +1,159 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import time
+import typing
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.models import OutboxDb
+from app.database.repositories import OutboxRepository
+from app.metrics import Counter, Histogram
+from app.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_ADDED: typing.Final = "transaction.added"
+
+DELIVERED: typing.Final = Counter("outbox_delivered_total", "Outbox events handed to the sink.")
+FAILURES: typing.Final = Counter("outbox_delivery_failures_total", "Outbox batches that failed and will be retried.")
+LAG: typing.Final = Histogram(
+    "outbox_lag_seconds",
+    "Time from the transaction that wrote an outbox event to its delivery.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+BATCH_SECONDS: typing.Final = Histogram("outbox_batch_seconds", "Time to claim, deliver and delete an outbox batch.")
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class OutboxEvent:
+    id: int
+    user_id: str
+    event_type: str
+    payload: dict[str, typing.Any]
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row: OutboxDb) -> "OutboxEvent":
+        return cls(row.id, row.user_id, row.event_type, row.payload, row.created_at)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "id": self.id,
+                "user_id": self.user_id,
+                "event_type": self.event_type,
+                "payload": self.payload,
+                "created_at": self.created_at.isoformat(),
+            }
+        )
+
+
+class OutboxSink(typing.Protocol):
+    """Where events go. Delivery is at least once: a batch is redelivered if it fails or the dispatcher dies."""
+
+    async def deliver(self, events: Sequence[OutboxEvent]) -> None: ...
+
+
+class MemorySink:
+    """Keeps the events in process, for tests and in-process consumers."""
+
+    def __init__(self) -> None:
+        self.events: list[OutboxEvent] = []
+
+    async def deliver(self, events: Sequence[OutboxEvent]) -> None:
+        self.events.extend(events)
+
+
+class FileSink:
+    """Appends one JSON line per event and syncs the file before the batch counts as delivered."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    async def deliver(self, events: Sequence[OutboxEvent]) -> None:
+        await asyncio.to_thread(self._write, "".join(f"{event.to_json()}\n" for event in events))
+
+    def _write(self, data: str) -> None:
+        with self.path.open("a", encoding="utf-8") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class OutboxDispatcher:
+    """Moves committed outbox events to ``sink`` in batches and deletes them once delivered.
+
+    Any number of dispatchers, in one process or many, can run against the same database: each batch is
+    claimed with ``FOR UPDATE SKIP LOCKED`` so they split the pending users between them.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        session_maker: async_sessionmaker[AsyncSessionType],
+        sink: OutboxSink,
+        *,
+        batch_size: int,
+        max_users: int,
+        poll_interval: float,
+        retry_delay: float,
+    ):
+        self.session_maker = session_maker
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_users = max_users
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+
+    @classmethod
+    def from_settings(
+        cls, session_maker: async_sessionmaker[AsyncSessionType], sink: OutboxSink, settings: Settings
+    ) -> "OutboxDispatcher":
+        outbox = settings.outbox
+        return cls(
+            session_maker,
+            sink,
+            batch_size=outbox.batch_size,
+            max_users=outbox.max_users,
+            poll_interval=outbox.poll_interval,
+            retry_delay=outbox.retry_delay,
+        )
+
+    async def dispatch_batch(self) -> int:
+        """Deliver one batch, return the number of events delivered."""
+        started = time.perf_counter()
+        async with self.session_maker() as db_session, db_session.begin():
+            outbox_repo = OutboxRepository(db_session)
+            events = [OutboxEvent.from_row(row) for row in await outbox_repo.claim(self.max_users, self.batch_size)]
+            if not events:
+                return 0
+            await self.sink.deliver(events)
+            # A crash between delivery and this commit delivers the batch again, never loses it.
+            await outbox_repo.delete([event.id for event in events])
+
+        now = datetime.now(UTC)
+        for event in events:
+            LAG.observe((now - event.created_at).total_seconds())
+        DELIVERED.inc(len(events))
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+        return len(events)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                delivered = await self.dispatch_batch()
+            except Exception:
+                FAILURES.inc()
+                logger.exception("Outbox delivery failed, retrying in %s s", self.retry_delay)
+                await asyncio.sleep(self.retry_delay)
+                continue
+            # A full batch means more are likely waiting.
+            if delivered < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,280 @@
+"""Report jobs run in worker processes, away from the event loop and the request pools.
+
+A report's state is a JSON file next to its CSV file in ``REPORTS__DIRECTORY``. The worker that accepts a report
+writes it as queued, the process running it writes its progress and outcome. Any worker of the host can therefore
+answer for any report, while each worker limits the reports it has accepted itself.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import logging
+import multiprocessing
+import os
+import time
+import typing
+import uuid
+from collections.abc import Callable, Coroutine
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import schemas
+from app.database.models import UserDb
+from app.database.repositories import TransactionRepository
+from app.exceptions import ReportNotFoundError, ServiceOverloadedError, TooManyReportsError, UserNotFoundError
+from app.jobs.balances import compute_balances
+from app.metrics import Counter, Gauge
+from app.settings import Settings
+from app.types import ReportKind, ReportStatus, TransactionType
+
+
+logger = logging.getLogger(__name__)
+
+REPORTS_FINISHED: typing.Final = Counter("reports_finished_total", "Reports accepted by this worker that finished.")
+REPORTS_IN_PROGRESS: typing.Final = Gauge("reports_in_progress", "Reports accepted by this worker, queued or running.")
+
+_FINISHED: typing.Final = (ReportStatus.DONE, ReportStatus.FAILED)
+
+
+def report_path(directory: Path, report_id: str) -> Path:
+    return directory / f"{report_id}.csv"
+
+
+def _state_path(directory: Path, report_id: str) -> Path:
+    return directory / f"{report_id}.json"
+
+
+def save_report(directory: Path, report: schemas.Report) -> None:
+    # Written aside and renamed, so readers never see half a state.
+    path = _state_path(directory, report.id)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.write_text(report.model_dump_json(), encoding="utf-8")
+    temporary.replace(path)
+
+
+def load_report(directory: Path, report_id: str) -> schemas.Report | None:
+    try:
+        return schemas.Report.model_validate_json(_state_path(directory, report_id).read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+class _Progress:
+    """Saves the share of ``total`` done, at most every ``interval`` seconds."""
+
+    def __init__(self, directory: Path, report: schemas.Report, interval: float):
+        self.directory = directory
+        self.report = report
+        self.interval = interval
+        self.total = 0
+        self._saved = time.monotonic()
+
+    def __call__(self, done: int) -> None:
+        now = time.monotonic()
+        if self.total and now - self._saved >= self.interval:
+            self.report.progress = min(done / self.total, 1.0)
+            save_report(self.directory, self.report)
+            self._saved = now
+
+
+async def _statement(
+    settings: Settings, request: schemas.ReportCreate, output: typing.TextIO, progress: _Progress
+) -> None:
+    user_id = typing.cast(str, request.user_id)
+    opening_at = request.after - timedelta(microseconds=1) if request.after is not None else None
+    for dsn in settings.shard_dsns.values():
+        engine = create_async_engine(dsn, pool_size=1, max_overflow=0)
+        try:
+            async with async_sessionmaker(bind=engine)() as session:
+                if await session.get(UserDb, user_id) is None:
+                    continue
+                repo = TransactionRepository(session)
+                progress.total = await repo.count_statement(user_id, request.after, request.before)
+                balance = await repo.get_total_sum(user_id, before=opening_at) if opening_at is not None else 0
+                writer = csv.writer(output)
+                writer.writerow(["uid", "type", "amount", "created_at", "balance"])
+                done = 0
+                async for uid, type_, amount, created_at in repo.stream_statement(
+                    user_id, request.after, request.before
+                ):
+                    balance += -amount if type_ is TransactionType.WITHDRAW else amount
+                    writer.writerow(
+                        [uid or "", type_.value if type_ else "COMPACTED", amount, created_at.isoformat(), balance]
+                    )
+                    done += 1
+                    progress(done)
+                return
+        finally:
+            await engine.dispose()
+    raise UserNotFoundError
+
+
+async def _balances(
+    settings: Settings, request: schemas.ReportCreate, output: typing.TextIO, progress: _Progress
+) -> None:
+    dsns = list(settings.shard_dsns.values())
+    users = []
+    for dsn in dsns:
+        engine = create_async_engine(dsn, pool_size=1, max_overflow=0)
+        try:
+            async with async_sessionmaker(bind=engine)() as session:
+                users.append((await session.execute(select(func.count()).select_from(UserDb))).scalar_one())
+        finally:
+            await engine.dispose()
+    progress.total = sum(users)
+
+    done = 0
+    for index, dsn in enumerate(dsns):
+
+        def shard_progress(users_done: int, offset: int = done) -> None:
+            progress(offset + users_done)
+
+        await compute_balances(
+            dsn, request.at, output, chunk_size=settings.reports.chunk_size, header=index == 0, progress=shard_progress
+        )
+        done += users[index]
+
+
+_GENERATORS: typing.Final[
+    dict[ReportKind, Callable[[Settings, schemas.ReportCreate, typing.TextIO, _Progress], Coroutine[None, None, None]]]
+] = {ReportKind.STATEMENT: _statement, ReportKind.BALANCES: _balances}
+
+
+def run_report(settings: Settings, report: schemas.Report) -> None:
+    """Generate ``report`` and save its file and state, in a worker process."""
+    directory = settings.reports.directory
+    report.status = ReportStatus.RUNNING
+    report.started_at = datetime.now(UTC)
+    save_report(directory, report)
+
+    path = report_path(directory, report.id)
+    partial = path.with_suffix(".csv.part")
+    progress = _Progress(directory, report, settings.reports.progress_interval)
+    try:
+        with partial.open("w", newline="", encoding="utf-8") as output:
+            asyncio.run(_GENERATORS[report.request.kind](settings, report.request, output, progress))
+        partial.replace(path)
+    except Exception as e:
+        logger.exception("Report %s failed", report.id)
+        partial.unlink(missing_ok=True)
+        report.status = ReportStatus.FAILED
+        report.error = str(e)
+    else:
+        report.status = ReportStatus.DONE
+        report.progress = 1.0
+        report.size = path.stat().st_size
+    report.finished_at = datetime.now(UTC)
+    save_report(directory, report)
+
+
+class ReportRunner:
+    """Queues reports onto a pool of ``REPORTS__PROCESSES`` worker processes.
+
+    At most ``max_jobs`` reports are queued or running at a time, at most ``tenant_jobs`` of them per tenant.
+    """
+
+    def __init__(self, settings: Settings, executor: concurrent.futures.Executor | None = None):
+        self.settings = settings
+        self.directory = settings.reports.directory
+        self.max_jobs = settings.reports.max_jobs
+        self.tenant_jobs = settings.reports.tenant_jobs
+        self.retention = timedelta(hours=settings.reports.retention_hours)
+        self._executor = executor
+        self._in_progress: collections.Counter[str] = collections.Counter()
+        self._futures: dict[str, concurrent.futures.Future[None]] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._executor is None:
+            # Spawned, not forked: a fork would copy the worker's event loop and open connections.
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.settings.reports.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.settings.reports.tasks_per_process,
+            )
+
+    async def close(self) -> None:
+        """Stop taking reports; those still queued fail, running ones finish in their processes."""
+        # Their tasks end with the cancelled futures.
+        cancelled = [report_id for report_id, future in self._futures.items() if future.cancel()]
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        for report_id in cancelled:
+            report = await asyncio.to_thread(load_report, self.directory, report_id)
+            if report is not None:
+                report.status = ReportStatus.FAILED
+                report.error = "The worker shut down before the report started."
+                report.finished_at = datetime.now(UTC)
+                await asyncio.to_thread(save_report, self.directory, report)
+
+    async def submit(self, tenant: str, request: schemas.ReportCreate) -> schemas.Report:
+        if self._in_progress[tenant] >= self.tenant_jobs:
+            raise TooManyReportsError
+        if self._in_progress.total() >= self.max_jobs:
+            raise ServiceOverloadedError(self.settings.admission.retry_after)
+        if self._executor is None:
+            msg = "The report runner is not started"
+            raise RuntimeError(msg)
+
+        await asyncio.to_thread(self.purge)
+        report = schemas.Report(
+            id=uuid.uuid4().hex,
+            tenant=tenant,
+            request=request,
+            status=ReportStatus.QUEUED,
+            created_at=datetime.now(UTC),
+        )
+        await asyncio.to_thread(save_report, self.directory, report)
+        self._in_progress[tenant] += 1
+        REPORTS_IN_PROGRESS.inc()
+        future = self._executor.submit(run_report, self.settings, report)
+        self._futures[report.id] = future
+        task = asyncio.create_task(self._wait(report, future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return report
+
+    async def _wait(self, report: schemas.Report, future: concurrent.futures.Future[None]) -> None:
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The process died, e.g. killed for its memory, so it could not record the failure itself.
+            logger.exception("Report %s failed in its process", report.id)
+            report.status = ReportStatus.FAILED
+            report.error = str(e) or type(e).__name__
+            report.finished_at = datetime.now(UTC)
+            await asyncio.to_thread(save_report, self.directory, report)
+        finally:
+            del self._futures[report.id]
+            self._in_progress[report.tenant] -= 1
+            if not self._in_progress[report.tenant]:
+                del self._in_progress[report.tenant]
+            REPORTS_IN_PROGRESS.dec()
+
+        finished = await asyncio.to_thread(load_report, self.directory, report.id)
+        REPORTS_FINISHED.inc(status=(finished or report).status.value)
+
+    async def get(self, tenant: str, report_id: str) -> schemas.Report:
+        report = await asyncio.to_thread(load_report, self.directory, report_id)
+        # Other tenants' reports do not exist for the caller.
+        if report is None or report.tenant != tenant:
+            raise ReportNotFoundError
+        return report
+
+    def purge(self) -> None:
+        """Delete the reports that finished more than ``REPORTS__RETENTION_HOURS`` ago."""
+        expired = datetime.now(UTC) - self.retention
+        for path in self.directory.glob("*.json"):
+            with contextlib.suppress(FileNotFoundError, ValueError):
+                report = schemas.Report.model_validate_json(path.read_bytes())
+                if report.status in _FINISHED and report.finished_at is not None and report.finished_at < expired:
+                    report_path(self.directory, report.id).unlink(missing_ok=True)
+                    path.unlink(missing_ok=True)
@@ -0,0 +1,80 @@
+import asyncio
+import typing
+from collections.abc import Awaitable, Callable, Hashable
+
+from app.deadlines import time_left
+from app.exceptions import DeadlineExceededError
+from app.metrics import Counter, Gauge
+
+
+T = typing.TypeVar("T")
+
+CALLS: typing.Final = Counter("single_flight_calls_total", "Calls of coalesced service reads.")
+COALESCED: typing.Final = Counter(
+    "single_flight_coalesced_total", "Calls of coalesced service reads answered by another caller's query."
+)
+COALESCING_RATIO: typing.Final = Gauge(
+    "single_flight_coalescing_ratio", "Share of coalesced service read calls that did not run their own query."
+)
+
+
+class _LeaderGaveUpError(Exception):
+    pass
+
+
+class SingleFlight:
+    """Run at most one call per key at a time, concurrent callers with the same key share its outcome.
+
+    The call runs in the first caller's task, on its database session. If that caller is cancelled, e.g.
+    because its client went away, or runs out of its own time, the waiting callers start over and one of them
+    runs the call instead. Each waiting caller waits no longer than its own deadline.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._calls: dict[Hashable, asyncio.Future[typing.Any]] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        CALLS.inc(operation=self.operation)
+        while (future := self._calls.get(key)) is not None:
+            try:
+                async with asyncio.timeout(time_left()):
+                    result: T = await asyncio.shield(future)
+            except _LeaderGaveUpError:
+                continue
+            except TimeoutError as e:
+                # The leader's timeouts are not shared, so this is the caller's own deadline.
+                raise DeadlineExceededError from e
+            except Exception:
+                self._record_coalesced()
+                raise
+            self._record_coalesced()
+            return result
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await call()
+        except (asyncio.CancelledError, DeadlineExceededError, TimeoutError):
+            # The leader's deadline is not the followers': they retry under theirs.
+            future.set_exception(_LeaderGaveUpError())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+            # Nobody may be waiting; retrieving the exception keeps asyncio from logging it as unhandled.
+            if future.done() and not future.cancelled():
+                future.exception()
+            self._update_ratio()
+
+    def _record_coalesced(self) -> None:
+        COALESCED.inc(operation=self.operation)
+        self._update_ratio()
+
+    def _update_ratio(self) -> None:
+        calls = CALLS.value(operation=self.operation)
+        COALESCING_RATIO.set(COALESCED.value(operation=self.operation) / calls, operation=self.operation)
@@ -1,9 +1,10 @@
 import typing
+import uuid
 
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
 
 from app import schemas
-from app.database.repositories import TransactionRepository
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository
 from app.database.repositories.user_repository import UserRepository
 from app.exceptions import (
     AmountExceedsBalanceError,
@@ -12,22 +13,68 @@ from app.exceptions import (
     TransactionProcessedError,
 )
 from app.types import TransactionType
+from .idempotency import REPLAYS, TransactionReplays, fingerprint
+from .outbox import TRANSACTION_ADDED
+from .single_flight import SingleFlight
+
+
+# Shared by every request of the worker, so concurrent identical reads run one query.
+TRANSACTION_READS: typing.Final = SingleFlight("get_transaction")
+
+# Names the transactions of a transfer's two legs, see ``transfer_legs``.
+TRANSFER_NAMESPACE: typing.Final = uuid.UUID("2bba3aea-4c95-471c-bedd-f35088827c8e")
+
+
+def transfer_legs(data: schemas.TransferAdd) -> tuple[schemas.TransactionAdd, schemas.TransactionAdd]:
+    """Return the withdrawal and the deposit a transfer consists of.
+
+    Their uids are derived from the transfer's, so a retried transfer names the same transactions.
+    """
+    withdrawal = schemas.TransactionAdd(
+        uid=str(uuid.uuid5(TRANSFER_NAMESPACE, f"{data.uid}/{TransactionType.WITHDRAW.value}")),
+        user_id=data.from_user_id,
+        type=TransactionType.WITHDRAW,
+        amount=data.amount,
+        created_at=data.created_at,
+    )
+    deposit = schemas.TransactionAdd(
+        uid=str(uuid.uuid5(TRANSFER_NAMESPACE, f"{data.uid}/{TransactionType.DEPOSIT.value}")),
+        user_id=data.to_user_id,
+        type=TransactionType.DEPOSIT,
+        amount=data.amount,
+        created_at=data.created_at,
+    )
+    return withdrawal, deposit
 
 
 class TransactionService:
-    def __init__(
-        self, transaction_repo: TransactionRepository, user_repo: UserRepository, db_session: AsyncSessionType
+    def __init__(  # noqa: PLR0913
+        self,
+        transaction_repo: TransactionRepository,
+        user_repo: UserRepository,
+        outbox_repo: OutboxRepository,
+        ledger_repo: LedgerRepository,
+        db_session: AsyncSessionType,
+        *,
+        replays: TransactionReplays | None = None,
     ):
         self.transaction_repo = transaction_repo
         self.user_repo = user_repo
+        self.outbox_repo = outbox_repo
+        self.ledger_repo = ledger_repo
         self.db_session = db_session
+        self.replays = replays
 
     async def get_transaction(self, uid: str) -> schemas.Transaction:
+        return await TRANSACTION_READS.do(uid, lambda: self._get_transaction(uid))
+
+    async def _get_transaction(self, uid: str) -> schemas.Transaction:
         transaction = await self.transaction_repo.get(uid=uid)
         if transaction is None:
             raise TransactionNotFoundError
 
-        return typing.cast(schemas.Transaction, transaction)
+        # Validated into a schema: callers sharing the result must not share the caller's session-bound row.
+        return schemas.Transaction.model_validate(transaction)
 
     async def add_transaction(self, data: schemas.TransactionAdd) -> schemas.Transaction:
         if await self.transaction_repo.get(uid=data.uid):
@@ -39,5 +86,63 @@ class TransactionService:
         except AmountExceedsBalanceError as e:
             raise TransactionExceedsBalanceError from e
 
+        await self.ledger_repo.record(data.type, data.amount, data.created_at)
         transaction = await self.transaction_repo.add(data)
+        # Written after the balance update has locked the user's row, see ``OutboxDb.id``.
+        await self.outbox_repo.add(data.user_id, TRANSACTION_ADDED, data.model_dump(mode="json"))
         return typing.cast(schemas.Transaction, transaction)
+
+    async def transfer(self, data: schemas.TransferAdd) -> schemas.Transfer:
+        """Move ``data.amount`` between two users: both legs and both balance updates in one transaction."""
+        withdrawal, deposit = transfer_legs(data)
+        if await self.transaction_repo.exists(withdrawal.uid):
+            raise TransactionProcessedError
+
+        try:
+            await self.user_repo.update_balances({data.from_user_id: -data.amount, data.to_user_id: data.amount})
+        except AmountExceedsBalanceError as e:
+            raise TransactionExceedsBalanceError from e
+
+        await self.ledger_repo.record_transfer(data.amount, data.created_at)
+        await self.transaction_repo.add_many([withdrawal, deposit])
+        for leg in (withdrawal, deposit):
+            await self.outbox_repo.add(leg.user_id, TRANSACTION_ADDED, leg.model_dump(mode="json"))
+        return schemas.Transfer(
+            uid=data.uid,
+            withdrawal=schemas.Transaction.model_validate(withdrawal),
+            deposit=schemas.Transaction.model_validate(deposit),
+        )
+
+    async def replay_transfer(self, data: schemas.TransferAdd) -> schemas.Transfer:
+        """Return the stored transfer ``data`` repeats, like ``replay`` does for a single transaction."""
+        withdrawal, deposit = transfer_legs(data)
+        return schemas.Transfer(
+            uid=data.uid, withdrawal=await self.replay(withdrawal), deposit=await self.replay(deposit)
+        )
+
+    def remember(self, transaction: object) -> schemas.Transaction:
+        """Validate an added transaction into its response and keep it for retries, once it is committed."""
+        added = schemas.Transaction.model_validate(transaction)
+        if self.replays is not None:
+            self.replays.remember(added)
+        return added
+
+    def replay_cached(self, data: schemas.TransactionAdd) -> schemas.Transaction | None:
+        """Return the transaction a retry of ``data`` repeats if the worker still keeps it, without a query."""
+        if self.replays is None or (transaction := self.replays.get(data.uid)) is None:
+            return None
+        if fingerprint(transaction) != fingerprint(data):
+            raise TransactionProcessedError
+        REPLAYS.inc(source="cache")
+        return transaction
+
+    async def replay(self, data: schemas.TransactionAdd) -> schemas.Transaction:
+        """Return the stored transaction with ``data.uid``, if ``data`` repeats it rather than reusing its uid."""
+        stored = await self.transaction_repo.get(uid=data.uid)
+        if stored is None:
+            raise TransactionProcessedError
+        transaction = schemas.Transaction.model_validate(stored)
+        if fingerprint(transaction) != fingerprint(data):
+            raise TransactionProcessedError
+        REPLAYS.inc(source="database")
+        return self.remember(transaction)
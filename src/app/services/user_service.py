@@ -1,12 +1,21 @@
+import asyncio
+import collections
 import typing
+from collections.abc import Mapping, Sequence
 from datetime import UTC, datetime
 
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
 
 from app.database.repositories import TransactionRepository, UserRepository
+from app.database.sharding import ShardRouter
 from app.exceptions import UserExistsError, UserNotFoundError, WrongTimeStampError
 from app.schemas import User, UserBalance, UserCreate
 from app.utils import timezone_validator
+from .single_flight import SingleFlight
+
+
+# Shared by every request of the worker, so concurrent identical reads run one query.
+BALANCE_READS: typing.Final = SingleFlight("get_balance")
 
 
 class UserService:
@@ -21,24 +30,31 @@ class UserService:
         self.db_session = db_session
 
     async def create_user(self, data: UserCreate) -> User:
-        if await self.user_repo.get(user_id=data.id):
-            raise UserExistsError
-
         user = await self.user_repo.create(data)
+        if user is None:
+            raise UserExistsError
 
         return typing.cast(User, user)
 
+    async def create_users(self, users: Sequence[UserCreate]) -> set[str]:
+        """Create the users that do not exist yet, return their ids."""
+        return await self.user_repo.create_many(users)
+
     async def get_user(self, user_id: str) -> User | None:
         user_db = await self.user_repo.get(user_id=user_id)
         return typing.cast(User | None, user_db)
 
     async def get_balance(self, user_id: str, ts: datetime | None = None) -> UserBalance:
+        key = (user_id, None if ts is None else timezone_validator(ts))
+        return await BALANCE_READS.do(key, lambda: self._get_balance(user_id, ts))
+
+    async def _get_balance(self, user_id: str, ts: datetime | None) -> UserBalance:
         user = await self.user_repo.get(user_id=user_id)
         if not user:
             raise UserNotFoundError
 
         if ts is None:
-            return UserBalance(user_id=user.id, balance=user.balance)
+            return UserBalance(user_id=user.id, balance=user.balance, version=user.version)
 
         ts = timezone_validator(ts)
 
@@ -47,3 +63,28 @@ class UserService:
 
         balance = await self.transaction_repo.get_total_sum(user_id=user_id, before=ts)
         return UserBalance(user_id=user.id, balance=balance, ts=ts)
+
+
+class ShardedUserService:
+    """Creates users in bulk on the shards that own them, one statement and transaction per shard."""
+
+    def __init__(self, services: Mapping[str, UserService], shard_router: ShardRouter):
+        self.services = services
+        self.shard_router = shard_router
+
+    async def create_users(self, users: Sequence[UserCreate]) -> set[str]:
+        """Create and commit the users that do not exist yet, return their ids.
+
+        Each shard commits on its own: if one fails, the users created on the others stay created.
+        """
+        by_shard: dict[str, list[UserCreate]] = collections.defaultdict(list)
+        for user in users:
+            by_shard[await self.shard_router.shard_for_user(user.id)].append(user)
+        created = await asyncio.gather(*(self._create_users(shard, group) for shard, group in by_shard.items()))
+        return set().union(*created)
+
+    async def _create_users(self, shard: str, users: Sequence[UserCreate]) -> set[str]:
+        service = self.services[shard]
+        created = await service.create_users(users)
+        await service.db_session.commit()
+        return created
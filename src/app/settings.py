@@ -1,8 +1,12 @@
+from pathlib import Path
+
 from granian.log import LogLevels
 from pydantic import BaseModel, SecretStr
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlalchemy import URL
 
+from app.database.concurrency import ConcurrencyStrategy
+
 
 class Database(BaseModel):
     drivername: str = "postgresql+asyncpg"
@@ -11,15 +15,171 @@ class Database(BaseModel):
     host: str = "db"
     port: int = 5432
     db_name: str = "balance_service_db"
+    echo: bool = False  # log every statement through ``sqlalchemy.engine``, sampled by ``Logging.sampling``
+
+
+class Shard(BaseModel):
+    name: str  # users are placed by hashing onto the names, renaming a shard moves its users
+    host: str | None = None  # defaults to ``database.host``
+    port: int | None = None  # defaults to ``database.port``
+    db_name: str | None = None  # defaults to ``name``
+
+
+class Sharding(BaseModel):
+    shards: list[Shard] = []  # databases users are spread over; empty keeps everything in ``database``
+    virtual_nodes: int = 64  # points per shard on the hash ring, more spread users more evenly
+    rebalancing: bool = False  # look users up on every shard while ``python -m app.jobs.rebalance`` moves them
+    uid_cache_size: int = 100_000  # transaction uids whose user a worker remembers, and as many unknown uids
+    uid_miss_ttl: float = 1.0  # seconds a worker remembers that a transaction uid is unknown
+
+
+class Users(BaseModel):
+    bulk_max_items: int = 100_000  # users one ``POST /api/users/bulk`` request may create
+    bulk_chunk_size: int = 1_000  # users inserted per statement and transaction by bulk creation
+
+
+class LanePool(BaseModel):
+    pool_size: int  # connections kept open per worker and shard
+    max_overflow: int  # extra connections opened under load and closed when returned
+    queue_size: int = 100  # requests waiting for one of the lane's connections, more are shed with 503
+    queue_timeout: float = 1.0  # seconds a request may wait for a connection before it is shed with 503
+    deadline: float = 5.0  # seconds a request may take, see ``Deadlines``
+
+
+class Lanes(BaseModel):
+    write: LanePool = LanePool(pool_size=5, max_overflow=5)  # payments and user creation
+    read: LanePool = LanePool(pool_size=3, max_overflow=5, deadline=2.0)  # current balances and transaction lookups
+    # historical balances, ledger reports and bulk provisioning
+    analytics: LanePool = LanePool(pool_size=1, max_overflow=2, queue_size=20, queue_timeout=10.0, deadline=60.0)
+
+
+class Deadlines(BaseModel):
+    enabled: bool = True
+    routes: dict[str, float] = {}  # budgets in seconds by route name, e.g. {"get_user_balance": 0.5}, else the lane's
+    header: str = "X-Request-Timeout"  # request header with the seconds the client will wait, replaces the budget
+    max_timeout: float = 300.0  # longest time a client may ask for with the header
+    slack: float = 0.05  # seconds a statement may overrun the deadline before its statement_timeout is set again
+
+
+class Warmup(BaseModel):
+    connections: int = 5  # pooled connections per lane opened and warmed up before the worker reports ready
+    retry_delay: float = 1.0  # seconds between warm-up attempts while the database is unavailable
+
+
+class Admission(BaseModel):
+    enabled: bool = True  # limit each lane's requests to its connections, see ``Lanes``
+    retry_after: int = 1  # Retry-After seconds sent with 503
+    user_rate: float = 20.0  # requests per second per user, answered with 429 above it; 0 disables the limit
+    user_burst: int = 40  # requests a user may send at once after being idle
+    max_users: int = 100_000  # users tracked by the rate limiter, the least recently seen are forgotten
+
+
+class Streams(BaseModel):
+    buffer_size: int = 16  # balance updates buffered per stream, older ones are dropped for slow clients
+    heartbeat: float = 15.0  # seconds between keep-alive comments on an idle stream
+    reconnect_delay: float = 1.0  # seconds before the LISTEN connection is reopened
+
+
+class Outbox(BaseModel):
+    dispatcher: bool = False  # run a dispatcher in every worker, more can run as ``python -m app.jobs.outbox``
+    file_path: Path | None = None  # JSON lines file the file sink appends delivered events to, no sink if unset
+    batch_size: int = 100  # events claimed, delivered and deleted per database transaction
+    max_users: int = 100  # users whose events one batch may take, other dispatchers take the next ones
+    poll_interval: float = 0.5  # seconds between polls once the outbox is drained
+    retry_delay: float = 1.0  # seconds before a failed batch is claimed again
+
+
+class Ledger(BaseModel):
+    stripes: int = 16  # rows each ledger-wide total is split into, concurrent transactions update different ones
+
+
+class Concurrency(BaseModel):
+    strategy: ConcurrencyStrategy = ConcurrencyStrategy.PESSIMISTIC  # how concurrent balance updates are serialized
+    max_attempts: int = 5  # attempts of a transaction that keeps hitting conflicts
+    retry_base_delay: float = 0.005  # seconds, doubled on every attempt and jittered
+    retry_max_delay: float = 0.1  # seconds
+
+
+class Idempotency(BaseModel):
+    replay_cache_size: int = 10_000  # latest transactions per worker whose retries are answered without a query
+
+
+class Partitions(BaseModel):
+    months_ahead: int = 3  # future monthly partitions kept ready for incoming transactions
+    brin_after_months: int = 1  # partitions older than this many months get a BRIN index
+
+
+class Compaction(BaseModel):
+    horizon_months: int = 12  # transactions older than this are folded into monthly per-user totals
+    archive: bool = True  # keep compacted rows in transactions_archive, needed for bounds inside compacted months
+
+
+class Reconciliation(BaseModel):
+    batch_size: int = 500  # users whose balances one statement verifies
+    concurrency: int = 4  # batches verified at once, each on its own connection
+    overlap: float = 60.0  # seconds re-scanned before the watermark, longer than any balance update transaction runs
+
+
+class EventLoop(BaseModel):
+    monitor: bool = True  # measure the event loop's lag and log the stacks of callbacks blocking it
+    interval: float = 0.1  # seconds between lag measurements
+    threshold: float = 0.1  # seconds the loop may be blocked beyond the interval before the stack is logged
+    window: int = 600  # latest measurements the lag percentiles are computed over
+
+
+class Profiling(BaseModel):
+    enabled: bool = False  # serve POST /admin/profile, off by default
+    token: SecretStr = SecretStr("")  # bearer token the endpoint requires, it refuses every request while empty
+    max_seconds: float = 60.0  # longest profile one request may take
+    interval: float = 0.005  # seconds between stack samples
+
+
+class Logging(BaseModel):
+    queue: bool = True  # write log records on a background thread instead of the event loop's
+    queue_size: int = 10_000  # records waiting to be written, more are dropped and counted
+    json_format: bool = True  # write each record as one JSON object per line
+    sampling: dict[str, float] = {"sqlalchemy.engine": 0.01}  # share of records below WARNING kept, by logger
+
+
+class Reports(BaseModel):
+    directory: Path = Path("reports")  # report files and their states, shared by the workers of a host
+    processes: int = 2  # processes per worker running reports, each with its own database connections
+    tasks_per_process: int = 20  # reports a process runs before it is replaced, returning its memory
+    max_jobs: int = 20  # reports queued or running per worker, more are refused with 503
+    tenant_jobs: int = 2  # reports one tenant may have queued or running per worker, more get 429
+    tenant_tokens: dict[str, SecretStr] = {}  # bearer token by tenant name; without any, the client address
+    retention_hours: float = 24.0  # finished reports are deleted after this long
+    progress_interval: float = 0.5  # seconds between the progress updates of a running report
+    chunk_size: int = 5_000  # users whose transactions a balances report holds at once
 
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_nested_delimiter="__")
+
     debug: bool = False
     log_level: LogLevels = LogLevels.info
     app_port: int = 8000
     service_name: str = "balance-service"
 
     database: Database = Database()
+    sharding: Sharding = Sharding()
+    users: Users = Users()
+    lanes: Lanes = Lanes()
+    deadlines: Deadlines = Deadlines()
+    warmup: Warmup = Warmup()
+    admission: Admission = Admission()
+    streams: Streams = Streams()
+    outbox: Outbox = Outbox()
+    ledger: Ledger = Ledger()
+    concurrency: Concurrency = Concurrency()
+    idempotency: Idempotency = Idempotency()
+    partitions: Partitions = Partitions()
+    compaction: Compaction = Compaction()
+    reconciliation: Reconciliation = Reconciliation()
+    event_loop: EventLoop = EventLoop()
+    profiling: Profiling = Profiling()
+    logging: Logging = Logging()
+    reports: Reports = Reports()
 
     @property
     def db_dsn(self) -> URL:
@@ -28,5 +188,20 @@ class Settings(BaseSettings):
             username=self.database.postgres_username,
             password=self.database.postgres_password.get_secret_value(),
             host=self.database.host,
+            port=self.database.port,
             database=self.database.db_name,
         )
+
+    @property
+    def shard_dsns(self) -> dict[str, URL]:
+        """DSNs by shard name, a single ``default`` shard unless sharding is configured."""
+        if not self.sharding.shards:
+            return {"default": self.db_dsn}
+        return {
+            shard.name: self.db_dsn.set(
+                host=shard.host or self.database.host,
+                port=shard.port or self.database.port,
+                database=shard.db_name or shard.name,
+            )
+            for shard in self.sharding.shards
+        }
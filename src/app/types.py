@@ -4,3 +4,26 @@ import enum
 class TransactionType(enum.Enum):
     WITHDRAW = "WITHDRAW"
     DEPOSIT = "DEPOSIT"
+
+
+class UserCreationStatus(enum.Enum):
+    CREATED = "CREATED"
+    EXISTS = "EXISTS"
+    INVALID = "INVALID"
+
+
+class ProfileFormat(enum.Enum):
+    COLLAPSED = "collapsed"
+    PSTATS = "pstats"
+
+
+class ReportKind(enum.Enum):
+    STATEMENT = "statement"
+    BALANCES = "balances"
+
+
+class ReportStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
@@ -1,7 +1,21 @@
+import typing
 from datetime import UTC, datetime
+from decimal import ROUND_HALF_UP, Decimal
 
 
 def timezone_validator(value: datetime) -> datetime:
     if value.tzinfo is None or value.tzinfo.utcoffset(value) is None:
         value = value.replace(tzinfo=UTC)
     return value
+
+
+MINOR_UNITS: typing.Final = 2  # digits after the decimal point, amounts are stored as integer cents
+
+
+def to_minor_units(amount: Decimal) -> int:
+    # Rounds half away from zero like the ``DECIMAL(10, 2)`` columns the amounts used to live in.
+    return int(amount.scaleb(MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor_units(value: int | Decimal) -> Decimal:
+    return Decimal(value).scaleb(-MINOR_UNITS)
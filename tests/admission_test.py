@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+import fastapi
+import httpx
+import pytest
+
+from app.admission import SHED, AdmissionController, ConcurrencyLimiter, Lane, TokenBucket, UserRateLimiter
+from app.api.base import get_admission_controller, get_request_lane, get_user_service
+from app.application import AppBuilder
+from app.exceptions import RateLimitExceededError, ServiceOverloadedError
+from app.schemas import UserBalance
+from app.settings import Settings
+
+
+def limiter(limit: int = 1, max_queue: int = 1, queue_timeout: float = 1) -> ConcurrencyLimiter:
+    return ConcurrencyLimiter(Lane.READ, limit, max_queue, queue_timeout, retry_after=1)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_limiter_hands_slot_to_waiter() -> None:
+    read_limiter = limiter()
+    await read_limiter.acquire()
+
+    waiter = asyncio.create_task(read_limiter.acquire())
+    await asyncio.sleep(0)
+    assert read_limiter.queue_depth == 1
+    with pytest.raises(ServiceOverloadedError):
+        await read_limiter.acquire()
+
+    read_limiter.release()
+    await waiter
+    assert read_limiter.queue_depth == 0
+    assert read_limiter.in_flight == 1
+
+    read_limiter.release()
+    assert read_limiter.in_flight == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_limiter_sheds_after_queue_timeout() -> None:
+    read_limiter = limiter(queue_timeout=0.01)
+    await read_limiter.acquire()
+    shed = SHED.value(lane=Lane.READ, reason="queue_timeout")
+
+    with pytest.raises(ServiceOverloadedError):
+        await read_limiter.acquire()
+
+    assert read_limiter.queue_depth == 0
+    assert SHED.value(lane=Lane.READ, reason="queue_timeout") == shed + 1
+    read_limiter.release()
+    await read_limiter.acquire()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_limiter_cancelled_waiter_leaves_queue() -> None:
+    read_limiter = limiter()
+    await read_limiter.acquire()
+    waiter = asyncio.create_task(read_limiter.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert read_limiter.queue_depth == 0
+    read_limiter.release()
+    assert read_limiter.in_flight == 0
+
+
+def test_token_bucket() -> None:
+    bucket = TokenBucket(rate=10, burst=2, now=0)
+
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == pytest.approx(0.1)
+    assert bucket.take(0.1) == 0
+
+
+def test_user_rate_limiter_forgets_idle_users() -> None:
+    rate_limiter = UserRateLimiter(rate=1, burst=1, max_users=2)
+
+    assert rate_limiter.take("user_1") == 0
+    assert rate_limiter.take("user_1") > 0
+    rate_limiter.take("user_2")
+    rate_limiter.take("user_3")
+
+    assert rate_limiter.take("user_1") == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_controller_rate_limits_before_queueing() -> None:
+    controller = AdmissionController({Lane.WRITE: limiter()}, UserRateLimiter(rate=1, burst=1, max_users=10))
+
+    await controller.enter(Lane.WRITE, "user_1")
+    with pytest.raises(RateLimitExceededError):
+        await controller.enter(Lane.WRITE, "user_1")
+    controller.leave(Lane.WRITE)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rejected_requests() -> None:
+    builder = AppBuilder()
+    full = AdmissionController({Lane.READ: limiter(limit=0, max_queue=0)})
+    builder.app.dependency_overrides[get_admission_controller] = lambda: full
+
+    transport = httpx.ASGITransport(app=builder.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/api/user/user_id_1/balance/")
+        assert response.status_code == 503  # noqa: PLR2004
+        assert response.headers["Retry-After"] == "1"
+
+        limited = AdmissionController(
+            {Lane.READ: limiter(limit=0, max_queue=0)}, UserRateLimiter(rate=0.5, burst=0, max_users=10)
+        )
+        builder.app.dependency_overrides[get_admission_controller] = lambda: limited
+        response = await client.get("/api/user/user_id_1/balance/")
+        assert response.status_code == 429  # noqa: PLR2004
+        assert response.headers["Retry-After"] == "2"
+
+
+def test_controller_limits_lanes_to_their_pools() -> None:
+    settings = Settings(
+        lanes={
+            "write": {"pool_size": 4, "max_overflow": 2},
+            "read": {"pool_size": 2, "max_overflow": 1, "queue_size": 7},
+            "analytics": {"pool_size": 1, "max_overflow": 0, "queue_timeout": 5},
+        }
+    )
+    controller = AdmissionController.from_settings(settings)
+
+    assert controller is not None
+    assert {lane: limiter.limit for lane, limiter in controller.limiters.items()} == {
+        Lane.WRITE: 6,
+        Lane.READ: 3,
+        Lane.ANALYTICS: 1,
+    }
+    assert controller.limiters[Lane.READ].max_queue == 7  # noqa: PLR2004
+    assert controller.limiters[Lane.ANALYTICS].queue_timeout == 5  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_historical_reads_use_analytics_lane() -> None:
+    builder = AppBuilder()
+    lanes = []
+
+    class UserServiceStub:
+        async def get_balance(self, user_id: str, ts: datetime | None = None) -> UserBalance:
+            return UserBalance(user_id=user_id, balance=Decimal(1), ts=ts)
+
+    def get_user_service_stub(request: fastapi.Request) -> UserServiceStub:
+        lanes.append(get_request_lane(request))
+        return UserServiceStub()
+
+    # Reports have no connection left, current balances still get theirs.
+    controller = AdmissionController({Lane.READ: limiter(), Lane.ANALYTICS: limiter(limit=0, max_queue=0)})
+    builder.app.dependency_overrides[get_admission_controller] = lambda: controller
+    builder.app.dependency_overrides[get_user_service] = get_user_service_stub
+
+    transport = httpx.ASGITransport(app=builder.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/api/user/user_id_1/balance/")
+        assert response.status_code == 200  # noqa: PLR2004
+        response = await client.get("/api/user/user_id_1/balance/", params={"ts": "2024-01-01T00:00:00+00:00"})
+        assert response.status_code == 503  # noqa: PLR2004
+
+        builder.app.dependency_overrides[get_admission_controller] = lambda: None
+        response = await client.get("/api/user/user_id_1/balance/", params={"ts": "2024-01-01T00:00:00+00:00"})
+        assert response.status_code == 200  # noqa: PLR2004
+
+    assert lanes == [Lane.READ, Lane.ANALYTICS]
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+
+from app.database.batch_balances import balances_at
+
+
+def test_balances_at() -> None:
+    users = np.array([0, 0, 0, 2, 2], dtype=np.int64)
+    micros = np.array([10, 20, 20, 5, 30], dtype=np.int64)
+    amounts = np.array([100, -30, 5, 7, 1], dtype=np.int64)
+    at = np.array([0, 10, 19, 20, 100], dtype=np.int64)
+
+    balances = balances_at(users, micros, amounts, at)
+
+    assert balances.tolist() == [
+        [0, 100, 100, 75, 75],
+        # User 1 has no transactions.
+        [0, 0, 0, 0, 0],
+        [0, 7, 7, 7, 8],
+    ]
+
+
+def test_balances_at_empty() -> None:
+    empty = np.empty(0, dtype=np.int64)
+
+    assert balances_at(empty, empty, empty, np.array([1, 2], dtype=np.int64)).shape == (0, 2)
+
+
+def test_balances_at_matches_brute_force() -> None:
+    rng = random.Random(47)  # noqa: S311
+    transactions = sorted((rng.randrange(50), rng.randrange(200), rng.randint(-1_000, 1_000)) for _ in range(2_000))
+    users, micros, amounts = (np.array(column, dtype=np.int64) for column in zip(*transactions, strict=True))
+    at = np.array(sorted(rng.randrange(-10, 210) for _ in range(30)), dtype=np.int64)
+
+    balances = balances_at(users, micros, amounts, at)
+
+    expected = [
+        [sum(amount for owner, ts, amount in transactions if owner == user and ts <= point) for point in at]
+        for user in range(int(users[-1]) + 1)
+    ]
+    assert balances.tolist() == expected
@@ -0,0 +1,90 @@
+import json
+from collections.abc import AsyncIterator, Sequence
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.api.base import NDJSON_MEDIA_TYPE, get_sharded_user_service
+from app.application import AppBuilder
+from app.schemas import UserCreate
+from app.services import ShardedUserService
+
+
+EXISTING = {"user_id_111"}
+
+
+@pytest.fixture
+def user_service() -> AsyncMock:
+    async def create_users(users: Sequence[UserCreate]) -> set[str]:
+        return {user.id for user in users} - EXISTING
+
+    service = AsyncMock(spec=ShardedUserService)
+    service.create_users.side_effect = create_users
+    return service
+
+
+@pytest.fixture
+async def client(user_service: AsyncMock) -> AsyncIterator[httpx.AsyncClient]:
+    builder = AppBuilder()
+    builder.settings.users.bulk_chunk_size = 2
+    builder.settings.users.bulk_max_items = 5
+    builder.app.dependency_overrides[get_sharded_user_service] = lambda: user_service
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=builder.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_bulk_create_json(client: httpx.AsyncClient, user_service: AsyncMock) -> None:
+    items = [
+        {"id": "user_id_111", "name": "a"},
+        {"id": "user_id_112", "name": "b"},
+        {"id": "user_id_112", "name": "b"},
+        {"name": "c"},
+        {"id": "user_id_113", "name": "d"},
+    ]
+    response = await client.post("/api/users/bulk", json=items)
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert [(item["index"], item["id"], item["status"]) for item in response.json()] == [
+        (0, "user_id_111", "EXISTS"),
+        (1, "user_id_112", "CREATED"),
+        (2, "user_id_112", "EXISTS"),
+        (3, None, "INVALID"),
+        (4, "user_id_113", "CREATED"),
+    ]
+    assert response.json()[3]["detail"] == "id: Field required"
+    # Repeated ids are not sent twice, the users are inserted two at a time.
+    assert [len(call.args[0]) for call in user_service.create_users.await_args_list] == [2, 1]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_bulk_create_ndjson(client: httpx.AsyncClient) -> None:
+    body = '{"id": "user_id_114", "name": "a"}\n\nnot json\n{"id": "user_id_111", "name": "b"}'
+    response = await client.post("/api/users/bulk", content=body, headers={"Content-Type": NDJSON_MEDIA_TYPE})
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.headers["content-type"] == NDJSON_MEDIA_TYPE
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(item["index"], item["status"]) for item in results] == [(0, "CREATED"), (1, "INVALID"), (2, "EXISTS")]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_bulk_create_too_many(client: httpx.AsyncClient, user_service: AsyncMock) -> None:
+    items = [{"id": f"user_id_115_{number}", "name": "a"} for number in range(6)]
+
+    response = await client.post("/api/users/bulk", json=items)
+    assert response.status_code == 413  # noqa: PLR2004
+    user_service.create_users.assert_not_called()
+
+    body = "\n".join(json.dumps(item) for item in items)
+    response = await client.post("/api/users/bulk", content=body, headers={"Content-Type": NDJSON_MEDIA_TYPE})
+    assert response.status_code == 413  # noqa: PLR2004
+    assert response.json()["detail"] == "More than 5 users, the first 5 were processed."
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("body", ['{"id": "user_id_116"}', "not json"])
+async def test_bulk_create_rejects_other_bodies(client: httpx.AsyncClient, body: str) -> None:
+    response = await client.post("/api/users/bulk", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422  # noqa: PLR2004
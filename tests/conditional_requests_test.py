@@ -0,0 +1,125 @@
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app import schemas
+from app.api.base import etag_matches, get_transaction_service, get_user_service
+from app.api.payments import transaction_etag
+from app.application import AppBuilder
+from app.exceptions import TransactionNotFoundError
+from app.services import TransactionService, UserService
+from app.types import TransactionType
+
+
+@pytest.fixture
+def transaction_service() -> AsyncMock:
+    service = AsyncMock(spec=TransactionService)
+    service.get_transaction.return_value = schemas.Transaction(
+        uid="tr_uid_81",
+        user_id="user_id_81",
+        amount=Decimal(5),
+        type=TransactionType.DEPOSIT,
+        created_at=datetime(2024, 1, 1, tzinfo=UTC),
+    )
+    return service
+
+
+@pytest.fixture
+def user_service() -> AsyncMock:
+    service = AsyncMock(spec=UserService)
+    service.get_balance.return_value = schemas.UserBalance(user_id="user_id_81", balance=Decimal(5), version=3)
+    return service
+
+
+@pytest.fixture
+async def client(transaction_service: AsyncMock, user_service: AsyncMock) -> AsyncIterator[httpx.AsyncClient]:
+    app = AppBuilder().app
+    app.dependency_overrides[get_transaction_service] = lambda: transaction_service
+    app.dependency_overrides[get_user_service] = lambda: user_service
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.parametrize(
+    ("if_none_match", "matches"),
+    [
+        (None, False),
+        ('"3"', True),
+        ('W/"3"', True),
+        ('"1", "3"', True),
+        ("*", True),
+        ('"4"', False),
+        ("3", False),
+    ],
+)
+def test_etag_matches(if_none_match: str | None, matches: bool) -> None:
+    assert etag_matches(if_none_match, '"3"') is matches
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_transaction_is_cacheable(client: httpx.AsyncClient, transaction_service: AsyncMock) -> None:
+    response = await client.get("/api/transaction/tr_uid_81")
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.json()["uid"] == "tr_uid_81"
+    etag = transaction_etag(transaction_service.get_transaction.return_value)
+    assert response.headers["ETag"] == etag
+    assert "immutable" in response.headers["Cache-Control"]
+
+    response = await client.get("/api/transaction/tr_uid_81", headers={"If-None-Match": etag})
+    assert response.status_code == 304  # noqa: PLR2004
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_missing_transaction_ignores_its_tag(client: httpx.AsyncClient, transaction_service: AsyncMock) -> None:
+    etag = transaction_etag(transaction_service.get_transaction.return_value)
+    transaction_service.get_transaction.side_effect = TransactionNotFoundError
+
+    response = await client.get("/api/transaction/tr_uid_81", headers={"If-None-Match": etag})
+
+    assert response.status_code == 404  # noqa: PLR2004
+    assert "ETag" not in response.headers
+    assert "Cache-Control" not in response.headers
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_missing_transaction_is_not_cached(client: httpx.AsyncClient, transaction_service: AsyncMock) -> None:
+    transaction_service.get_transaction.side_effect = TransactionNotFoundError
+
+    response = await client.get("/api/transaction/tr_uid_82", headers={"If-None-Match": "*"})
+
+    assert response.status_code == 404  # noqa: PLR2004
+    assert "ETag" not in response.headers
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_balance_revalidates_by_version(client: httpx.AsyncClient, user_service: AsyncMock) -> None:
+    response = await client.get("/api/user/user_id_81/balance/")
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.json() == {"user_id": "user_id_81", "balance": "5"}
+    assert response.headers["ETag"] == '"3"'
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    response = await client.get("/api/user/user_id_81/balance/", headers={"If-None-Match": '"3"'})
+    assert response.status_code == 304  # noqa: PLR2004
+
+    user_service.get_balance.return_value = schemas.UserBalance(user_id="user_id_81", balance=Decimal(6), version=4)
+    response = await client.get("/api/user/user_id_81/balance/", headers={"If-None-Match": '"3"'})
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.headers["ETag"] == '"4"'
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_historical_balance_has_no_etag(client: httpx.AsyncClient, user_service: AsyncMock) -> None:
+    user_service.get_balance.return_value = schemas.UserBalance(user_id="user_id_81", balance=Decimal(1))
+
+    response = await client.get("/api/user/user_id_81/balance/", params={"ts": "2024-01-01T00:00:00+00:00"})
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert "ETag" not in response.headers
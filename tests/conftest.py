@@ -13,7 +13,7 @@ from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from app.database.models import METADATA
-from app.database.repositories import TransactionRepository, UserRepository
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
 
 
 class PytestSettings(BaseSettings):
@@ -127,3 +127,13 @@ def user_repo_mock() -> AsyncMock:
 @pytest.fixture
 def transaction_repo_mock() -> AsyncMock:
     return AsyncMock(spec=TransactionRepository)
+
+
+@pytest.fixture
+def outbox_repo_mock() -> AsyncMock:
+    return AsyncMock(spec=OutboxRepository)
+
+
+@pytest.fixture
+def ledger_repo_mock() -> AsyncMock:
+    return AsyncMock(spec=LedgerRepository)
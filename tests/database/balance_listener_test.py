@@ -0,0 +1,75 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.admission import AdmissionController, ConcurrencyLimiter, Lane
+from app.api.payments import stream_user_balance
+from app.database.models import UserDb
+from app.database.repositories import UserRepository
+from app.services.balance_updates import BalanceListener, BalanceSubscriptions, BalanceUpdate
+from app.settings import Settings
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add(UserDb(id="user_id_51", name="test_user_51"))
+    await db_session_module_scope.commit()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_committed_updates_are_published(
+    db_session: AsyncSessionType, db_sessionmaker: async_sessionmaker[AsyncSessionType]
+) -> None:
+    dsn = db_sessionmaker.kw["bind"].url.set(drivername="postgresql").render_as_string(hide_password=False)
+    subscriptions = BalanceSubscriptions(buffer_size=4)
+    subscription = subscriptions.subscribe("user_id_51")
+    listener = BalanceListener(dsn, subscriptions, reconnect_delay=0.1)
+    listener_task = asyncio.create_task(listener.run())
+    try:
+        await asyncio.wait_for(listener.listening.wait(), timeout=5)
+        user_repo = UserRepository(db_session)
+
+        await user_repo.update_balance("user_id_51", Decimal("10.5"))
+        await db_session.rollback()
+        await user_repo.update_balance("user_id_51", Decimal("2.25"))
+        await db_session.commit()
+
+        assert await subscription.get(max_wait=5) == BalanceUpdate("user_id_51", Decimal("2.25"), 1)
+        assert await subscription.get(max_wait=0.1) is None
+    finally:
+        listener_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await listener_task
+
+    assert subscription.closed is True
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_stream_holds_no_session_or_slot(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    limiter = ConcurrencyLimiter(Lane.READ, limit=1, max_queue=0, queue_timeout=1, retry_after=1)
+    subscriptions = BalanceSubscriptions(buffer_size=4)
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [], "path_params": {"user_id": "user_id_51"}}
+    pool = db_sessionmaker.kw["bind"].pool
+    checked_out = pool.checkedout()
+
+    response = await stream_user_balance(
+        Request(scope),
+        "user_id_51",
+        session_maker=db_sessionmaker,
+        admission=AdmissionController({Lane.READ: limiter}),
+        subscriptions=subscriptions,
+        settings=Settings(),
+    )
+
+    assert limiter.in_flight == 0
+    assert pool.checkedout() == checked_out
+    first = await anext(response.body_iterator)
+    assert "user_id_51" in str(first)
+    subscriptions.close_all()
+    assert [chunk async for chunk in response.body_iterator] == []
@@ -0,0 +1,138 @@
+import csv
+import io
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.batch_balances import chunk_balances, to_micros
+from app.database.models import TransactionAggregateDb, TransactionArchiveDb, TransactionDb, UserDb
+from app.database.repositories import TransactionRepository
+from app.jobs.balances import compute_balances
+from app.types import TransactionType
+
+
+# Recent, so the rows land in a monthly partition rather than the default one.
+CREATED_AT = datetime.now(UTC)
+USER_IDS = ["user_id_181", "user_id_182", "user_id_183", "user_id_184"]
+AT = [
+    datetime(2020, 3, 15, tzinfo=UTC),
+    datetime(2020, 5, 31, 23, 59, 59, 999_999, tzinfo=UTC),
+    datetime(2020, 6, 1, tzinfo=UTC),
+    CREATED_AT - timedelta(seconds=1),
+    CREATED_AT,
+    CREATED_AT + timedelta(days=1),
+]
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def transactions(db_session_module_scope: AsyncSessionType) -> None:
+    deposit, withdraw = TransactionType.DEPOSIT, TransactionType.WITHDRAW
+    db_session_module_scope.add_all(UserDb(id=user_id, name="test_user_18") for user_id in USER_IDS)
+    await db_session_module_scope.flush()
+    db_session_module_scope.add_all(
+        [
+            # Compacted with archive: read from the archive, whatever the point.
+            TransactionArchiveDb(
+                uid="tr_uid_181_1",
+                user_id="user_id_181",
+                type=deposit,
+                amount=Decimal("10.25"),
+                created_at=datetime(2020, 3, 1, tzinfo=UTC),
+                processed_at=datetime(2020, 3, 1, tzinfo=UTC),
+            ),
+            TransactionArchiveDb(
+                uid="tr_uid_181_2",
+                user_id="user_id_181",
+                type=withdraw,
+                amount=Decimal("3.5"),
+                created_at=datetime(2020, 3, 20, tzinfo=UTC),
+                processed_at=datetime(2020, 3, 20, tzinfo=UTC),
+            ),
+            TransactionAggregateDb(
+                user_id="user_id_181",
+                period_start=datetime(2020, 3, 1, tzinfo=UTC),
+                total=Decimal("6.75"),
+                transactions_count=2,
+                archived=True,
+            ),
+            # Compacted without archive: counts from the end of its month.
+            TransactionAggregateDb(
+                user_id="user_id_182",
+                period_start=datetime(2020, 5, 1, tzinfo=UTC),
+                total=Decimal(42),
+                transactions_count=3,
+                archived=False,
+            ),
+            TransactionDb(
+                uid="tr_uid_181_3",
+                user_id="user_id_181",
+                type=withdraw,
+                amount=Decimal("1.01"),
+                created_at=CREATED_AT,
+            ),
+            TransactionDb(
+                uid="tr_uid_182_1",
+                user_id="user_id_182",
+                type=deposit,
+                amount=Decimal(8),
+                created_at=CREATED_AT - timedelta(hours=1),
+            ),
+            TransactionDb(
+                uid="tr_uid_182_2",
+                user_id="user_id_182",
+                type=deposit,
+                amount=Decimal("0.01"),
+                created_at=CREATED_AT,
+            ),
+            TransactionDb(
+                uid="tr_uid_183_1",
+                user_id="user_id_183",
+                type=deposit,
+                amount=Decimal(100),
+                created_at=CREATED_AT + timedelta(seconds=1),
+            ),
+        ]
+    )
+    await db_session_module_scope.commit()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_chunk_balances(db_session: AsyncSessionType) -> None:
+    balances = await chunk_balances(db_session, USER_IDS[::-1], to_micros(AT), batch_size=2)
+
+    assert balances.tolist() == [
+        [0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 10000],
+        [0, 0, 4200, 5000, 5001, 5001],
+        [1025, 675, 675, 675, 574, 574],
+    ]
+    repo = TransactionRepository(db_session)
+    for user_id, row in zip(USER_IDS[::-1], balances.tolist(), strict=True):
+        for ts, balance in zip(AT, row, strict=True):
+            assert Decimal(balance) / 100 == await repo.get_total_sum(user_id, before=ts)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_compute_balances(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    url = db_sessionmaker.kw["bind"].url
+    output = io.StringIO()
+
+    report = await compute_balances(url, AT, output, user_ids=USER_IDS, chunk_size=3, verify=len(AT) * 3)
+
+    assert report.users == len(USER_IDS)
+    assert report.verified == len(USER_IDS) * len(AT)
+    assert report.mismatches == []
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+    assert len(rows) == len(USER_IDS) * len(AT)
+    assert rows[0] == {"user_id": "user_id_181", "ts": AT[0].isoformat(), "balance": "10.25"}
+    assert rows[-1] == {"user_id": "user_id_184", "ts": AT[-1].isoformat(), "balance": "0.00"}
+
+    # Every user of the database, listed by the job itself.
+    report = await compute_balances(url, AT, io.StringIO(), chunk_size=2, verify=4)
+    assert report.users >= len(USER_IDS)
+    assert report.mismatches == []
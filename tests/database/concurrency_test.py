@@ -0,0 +1,105 @@
+import asyncio
+from datetime import UTC, datetime
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.concurrency import TRANSACTION_RETRIES, ConcurrencyStrategy, run_in_transaction
+from app.database.models import UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.exceptions import ConcurrentUpdateError, TransactionExceedsBalanceError
+from app.schemas import TransactionAdd
+from app.services import TransactionService
+from app.types import TransactionType
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add_all(
+        UserDb(id=f"user_id_41_{strategy}", name="test_user_41", balance=Decimal(2000))
+        for strategy in ConcurrencyStrategy
+    )
+    await db_session_module_scope.commit()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_run_in_transaction_retries_conflicts(db_session_mock: AsyncMock) -> None:
+    work = AsyncMock(side_effect=[ConcurrentUpdateError, ConcurrentUpdateError, "done"])
+    retries = TRANSACTION_RETRIES.value(strategy=ConcurrencyStrategy.OPTIMISTIC)
+
+    result = await run_in_transaction(db_session_mock, work, ConcurrencyStrategy.OPTIMISTIC, base_delay=0)
+
+    assert result == "done"
+    assert work.await_count == 3  # noqa: PLR2004
+    assert db_session_mock.rollback.await_count == 2  # noqa: PLR2004
+    db_session_mock.commit.assert_awaited_once()
+    assert TRANSACTION_RETRIES.value(strategy=ConcurrencyStrategy.OPTIMISTIC) == retries + 2
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_run_in_transaction_gives_up(db_session_mock: AsyncMock) -> None:
+    work = AsyncMock(side_effect=ConcurrentUpdateError)
+
+    with pytest.raises(ConcurrentUpdateError):
+        await run_in_transaction(db_session_mock, work, ConcurrencyStrategy.OPTIMISTIC, max_attempts=3, base_delay=0)
+
+    assert work.await_count == 3  # noqa: PLR2004
+    db_session_mock.commit.assert_not_awaited()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_run_in_transaction_does_not_retry_business_errors(db_session_mock: AsyncMock) -> None:
+    work = AsyncMock(side_effect=TransactionExceedsBalanceError)
+
+    with pytest.raises(TransactionExceedsBalanceError):
+        await run_in_transaction(db_session_mock, work, ConcurrencyStrategy.PESSIMISTIC)
+
+    work.assert_awaited_once()
+    db_session_mock.rollback.assert_awaited_once()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+@pytest.mark.parametrize("strategy", list(ConcurrencyStrategy))
+async def test_concurrent_withdrawals(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType], strategy: ConcurrencyStrategy
+) -> None:
+    user_id = f"user_id_41_{strategy}"
+
+    async def withdraw(number: int) -> bool:
+        async with db_sessionmaker() as session:
+            service = TransactionService(
+                transaction_repo=TransactionRepository(session),
+                user_repo=UserRepository(session, strategy=strategy),
+                outbox_repo=OutboxRepository(session),
+                ledger_repo=LedgerRepository(session),
+                db_session=session,
+            )
+            data = TransactionAdd(
+                uid=f"tr_uid_41_{strategy}_{number}",
+                user_id=user_id,
+                amount=Decimal(700),
+                type=TransactionType.WITHDRAW,
+                created_at=datetime.now(UTC),
+            )
+            try:
+                await run_in_transaction(
+                    session, lambda: service.add_transaction(data), strategy, max_attempts=20, base_delay=0.001
+                )
+            except TransactionExceedsBalanceError:
+                return False
+            return True
+
+    results = await asyncio.gather(*(withdraw(number) for number in range(5)))
+
+    async with db_sessionmaker() as session:
+        user = await UserRepository(session).get(user_id)
+        total_sum = await TransactionRepository(session).get_total_sum(user_id)
+
+    assert results.count(True) == 2  # noqa: PLR2004
+    assert user is not None
+    assert user.balance == Decimal(600)
+    assert total_sum == Decimal(-1400)
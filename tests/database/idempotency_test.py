@@ -0,0 +1,213 @@
+import asyncio
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import httpx
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.base import get_admission_controller, get_db_session, get_shard_router
+from app.application import AppBuilder
+from app.database.concurrency import ConcurrencyStrategy, run_in_transaction
+from app.database.models import UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.database.sharding import ShardRouter
+from app.exceptions import TransactionProcessedError
+from app.schemas import TransactionAdd
+from app.services import TransactionService
+from app.services.idempotency import REPLAYS
+
+
+# Recent, so the rows land in a monthly partition rather than the default one.
+CREATED_AT = datetime.now(UTC)
+
+
+async def client_for(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> AsyncIterator[httpx.AsyncClient]:
+    async def get_test_db_session() -> AsyncIterator[AsyncSessionType]:
+        async with db_sessionmaker() as session:
+            yield session
+
+    builder = AppBuilder()
+    builder.app.dependency_overrides[get_admission_controller] = lambda: None
+    builder.app.dependency_overrides[get_db_session] = get_test_db_session
+    builder.app.dependency_overrides[get_shard_router] = lambda: ShardRouter({"default": db_sessionmaker}, 1)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=builder.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add_all(UserDb(id=f"user_id_{number}", name="test_user_15") for number in range(151, 159))
+    await db_session_module_scope.commit()
+
+
+@pytest.fixture
+async def client(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> AsyncIterator[httpx.AsyncClient]:
+    async for client in client_for(db_sessionmaker):
+        yield client
+
+
+def transaction(uid: str, user_id: str, amount: str = "10.50") -> dict[str, str]:
+    return {
+        "uid": uid,
+        "user_id": user_id,
+        "amount": amount,
+        "type": "DEPOSIT",
+        "created_at": CREATED_AT.isoformat(),
+    }
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_retry_gets_first_response(client: httpx.AsyncClient) -> None:
+    first = await client.put("/api/transaction/", json=transaction("tr_uid_151", "user_id_151"))
+    assert first.status_code == 200  # noqa: PLR2004
+    assert "Idempotent-Replayed" not in first.headers
+
+    from_cache = REPLAYS.value(source="cache")
+    retry = await client.put("/api/transaction/", json=transaction("tr_uid_151", "user_id_151", amount="10.5"))
+    assert retry.status_code == 200  # noqa: PLR2004
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert REPLAYS.value(source="cache") == from_cache + 1
+
+    conflict = await client.put("/api/transaction/", json=transaction("tr_uid_151", "user_id_151", amount="11"))
+    assert conflict.status_code == 409  # noqa: PLR2004
+
+    response = await client.get("/api/user/user_id_151/balance/")
+    assert response.json()["balance"] == "10.50"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_retry_on_another_worker_gets_first_response(
+    client: httpx.AsyncClient, db_sessionmaker: async_sessionmaker[AsyncSessionType]
+) -> None:
+    first = await client.put("/api/transaction/", json=transaction("tr_uid_152", "user_id_152"))
+    assert first.status_code == 200  # noqa: PLR2004
+
+    # A fresh worker has nothing cached, the stored transaction answers.
+    from_database = REPLAYS.value(source="database")
+    async for other_worker in client_for(db_sessionmaker):
+        retry = await other_worker.put("/api/transaction/", json=transaction("tr_uid_152", "user_id_152"))
+        assert retry.status_code == 200  # noqa: PLR2004
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+        conflict = await other_worker.put("/api/transaction/", json=transaction("tr_uid_152", "user_id_151"))
+        assert conflict.status_code == 409  # noqa: PLR2004
+    assert REPLAYS.value(source="database") == from_database + 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_concurrent_retries_add_transaction_once(client: httpx.AsyncClient) -> None:
+    responses = await asyncio.gather(
+        *(client.put("/api/transaction/", json=transaction("tr_uid_153", "user_id_153")) for _ in range(4))
+    )
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert sum("Idempotent-Replayed" in response.headers for response in responses) == 3  # noqa: PLR2004
+    response = await client.get("/api/user/user_id_153/balance/")
+    assert response.json()["balance"] == "10.50"
+
+
+def service_for(session: AsyncSessionType) -> TransactionService:
+    return TransactionService(
+        transaction_repo=TransactionRepository(session),
+        user_repo=UserRepository(session),
+        outbox_repo=OutboxRepository(session),
+        ledger_repo=LedgerRepository(session),
+        db_session=session,
+    )
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_retry_racing_first_attempt_waits_for_its_uid(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType],
+) -> None:
+    data = TransactionAdd.model_validate(transaction("tr_uid_154", "user_id_154"))
+
+    async with db_sessionmaker() as first, db_sessionmaker() as retry:
+        await service_for(first).add_transaction(data)
+        # The retry checks the uid before the first attempt commits, then waits for the user's row.
+        racing = asyncio.create_task(
+            run_in_transaction(retry, lambda: service_for(retry).add_transaction(data), ConcurrencyStrategy.PESSIMISTIC)
+        )
+        await asyncio.sleep(0.2)
+        await first.commit()
+
+        with pytest.raises(TransactionProcessedError):
+            await racing
+        assert (await service_for(retry).replay(data)).uid == "tr_uid_154"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_uid_reused_with_another_created_at_is_added_once(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType],
+) -> None:
+    data = TransactionAdd.model_validate(transaction("tr_uid_155", "user_id_155"))
+    # Lands in another partition, so ``transactions`` itself has no conflicting key.
+    reused = data.model_copy(update={"user_id": "user_id_156", "created_at": CREATED_AT - timedelta(days=40)})
+
+    async with db_sessionmaker() as first, db_sessionmaker() as second:
+        await service_for(first).add_transaction(data)
+        racing = asyncio.create_task(
+            run_in_transaction(
+                second, lambda: service_for(second).add_transaction(reused), ConcurrencyStrategy.PESSIMISTIC
+            )
+        )
+        await asyncio.sleep(0.2)
+        await first.commit()
+
+        with pytest.raises(TransactionProcessedError):
+            await racing
+        with pytest.raises(TransactionProcessedError):
+            await service_for(second).replay(reused)
+
+    async with db_sessionmaker() as session:
+        balances = await session.execute(
+            select(UserDb.id, UserDb.balance).where(UserDb.id.in_(["user_id_155", "user_id_156"])).order_by(UserDb.id)
+        )
+        assert balances.all() == [("user_id_155", Decimal("10.50")), ("user_id_156", Decimal(0))]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_concurrent_reuse_of_a_uid_conflicts(client: httpx.AsyncClient) -> None:
+    bodies = [
+        transaction("tr_uid_157", "user_id_157"),
+        {**transaction("tr_uid_157", "user_id_157"), "created_at": (CREATED_AT - timedelta(days=40)).isoformat()},
+    ]
+
+    responses = await asyncio.gather(*(client.put("/api/transaction/", json=body) for body in bodies))
+
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    response = await client.get("/api/user/user_id_157/balance/")
+    assert response.json()["balance"] == "10.50"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_concurrent_reuse_of_a_transfer_uid_conflicts(client: httpx.AsyncClient) -> None:
+    await client.put("/api/transaction/", json=transaction("tr_uid_158", "user_id_158", amount="100"))
+    bodies = [
+        {
+            "uid": "tr_uid_158_transfer",
+            "from_user_id": "user_id_158",
+            "to_user_id": "user_id_157",
+            "amount": "10",
+            "created_at": created_at.isoformat(),
+        }
+        for created_at in (CREATED_AT, CREATED_AT - timedelta(days=40))
+    ]
+
+    responses = await asyncio.gather(*(client.post("/api/transfer/", json=body) for body in bodies))
+
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    response = await client.get("/api/user/user_id_158/balance/")
+    assert response.json()["balance"] == "90.00"
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import UTC, date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.concurrency import ConcurrencyStrategy, run_in_transaction
+from app.database.models import LedgerTotalDb, TransactionDb, UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.schemas import TransactionAdd
+from app.services import TransactionService
+from app.types import TransactionType
+
+
+USER_IDS = [f"user_id_7{number}" for number in range(1, 5)]
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add_all(UserDb(id=user_id, name=user_id) for user_id in USER_IDS)
+    await db_session_module_scope.commit()
+
+
+async def add_transaction(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType], number: int, type_: TransactionType
+) -> None:
+    async with db_sessionmaker() as session:
+        service = TransactionService(
+            transaction_repo=TransactionRepository(session),
+            user_repo=UserRepository(session),
+            outbox_repo=OutboxRepository(session),
+            ledger_repo=LedgerRepository(session, stripes=4),
+            db_session=session,
+        )
+        data = TransactionAdd(
+            uid=f"tr_uid_7{number}",
+            user_id=USER_IDS[number % len(USER_IDS)],
+            amount=Decimal(number + 1),
+            type=type_,
+            created_at=datetime.now(UTC),
+        )
+        await run_in_transaction(
+            session, lambda: service.add_transaction(data), ConcurrencyStrategy.PESSIMISTIC, max_attempts=1
+        )
+
+
+async def get_volumes(ledger_repo: LedgerRepository, day: date) -> dict[TransactionType, tuple[Decimal, int]]:
+    return {row.type: (row.amount, row.transactions_count) for row in await ledger_repo.get_daily_volumes(day)}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_transactions_update_totals(
+    db_session: AsyncSessionType, db_sessionmaker: async_sessionmaker[AsyncSessionType]
+) -> None:
+    # Other test modules share the database, so only the changes are compared.
+    ledger_repo = LedgerRepository(db_session)
+    today = datetime.now(UTC).date()
+    liabilities = await ledger_repo.get_liabilities()
+    volumes = await get_volumes(ledger_repo, today)
+    await db_session.commit()
+
+    await asyncio.gather(*(add_transaction(db_sessionmaker, number, TransactionType.DEPOSIT) for number in range(20)))
+    await asyncio.gather(
+        *(add_transaction(db_sessionmaker, number, TransactionType.WITHDRAW) for number in range(20, 24))
+    )
+
+    assert await ledger_repo.get_liabilities() - liabilities == Decimal(210 - 90)
+    stripes = (await db_session.execute(select(func.count()).select_from(LedgerTotalDb))).scalar_one()
+    assert stripes > 1
+
+    new_volumes = await get_volumes(ledger_repo, today)
+    for type_, (amount, count) in (TransactionType.DEPOSIT, (210, 20)), (TransactionType.WITHDRAW, (90, 4)):
+        assert new_volumes[type_][0] - volumes.get(type_, (0, 0))[0] == amount
+        assert new_volumes[type_][1] - volumes.get(type_, (0, 0))[1] == count
+    assert await ledger_repo.get_daily_volumes(date(1999, 1, 1)) == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_rebuild_recomputes_totals(db_session: AsyncSessionType) -> None:
+    ledger_repo = LedgerRepository(db_session)
+    await ledger_repo.rebuild()
+    await db_session.commit()
+
+    balances = (await db_session.execute(select(func.sum(UserDb.balance)))).scalar_one()
+    assert await ledger_repo.get_liabilities() == balances
+    stripes = (await db_session.execute(select(func.count()).select_from(LedgerTotalDb))).scalar_one()
+    assert stripes == 1
+
+    today = datetime.now(UTC)
+    deposits = (
+        await db_session.execute(
+            select(func.sum(TransactionDb.amount)).where(
+                TransactionDb.type == TransactionType.DEPOSIT,
+                TransactionDb.created_at >= today.replace(hour=0, minute=0, second=0, microsecond=0),
+            )
+        )
+    ).scalar_one()
+    assert (await get_volumes(ledger_repo, today.date()))[TransactionType.DEPOSIT][0] == deposits
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_get_top_by_balance(db_session: AsyncSessionType) -> None:
+    users = await UserRepository(db_session).get_top_by_balance(limit=2)
+
+    balances = sorted((await db_session.execute(select(UserDb.balance))).scalars(), reverse=True)
+    assert [user.balance for user in users] == balances[:2]
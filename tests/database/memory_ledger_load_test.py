@@ -0,0 +1,86 @@
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.database.memory_ledger import MemoryLedger, MemoryTransactionRepository, MemoryUserRepository
+from app.database.models import UserDb
+from app.database.repositories import TransactionRepository
+from app.schemas import TransactionAdd
+from app.types import TransactionType
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_load(db_session: AsyncSessionType) -> None:
+    db_session.add(UserDb(id="user_id_131", name="test_user_131", balance=Decimal(7), version=3))
+    await db_session.flush()
+    repo = TransactionRepository(db_session)
+    now = datetime.now(UTC)
+    for uid, amount, type_, created_at in [
+        ("tr_uid_131", Decimal(100), TransactionType.DEPOSIT, datetime(1998, 1, 10, tzinfo=UTC)),
+        ("tr_uid_132", Decimal(30), TransactionType.WITHDRAW, datetime(1998, 1, 20, tzinfo=UTC)),
+        ("tr_uid_133", Decimal("0.5"), TransactionType.DEPOSIT, now),
+        ("tr_uid_134", Decimal(7), TransactionType.WITHDRAW, now - timedelta(days=1)),
+    ]:
+        await repo.add(TransactionAdd(uid=uid, user_id="user_id_131", amount=amount, type=type_, created_at=created_at))
+    await db_session.flush()
+    await repo.compact(before=datetime(1998, 2, 1, tzinfo=UTC))
+    await db_session.commit()
+
+    ledger = MemoryLedger()
+    await ledger.load(db_session, batch_size=2)
+    memory_repo = MemoryTransactionRepository(ledger)
+
+    user = await MemoryUserRepository(ledger).get("user_id_131")
+    assert user is not None
+    assert (user.balance, user.version) == (Decimal(7), 3)
+    transaction = await memory_repo.get("tr_uid_132")
+    assert transaction is not None
+    assert transaction.amount == Decimal(30)
+
+    bounds = [
+        (None, None),
+        (None, datetime(1998, 1, 15, tzinfo=UTC)),
+        (datetime(1998, 1, 15, tzinfo=UTC), None),
+        (datetime(1998, 1, 15, tzinfo=UTC), now - timedelta(hours=1)),
+        (now - timedelta(hours=1), None),
+    ]
+    for after, before in bounds:
+        expected = await repo.get_total_sum(user_id="user_id_131", after=after, before=before)
+        assert await memory_repo.get_total_sum(user_id="user_id_131", after=after, before=before) == expected
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_load_compacted_without_archive(db_session: AsyncSessionType) -> None:
+    db_session.add(UserDb(id="user_id_132", name="test_user_132", balance=Decimal(70), version=2))
+    await db_session.flush()
+    repo = TransactionRepository(db_session)
+    for uid, amount, type_, created_at in [
+        ("tr_uid_135", Decimal(100), TransactionType.DEPOSIT, datetime(1998, 1, 10, tzinfo=UTC)),
+        ("tr_uid_136", Decimal(30), TransactionType.WITHDRAW, datetime(1998, 1, 20, tzinfo=UTC)),
+    ]:
+        await repo.add(TransactionAdd(uid=uid, user_id="user_id_132", amount=amount, type=type_, created_at=created_at))
+    await db_session.flush()
+    await repo.compact(before=datetime(1998, 2, 1, tzinfo=UTC), archive=False)
+    await db_session.commit()
+
+    ledger = MemoryLedger()
+    await ledger.load(db_session)
+    memory_repo = MemoryTransactionRepository(ledger)
+
+    bounds = [
+        (None, None),
+        (None, datetime(1998, 1, 15, tzinfo=UTC)),
+        (None, datetime(1998, 1, 31, 23, 59, tzinfo=UTC)),
+        (None, datetime(1998, 2, 1, tzinfo=UTC)),
+        (None, datetime(1998, 2, 15, tzinfo=UTC)),
+        (datetime(1998, 1, 1, tzinfo=UTC), datetime(1998, 2, 15, tzinfo=UTC)),
+    ]
+    for after, before in bounds:
+        expected = await repo.get_total_sum(user_id="user_id_132", after=after, before=before)
+        assert await memory_repo.get_total_sum(user_id="user_id_132", after=after, before=before) == expected
+    assert await memory_repo.get_total_sum(user_id="user_id_132", before=datetime(1998, 1, 15, tzinfo=UTC)) == 0
+    assert await memory_repo.get_total_sum(user_id="user_id_132", before=datetime(1998, 2, 15, tzinfo=UTC)) == 70  # noqa: PLR2004
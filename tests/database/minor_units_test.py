@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.jobs.minor_units import convert, convert_column
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_convert_column(db_session: AsyncSessionType) -> None:
+    conn = await db_session.connection()
+    await conn.execute(text("CREATE TABLE legacy_amounts (amount DECIMAL(10, 2))"))
+    await conn.execute(text("INSERT INTO legacy_amounts VALUES (12.34), (0.5), (100), (0.01)"))
+
+    assert await convert_column(conn, "legacy_amounts", "amount") is True
+    assert await convert_column(conn, "legacy_amounts", "amount") is False
+    amounts = (await conn.execute(text("SELECT amount FROM legacy_amounts ORDER BY amount"))).scalars().all()
+    await db_session.rollback()
+
+    assert amounts == [1, 50, 1234, 10000]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_convert_current_schema(db_session: AsyncSessionType) -> None:
+    conn = await db_session.connection()
+    assert await convert(conn) == []
+    await db_session.rollback()
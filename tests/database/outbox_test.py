@@ -0,0 +1,169 @@
+import asyncio
+import json
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.application import AppBuilder
+from app.database.models import OutboxDb, UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.schemas import TransactionAdd
+from app.services import TransactionService
+from app.services.outbox import DELIVERED, TRANSACTION_ADDED, FileSink, MemorySink, OutboxDispatcher, OutboxEvent
+from app.types import TransactionType
+
+
+USER_IDS = [f"user_id_6{number}" for number in range(1, 5)]
+
+
+class FailingSink:
+    async def deliver(self, events: Sequence[OutboxEvent]) -> None:  # noqa: ARG002
+        raise ConnectionError
+
+
+class InterleavingSink(MemorySink):
+    # Yields before recording, so concurrent dispatchers interleave their deliveries.
+    async def deliver(self, events: Sequence[OutboxEvent]) -> None:
+        await asyncio.sleep(0.001)
+        await super().deliver(events)
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add_all(UserDb(id=user_id, name=user_id) for user_id in USER_IDS)
+    await db_session_module_scope.commit()
+
+
+@pytest.fixture(autouse=True)
+async def empty_outbox(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    async with db_sessionmaker() as session, session.begin():
+        await session.execute(OutboxDb.__table__.delete())
+
+
+def dispatcher(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType], sink: object, batch_size: int = 100
+) -> OutboxDispatcher:
+    return OutboxDispatcher(
+        db_sessionmaker, sink, batch_size=batch_size, max_users=2, poll_interval=0.01, retry_delay=0.01
+    )
+
+
+async def add_events(db_sessionmaker: async_sessionmaker[AsyncSessionType], per_user: int) -> None:
+    for number in range(per_user):
+        async with db_sessionmaker() as session, session.begin():
+            for user_id in USER_IDS:
+                await OutboxRepository(session).add(user_id, "test", {"number": number})
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_add_transaction_writes_event_in_same_transaction(db_session: AsyncSessionType) -> None:
+    service = TransactionService(
+        transaction_repo=TransactionRepository(db_session),
+        user_repo=UserRepository(db_session),
+        outbox_repo=OutboxRepository(db_session),
+        ledger_repo=LedgerRepository(db_session),
+        db_session=db_session,
+    )
+    data = TransactionAdd(
+        uid="tr_uid_61",
+        user_id="user_id_61",
+        amount=Decimal("12.5"),
+        type=TransactionType.DEPOSIT,
+        created_at=datetime.now(UTC),
+    )
+
+    await service.add_transaction(data)
+    await db_session.rollback()
+    assert (await db_session.execute(select(func.count()).select_from(OutboxDb))).scalar_one() == 0
+
+    await service.add_transaction(data)
+    await db_session.commit()
+    event = (await db_session.execute(select(OutboxDb))).scalar_one()
+    assert event.user_id == "user_id_61"
+    assert event.event_type == TRANSACTION_ADDED
+    assert event.payload == data.model_dump(mode="json")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_dispatch_batch_delivers_and_deletes(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    await add_events(db_sessionmaker, per_user=3)
+    sink = MemorySink()
+    delivered = DELIVERED.value()
+
+    assert await dispatcher(db_sessionmaker, sink).dispatch_batch() == 6  # noqa: PLR2004
+    assert {event.user_id for event in sink.events} == set(USER_IDS[:2])
+    assert await dispatcher(db_sessionmaker, sink).dispatch_batch() == 6  # noqa: PLR2004
+    assert await dispatcher(db_sessionmaker, sink).dispatch_batch() == 0
+
+    for user_id in USER_IDS:
+        assert [event.payload["number"] for event in sink.events if event.user_id == user_id] == [0, 1, 2]
+    assert DELIVERED.value() - delivered == 12  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_failed_delivery_is_retried(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    await add_events(db_sessionmaker, per_user=1)
+
+    with pytest.raises(ConnectionError):
+        await dispatcher(db_sessionmaker, FailingSink()).dispatch_batch()
+
+    sink = MemorySink()
+    await dispatcher(db_sessionmaker, sink, batch_size=10).dispatch_batch()
+    await dispatcher(db_sessionmaker, sink, batch_size=10).dispatch_batch()
+    assert sorted(event.user_id for event in sink.events) == USER_IDS
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_concurrent_dispatchers_keep_per_user_order(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType],
+) -> None:
+    await add_events(db_sessionmaker, per_user=25)
+    sink = InterleavingSink()
+
+    async def drain() -> None:
+        while len(sink.events) < 100:  # noqa: PLR2004
+            await dispatcher(db_sessionmaker, sink, batch_size=5).dispatch_batch()
+
+    await asyncio.wait_for(asyncio.gather(*(drain() for _ in range(4))), timeout=30)
+
+    assert len(sink.events) == 100  # noqa: PLR2004
+    for user_id in USER_IDS:
+        numbers = [event.payload["number"] for event in sink.events if event.user_id == user_id]
+        assert numbers == list(range(25))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_file_sink_appends_json_lines(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType], tmp_path: Path
+) -> None:
+    await add_events(db_sessionmaker, per_user=1)
+    path = tmp_path / "outbox.jsonl"
+
+    await dispatcher(db_sessionmaker, FileSink(path), batch_size=10).dispatch_batch()
+    await dispatcher(db_sessionmaker, FileSink(path), batch_size=10).dispatch_batch()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert sorted(line["user_id"] for line in lines) == USER_IDS
+    assert lines[0]["event_type"] == "test"
+    assert lines[0]["payload"] == {"number": 0}
+
+
+def test_app_has_no_sink_unless_configured(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.delenv("OUTBOX__FILE_PATH", raising=False)
+    assert AppBuilder().outbox_sink is None
+
+    monkeypatch.setenv("OUTBOX__FILE_PATH", str(tmp_path / "outbox.jsonl"))
+    sink = AppBuilder().outbox_sink
+    assert isinstance(sink, FileSink)
+    assert sink.path == tmp_path / "outbox.jsonl"
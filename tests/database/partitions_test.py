@@ -0,0 +1,145 @@
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+
+from app.database import partitions
+from app.database.models import TransactionDb, UserDb
+from app.database.repositories import TransactionRepository
+from app.exceptions import TransactionProcessedError
+from app.jobs.partitions import record_uids
+from app.schemas import TransactionAdd
+from app.types import TransactionType
+
+
+TABLE = TransactionDb.__tablename__
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add(UserDb(id="user_id_31", name="test_user_31"))
+    await db_session_module_scope.commit()
+
+
+async def get_partition_of(db_session: AsyncSessionType, uid: str) -> str:
+    query = text(f"SELECT tableoid::regclass::text FROM {TABLE} WHERE uid = :uid")  # noqa: S608
+    return (await db_session.execute(query, {"uid": uid})).scalar_one()
+
+
+def test_month_helpers() -> None:
+    month = partitions.month_start(datetime(2023, 12, 31, 23, 59, tzinfo=UTC))
+    assert month == datetime(2023, 12, 1, tzinfo=UTC)
+    assert partitions.add_months(month, 1) == datetime(2024, 1, 1, tzinfo=UTC)
+    assert partitions.add_months(month, -12) == datetime(2022, 12, 1, tzinfo=UTC)
+    assert list(partitions.iter_months(month, datetime(2024, 2, 15, tzinfo=UTC))) == [
+        datetime(2023, 12, 1, tzinfo=UTC),
+        datetime(2024, 1, 1, tzinfo=UTC),
+        datetime(2024, 2, 1, tzinfo=UTC),
+    ]
+
+
+def test_partition_names() -> None:
+    name = partitions.partition_name(TABLE, datetime(2023, 1, 1, tzinfo=UTC))
+    assert name == "transactions_y2023m01"
+    assert partitions.partition_month(TABLE, name) == datetime(2023, 1, 1, tzinfo=UTC)
+    assert partitions.is_partition_name(TABLE, name) is True
+    assert partitions.is_partition_name(TABLE, partitions.default_partition_name(TABLE)) is True
+    assert partitions.partition_month(TABLE, partitions.default_partition_name(TABLE)) is None
+    assert partitions.is_partition_name(TABLE, "transactions_unpartitioned") is False
+    assert partitions.is_partition_name(TABLE, "users") is False
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_current_month_has_partition(db_session: AsyncSessionType) -> None:
+    repo = TransactionRepository(db_session)
+    now = datetime.now(UTC)
+    await repo.add(
+        TransactionAdd(
+            uid="tr_uid_31", user_id="user_id_31", amount=Decimal(10), type=TransactionType.DEPOSIT, created_at=now
+        )
+    )
+    await db_session.commit()
+
+    assert await get_partition_of(db_session, "tr_uid_31") == partitions.partition_name(
+        TABLE, partitions.month_start(now)
+    )
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_ensure_partitions_moves_rows_out_of_default(db_session: AsyncSessionType) -> None:
+    repo = TransactionRepository(db_session)
+    await repo.add(
+        TransactionAdd(
+            uid="tr_uid_32",
+            user_id="user_id_31",
+            amount=Decimal(100),
+            type=TransactionType.DEPOSIT,
+            created_at=datetime(2020, 1, 15, tzinfo=UTC),
+        )
+    )
+    await db_session.commit()
+    assert await get_partition_of(db_session, "tr_uid_32") == partitions.default_partition_name(TABLE)
+
+    conn = await db_session.connection()
+    created = await partitions.ensure_default_partition_drained(conn, TABLE)
+    await db_session.commit()
+
+    assert created == ["transactions_y2020m01"]
+    assert await get_partition_of(db_session, "tr_uid_32") == "transactions_y2020m01"
+    assert await repo.get_total_sum(user_id="user_id_31", before=datetime(2020, 2, 1, tzinfo=UTC)) == Decimal(100)
+    assert (await repo.get("tr_uid_32")) is not None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_create_brin_indexes(db_session: AsyncSessionType) -> None:
+    conn = await db_session.connection()
+    await partitions.ensure_partitions(
+        conn, TABLE, datetime(2019, 11, 1, tzinfo=UTC), datetime(2019, 12, 1, tzinfo=UTC)
+    )
+    created = await partitions.create_brin_indexes(conn, TABLE, datetime(2019, 12, 1, tzinfo=UTC))
+    await db_session.commit()
+
+    assert "transactions_y2019m11_created_at_brin" in created
+    assert "transactions_y2019m12_created_at_brin" not in created
+
+    conn = await db_session.connection()
+    assert await partitions.create_brin_indexes(conn, TABLE, datetime(2019, 12, 1, tzinfo=UTC)) == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_record_uids(db_session: AsyncSessionType) -> None:
+    # Added before ``transaction_uids`` existed.
+    db_session.add(
+        TransactionDb(
+            uid="tr_uid_33",
+            user_id="user_id_31",
+            amount=Decimal(5),
+            type=TransactionType.DEPOSIT,
+            created_at=datetime.now(UTC),
+        )
+    )
+    await db_session.commit()
+
+    conn = await db_session.connection()
+    # Rows other tests inserted directly are recorded as well.
+    assert await record_uids(conn) >= 1
+    assert await record_uids(conn) == 0
+    await db_session.commit()
+
+    with pytest.raises(TransactionProcessedError):
+        await TransactionRepository(db_session).add(
+            TransactionAdd(
+                uid="tr_uid_33",
+                user_id="user_id_31",
+                amount=Decimal(5),
+                type=TransactionType.DEPOSIT,
+                created_at=datetime(2020, 1, 15, tzinfo=UTC),
+            )
+        )
+    await db_session.rollback()
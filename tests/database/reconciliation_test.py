@@ -0,0 +1,96 @@
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.models import TransactionDb, UserDb
+from app.database.repositories import LedgerRepository
+from app.jobs.reconciliation import Drift, reconcile
+from app.settings import Settings
+from app.types import TransactionType
+
+
+async def add_transaction(
+    session_maker: async_sessionmaker[AsyncSessionType], uid: str, user_id: str, amount: int
+) -> None:
+    async with session_maker() as session, session.begin():
+        session.add(
+            TransactionDb(
+                uid=uid,
+                user_id=user_id,
+                type=TransactionType.DEPOSIT,
+                amount=Decimal(amount),
+                created_at=datetime.now(UTC),
+            )
+        )
+
+
+async def get_user(session_maker: async_sessionmaker[AsyncSessionType], user_id: str) -> UserDb:
+    async with session_maker() as session:
+        user = await session.get(UserDb, user_id)
+        assert user is not None
+        return user
+
+
+async def get_liabilities(session_maker: async_sessionmaker[AsyncSessionType]) -> Decimal:
+    async with session_maker() as session:
+        return await LedgerRepository(session).get_liabilities()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_reconcile(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    url = db_sessionmaker.kw["bind"].url
+    settings = Settings(
+        database={
+            "host": url.host,
+            "port": url.port,
+            "postgres_username": url.username,
+            "postgres_password": url.password,
+            "db_name": url.database,
+        }
+    )
+    options = {"batch_size": 2, "concurrency": 2, "overlap": 0}
+
+    async with db_sessionmaker() as session, session.begin():
+        session.add_all(
+            [
+                UserDb(id="user_id_121", name="user_id_121", balance=Decimal(10)),
+                UserDb(id="user_id_122", name="user_id_122", balance=Decimal(5)),
+            ]
+        )
+    await add_transaction(db_sessionmaker, "tr_uid_121", "user_id_121", 10)
+    await add_transaction(db_sessionmaker, "tr_uid_122", "user_id_122", 10)
+
+    # Without a watermark every user is checked.
+    report = await reconcile(settings, full=False, repair=False, **options)
+    assert Drift("user_id_122", Decimal(5), Decimal(10)) in report.drift
+    assert "user_id_121" not in {drift.user_id for drift in report.drift}
+    assert report.repaired == 0
+    assert (await get_user(db_sessionmaker, "user_id_122")).balance == Decimal(5)
+
+    # Only users with transactions since the last run are checked again.
+    async with db_sessionmaker() as session, session.begin():
+        await session.execute(update(UserDb).where(UserDb.id == "user_id_121").values(balance=Decimal(99)))
+    await add_transaction(db_sessionmaker, "tr_uid_123", "user_id_122", 1)
+    liabilities = await get_liabilities(db_sessionmaker)
+    version = (await get_user(db_sessionmaker, "user_id_122")).version
+
+    report = await reconcile(settings, full=False, repair=True, **options)
+    assert report.drift == [Drift("user_id_122", Decimal(5), Decimal(11))]
+    assert report.checked == 1
+    assert report.repaired == 1
+    user = await get_user(db_sessionmaker, "user_id_122")
+    assert user.balance == Decimal(11)
+    assert user.version == version + 1
+    assert await get_liabilities(db_sessionmaker) == liabilities + 6
+    assert (await get_user(db_sessionmaker, "user_id_121")).balance == Decimal(99)
+
+    report = await reconcile(settings, full=False, repair=False, **options)
+    assert report.checked == 0
+
+    report = await reconcile(settings, full=True, repair=False, **options)
+    assert Drift("user_id_121", Decimal(99), Decimal(10)) in report.drift
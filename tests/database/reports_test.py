@@ -0,0 +1,194 @@
+import asyncio
+import csv
+import io
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.base import get_report_runner
+from app.application import AppBuilder
+from app.database.models import TransactionAggregateDb, TransactionDb, UserDb
+from app.services.reports import ReportRunner
+from app.settings import Settings
+from app.types import TransactionType
+
+
+# Recent, so the rows land in a monthly partition rather than the default one.
+CREATED_AT = datetime.now(UTC)
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def transactions(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add_all(
+        UserDb(id=f"user_id_{number}", name="test_user_18", balance=Decimal(0)) for number in range(185, 187)
+    )
+    await db_session_module_scope.flush()
+    db_session_module_scope.add_all(
+        [
+            TransactionAggregateDb(
+                user_id="user_id_185",
+                period_start=datetime(2020, 5, 1, tzinfo=UTC),
+                total=Decimal(50),
+                transactions_count=2,
+                archived=False,
+            ),
+            *(
+                TransactionDb(
+                    uid=f"tr_uid_185_{number}",
+                    user_id="user_id_185",
+                    type=TransactionType.WITHDRAW if number % 2 else TransactionType.DEPOSIT,
+                    amount=Decimal(number + 1),
+                    created_at=CREATED_AT + timedelta(seconds=number),
+                )
+                for number in range(5)
+            ),
+        ]
+    )
+    await db_session_module_scope.commit()
+
+
+@pytest.fixture(scope="module")
+async def report_runner(
+    db_sessionmaker: async_sessionmaker[AsyncSessionType], tmp_path_factory: pytest.TempPathFactory
+) -> AsyncIterator[ReportRunner]:
+    url = db_sessionmaker.kw["bind"].url
+    settings = Settings(
+        database={
+            "host": url.host,
+            "port": url.port,
+            "postgres_username": url.username,
+            "postgres_password": url.password,
+            "db_name": url.database,
+        },
+        reports={"directory": tmp_path_factory.mktemp("reports"), "processes": 1, "tenant_jobs": 1},
+    )
+    report_runner = ReportRunner(settings)
+    report_runner.start()
+    yield report_runner
+    await report_runner.close()
+
+
+@pytest.fixture
+async def client(report_runner: ReportRunner, monkeypatch: pytest.MonkeyPatch) -> AsyncIterator[httpx.AsyncClient]:
+    monkeypatch.setenv("REPORTS__TENANT_TOKENS", '{"tenant_18": "token_18", "tenant_19": "token_19"}')
+    builder = AppBuilder()
+    builder.app.dependency_overrides[get_report_runner] = lambda: report_runner
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=builder.app),
+        base_url="http://test",
+        headers={"Authorization": "Bearer token_18"},
+    ) as client:
+        yield client
+
+
+async def wait_for(client: httpx.AsyncClient, report_id: str) -> dict:
+    for _ in range(600):
+        response = await client.get(f"/api/reports/{report_id}")
+        assert response.status_code == 200  # noqa: PLR2004
+        if response.json()["status"] in {"done", "failed"}:
+            return response.json()
+        await asyncio.sleep(0.05)
+    pytest.fail("The report did not finish")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_statement_report(client: httpx.AsyncClient) -> None:
+    response = await client.post(
+        "/api/reports",
+        json={"kind": "statement", "user_id": "user_id_185", "after": "2020-01-01T00:00:00Z"},
+    )
+    assert response.status_code == 202  # noqa: PLR2004
+    report_id = response.json()["id"]
+    assert response.headers["location"] == f"/api/reports/{report_id}"
+    assert response.json()["status"] == "queued"
+    # Only one report per tenant at a time.
+    response = await client.post("/api/reports", json={"kind": "balances", "at": [CREATED_AT.isoformat()]})
+    assert response.status_code == 429  # noqa: PLR2004
+
+    report = await wait_for(client, report_id)
+    assert report["status"] == "done"
+    assert report["progress"] == 1.0
+
+    response = await client.get(f"/api/reports/{report_id}/download")
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.headers["accept-ranges"] == "bytes"
+    assert int(response.headers["content-length"]) == report["size"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["uid"], row["type"], row["amount"], row["balance"]) for row in rows] == [
+        ("", "COMPACTED", "50.00", "50.00"),
+        ("tr_uid_185_0", "DEPOSIT", "1.00", "51.00"),
+        ("tr_uid_185_1", "WITHDRAW", "2.00", "49.00"),
+        ("tr_uid_185_2", "DEPOSIT", "3.00", "52.00"),
+        ("tr_uid_185_3", "WITHDRAW", "4.00", "48.00"),
+        ("tr_uid_185_4", "DEPOSIT", "5.00", "53.00"),
+    ]
+    assert rows[0]["created_at"] == "2020-06-01T00:00:00+00:00"
+
+    content = response.content
+    response = await client.get(f"/api/reports/{report_id}/download", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206  # noqa: PLR2004
+    assert response.content == content[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+
+    response = await client.get(
+        f"/api/reports/{report_id}/download",
+        headers={"Range": "bytes=-5", "If-Range": response.headers["etag"]},
+    )
+    assert response.status_code == 206  # noqa: PLR2004
+    assert response.content == content[-5:]
+    # A stale validator gets the whole file.
+    response = await client.get(
+        f"/api/reports/{report_id}/download", headers={"Range": "bytes=-5", "If-Range": '"r1-stale"'}
+    )
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.content == content
+
+    response = await client.get(f"/api/reports/{report_id}/download", headers={"Range": f"bytes={len(content)}-"})
+    assert response.status_code == 416  # noqa: PLR2004
+    assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+    # Other tenants do not see the report, and a tenant cannot be named without its token.
+    response = await client.get(f"/api/reports/{report_id}", headers={"Authorization": "Bearer token_19"})
+    assert response.status_code == 404  # noqa: PLR2004
+    for headers in ({"Authorization": "Bearer token_20"}, {"X-Tenant-Id": "tenant_18", "Authorization": ""}):
+        response = await client.get(f"/api/reports/{report_id}", headers=headers)
+        assert response.status_code == 401  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_balances_report(client: httpx.AsyncClient) -> None:
+    at = [datetime(2020, 6, 1, tzinfo=UTC), CREATED_AT + timedelta(minutes=1)]
+    response = await client.post("/api/reports", json={"kind": "balances", "at": [ts.isoformat() for ts in at]})
+    assert response.status_code == 202  # noqa: PLR2004
+
+    report = await wait_for(client, response.json()["id"])
+    assert report["status"] == "done"
+    response = await client.get(f"/api/reports/{report['id']}/download")
+    rows = {(row["user_id"], row["ts"]): row["balance"] for row in csv.DictReader(io.StringIO(response.text))}
+    assert rows[("user_id_185", at[0].isoformat())] == "50.00"
+    assert rows[("user_id_185", at[1].isoformat())] == "53.00"
+    assert rows[("user_id_186", at[1].isoformat())] == "0.00"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_failed_report(client: httpx.AsyncClient) -> None:
+    response = await client.post("/api/reports", json={"kind": "statement", "user_id": "user_id_189"})
+    report = await wait_for(client, response.json()["id"])
+
+    assert report["status"] == "failed"
+    assert report["error"] == "User not found."
+    response = await client.get(f"/api/reports/{report['id']}/download")
+    assert response.status_code == 409  # noqa: PLR2004
+
+    response = await client.post("/api/reports", json={"kind": "statement"})
+    assert response.status_code == 422  # noqa: PLR2004
+    response = await client.get("/api/reports/not-a-report")
+    assert response.status_code == 422  # noqa: PLR2004
@@ -0,0 +1,312 @@
+import contextlib
+import csv
+import io
+import typing
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import pytest
+import sqlalchemy_utils
+from sqlalchemy import URL, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+from app.api.base import get_request_shard
+from app.database import partitions
+from app.database.models import METADATA, OutboxDb, TransactionDb, TransactionUidDb, UserDb
+from app.database.repositories import ReconciliationRepository, TransactionRepository, UserRepository
+from app.database.sharding import UID_LOOKUPS, ShardRouter, move_user
+from app.exceptions import TransactionProcessedError
+from app.jobs.balances import compute_shard_balances
+from app.jobs.partitions import maintain
+from app.jobs.rebalance import rebalance
+from app.jobs.reconciliation import JOB, reconcile
+from app.schemas import TransactionAdd, UserCreate
+from app.services import ShardedUserService, UserService
+from app.settings import Settings
+from app.types import TransactionType
+
+
+SHARDS = ("a", "b", "c")
+
+SessionMakers = dict[str, async_sessionmaker[AsyncSessionType]]
+
+
+@pytest.fixture(scope="module")
+async def shard_urls(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> AsyncIterator[dict[str, URL]]:
+    url = db_sessionmaker.kw["bind"].url
+    urls = {shard: url.set(database=f"{url.database}_shard_{shard}") for shard in SHARDS}
+    for shard_url in urls.values():
+        sync_url = shard_url.set(drivername="postgresql").render_as_string(hide_password=False)
+        if sqlalchemy_utils.database_exists(sync_url):
+            sqlalchemy_utils.drop_database(sync_url)
+        sqlalchemy_utils.create_database(sync_url)
+        engine = create_async_engine(shard_url)
+        async with engine.begin() as conn:
+            await conn.run_sync(METADATA.create_all)
+        await engine.dispose()
+
+    yield urls
+
+    for shard_url in urls.values():
+        sqlalchemy_utils.drop_database(shard_url.set(drivername="postgresql").render_as_string(hide_password=False))
+
+
+@pytest.fixture
+async def session_makers(shard_urls: dict[str, URL]) -> AsyncIterator[SessionMakers]:
+    engines = {shard: create_async_engine(shard_url) for shard, shard_url in shard_urls.items()}
+    yield {
+        shard: async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+        for shard, engine in engines.items()
+    }
+    for engine in engines.values():
+        await engine.dispose()
+
+
+async def add_user(session_maker: async_sessionmaker[AsyncSessionType], user_id: str, balance: int = 10) -> None:
+    async with session_maker() as session, session.begin():
+        session.add(UserDb(id=user_id, name=user_id, balance=Decimal(balance)))
+        await session.flush()
+        session.add(
+            TransactionDb(
+                uid=f"tr_{user_id}",
+                user_id=user_id,
+                type=TransactionType.DEPOSIT,
+                amount=Decimal(balance),
+                created_at=datetime.now(UTC),
+            )
+        )
+        session.add(TransactionUidDb(uid=f"tr_{user_id}", user_id=user_id))
+        session.add(OutboxDb(user_id=user_id, event_type="test", payload={"user_id": user_id}))
+
+
+async def count(session_maker: async_sessionmaker[AsyncSessionType], model: type, user_id: str) -> int:
+    async with session_maker() as session:
+        query = select(func.count()).select_from(model).where(model.user_id == user_id)
+        return (await session.execute(query)).scalar_one()
+
+
+def sharded_settings(shard_urls: dict[str, URL], **sections: dict[str, object]) -> Settings:
+    url = shard_urls["a"]
+    return Settings(
+        **sections,
+        database={
+            "host": url.host,
+            "port": url.port,
+            "postgres_username": url.username,
+            "postgres_password": url.password,
+        },
+        sharding={
+            "shards": [{"name": shard, "db_name": shard_url.database} for shard, shard_url in shard_urls.items()]
+        },
+    )
+
+
+def transaction(uid: str, user_id: str) -> TransactionAdd:
+    return TransactionAdd(
+        uid=uid, user_id=user_id, type=TransactionType.DEPOSIT, amount=Decimal(1), created_at=datetime.now(UTC)
+    )
+
+
+def request(path_params: dict[str, str]) -> Request:
+    async def receive() -> dict[str, typing.Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "path_params": path_params}, receive)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_requests_are_routed_to_owning_shard(session_makers: SessionMakers) -> None:
+    router = ShardRouter(session_makers, virtual_nodes=64)
+    owner = router.ring.node_for("user_id_91")
+    await add_user(session_makers[owner], "user_id_91")
+
+    assert await get_request_shard(request({"user_id": "user_id_91"}), router) == owner
+    assert await get_request_shard(request({}), router) == router.default_shard
+
+    # Without a recorded user the uid is unknown, and so remembered for a while.
+    missing = UID_LOOKUPS.value(result="missing")
+    cached_missing = UID_LOOKUPS.value(result="cached_missing")
+    assert await router.shard_for_transaction("tr_user_id_91") == router.default_shard
+    assert await router.shard_for_transaction("tr_user_id_91") == router.default_shard
+    assert UID_LOOKUPS.value(result="missing") == missing + 1
+    assert UID_LOOKUPS.value(result="cached_missing") == cached_missing + 1
+
+    # Recorded by another worker: this one finds the uid once it has forgotten the miss.
+    await ShardRouter(session_makers, virtual_nodes=64).claim([transaction("tr_user_id_91", "user_id_91")])
+    assert await router.shard_for_transaction("tr_user_id_91") == router.default_shard
+    router = ShardRouter(session_makers, virtual_nodes=64)
+    found = UID_LOOKUPS.value(result="found")
+    cached = UID_LOOKUPS.value(result="cached")
+    assert await get_request_shard(request({"transaction_id": "tr_user_id_91"}), router) == owner
+    assert await router.shard_for_transaction("tr_user_id_91") == owner
+    assert UID_LOOKUPS.value(result="found") == found + 1
+    assert UID_LOOKUPS.value(result="cached") == cached + 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_uids_are_unique_across_shards(session_makers: SessionMakers) -> None:
+    router = ShardRouter(session_makers, virtual_nodes=64)
+    other = ShardRouter(session_makers, virtual_nodes=64)
+
+    await router.claim([transaction("tr_uid_97", "user_id_97_1")])
+    # Retries of the same user may claim the uid again, another user may not, whichever worker asks.
+    await other.claim([transaction("tr_uid_97", "user_id_97_1")])
+    with pytest.raises(TransactionProcessedError):
+        await other.claim([transaction("tr_uid_97", "user_id_97_2"), transaction("tr_uid_97_2", "user_id_97_2")])
+    assert await other.shard_for_transaction("tr_uid_97") == other.ring.node_for("user_id_97_1")
+    assert await other.shard_for_transaction("tr_uid_97_2") == other.ring.node_for("user_id_97_2")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_unsharded_router_needs_no_lookups(session_makers: SessionMakers) -> None:
+    router = ShardRouter({"default": session_makers["a"]}, virtual_nodes=64)
+
+    assert await get_request_shard(request({"transaction_id": "tr_uid_92"}), router) == "default"
+    assert await router.shard_for_user("user_id_92") == "default"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_move_user(session_makers: SessionMakers) -> None:
+    await add_user(session_makers["a"], "user_id_93")
+    router = ShardRouter(session_makers, virtual_nodes=64, rebalancing=True)
+    assert await router.shard_for_user("user_id_93") == "a"
+
+    assert await move_user(session_makers["a"], session_makers["b"], "user_id_93") is True
+
+    assert await router.shard_for_user("user_id_93") == "b"
+    for model in (TransactionDb, OutboxDb):
+        assert await count(session_makers["a"], model, "user_id_93") == 0
+        assert await count(session_makers["b"], model, "user_id_93") == 1
+    assert await move_user(session_makers["a"], session_makers["b"], "user_id_93") is False
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_move_user_keeps_target_copy(session_makers: SessionMakers) -> None:
+    # What an interrupted move leaves behind: the target copy may have taken writes since.
+    await add_user(session_makers["a"], "user_id_94", balance=10)
+    await add_user(session_makers["b"], "user_id_94", balance=20)
+
+    assert await move_user(session_makers["a"], session_makers["b"], "user_id_94") is True
+
+    assert await count(session_makers["a"], TransactionDb, "user_id_94") == 0
+    async with session_makers["b"]() as session:
+        assert (await session.get(UserDb, "user_id_94")).balance == Decimal(20)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_rebalance(session_makers: SessionMakers, shard_urls: dict[str, URL]) -> None:
+    user_ids = [f"user_id_95_{number}" for number in range(20)]
+    for user_id in user_ids:
+        await add_user(session_makers["c"], user_id)
+    settings = sharded_settings(shard_urls)
+
+    to_move = await rebalance(settings, batch_size=7, dry_run=True)
+    assert to_move >= 5  # noqa: PLR2004
+    assert await rebalance(settings, batch_size=7, dry_run=False) == to_move
+    assert await rebalance(settings, batch_size=7, dry_run=False) == 0
+
+    router = ShardRouter(session_makers, virtual_nodes=settings.sharding.virtual_nodes)
+    for user_id in user_ids:
+        owner = router.ring.node_for(user_id)
+        for shard, session_maker in session_makers.items():
+            assert await count(session_maker, TransactionDb, user_id) == (shard == owner)
+        assert await router.shard_for_transaction(f"tr_{user_id}") == owner
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_create_users_on_owning_shards(session_makers: SessionMakers) -> None:
+    router = ShardRouter(session_makers, virtual_nodes=64)
+    user_ids = [f"user_id_96_{number}" for number in range(12)]
+    await add_user(session_makers[router.ring.node_for(user_ids[0])], user_ids[0])
+
+    async with contextlib.AsyncExitStack() as stack:
+        sessions = {
+            shard: await stack.enter_async_context(session_maker()) for shard, session_maker in session_makers.items()
+        }
+        service = ShardedUserService(
+            {
+                shard: UserService(UserRepository(session), TransactionRepository(session), session)
+                for shard, session in sessions.items()
+            },
+            router,
+        )
+        created = await service.create_users([UserCreate(id=user_id, name=user_id) for user_id in user_ids])
+
+    assert created == set(user_ids[1:])
+    for user_id in user_ids:
+        owner = router.ring.node_for(user_id)
+        for shard, session_maker in session_makers.items():
+            async with session_maker() as session:
+                assert (await session.get(UserDb, user_id) is not None) == (shard == owner)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_compute_shard_balances(session_makers: SessionMakers, shard_urls: dict[str, URL]) -> None:
+    settings = sharded_settings(shard_urls)
+    router = ShardRouter(session_makers, virtual_nodes=settings.sharding.virtual_nodes)
+    user_ids = [f"user_id_97_{number}" for number in range(12)]
+    for user_id in user_ids:
+        await add_user(session_makers[router.ring.node_for(user_id)], user_id)
+    at = [datetime.now(UTC)]
+    output = io.StringIO()
+
+    report = await compute_shard_balances(settings, at, output, user_ids=user_ids, verify=1)
+
+    assert report.users == len(user_ids)
+    assert report.verified == len(shard_urls)
+    assert report.mismatches == []
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+    assert sorted(row["user_id"] for row in rows) == sorted(user_ids)
+    assert {row["balance"] for row in rows} == {"10.00"}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_partitions_job_maintains_every_shard(shard_urls: dict[str, URL]) -> None:
+    settings = sharded_settings(shard_urls, partitions={"months_ahead": 24})
+    last = partitions.partition_name(
+        TransactionDb.__tablename__, partitions.add_months(partitions.month_start(datetime.now(UTC)), 24)
+    )
+
+    await maintain(settings)
+
+    for shard_url in shard_urls.values():
+        engine = create_async_engine(shard_url)
+        async with engine.connect() as conn:
+            assert last in await partitions.list_partitions(conn, TransactionDb.__tablename__)
+        await engine.dispose()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_reconcile_every_shard(session_makers: SessionMakers, shard_urls: dict[str, URL]) -> None:
+    settings = sharded_settings(shard_urls)
+    router = ShardRouter(session_makers, virtual_nodes=settings.sharding.virtual_nodes)
+    user_ids = [f"user_id_98_{number}" for number in range(12)]
+    for user_id in user_ids:
+        session_maker = session_makers[router.ring.node_for(user_id)]
+        await add_user(session_maker, user_id)
+        async with session_maker() as session, session.begin():
+            await session.execute(update(UserDb).where(UserDb.id == user_id).values(balance=Decimal(11)))
+
+    report = await reconcile(settings, full=False, repair=True, batch_size=5, concurrency=2, overlap=60.0)
+
+    assert sorted(item.user_id for item in report.drift) == sorted(user_ids)
+    assert report.repaired == len(user_ids)
+    for session_maker in session_makers.values():
+        async with session_maker() as session:
+            assert await ReconciliationRepository(session).get_watermark(JOB) is not None
+    for user_id in user_ids:
+        async with session_makers[router.ring.node_for(user_id)]() as session:
+            assert (await session.get(UserDb, user_id)).balance == Decimal(10)
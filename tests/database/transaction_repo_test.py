@@ -5,7 +5,7 @@ import pytest
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
 
-from app.database.models import TransactionDb, UserDb
+from app.database.models import TransactionArchiveDb, TransactionDb, UserDb
 from app.database.repositories import TransactionRepository
 from app.schemas import TransactionAdd
 from app.types import TransactionType
@@ -19,6 +19,8 @@ async def users(db_session_module_scope: AsyncSessionType) -> None:
         UserDb(id="user_id_13", name="test_user_13"),
         UserDb(id="user_id_14", name="test_user_14"),
         UserDb(id="user_id_15", name="test_user_15"),
+        UserDb(id="user_id_16", name="test_user_16"),
+        UserDb(id="user_id_17", name="test_user_17"),
     ]
     db_session_module_scope.add_all(users)
     await db_session_module_scope.commit()
@@ -229,3 +231,69 @@ async def test_get_total_sum_with_after_and_before_filter(db_session: AsyncSessi
         user_id="user_id_15", after=now - timedelta(days=1, hours=1), before=now - timedelta(hours=1)
     )
     assert total_sum == Decimal(-50)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_compact_keeps_total_sum(db_session: AsyncSessionType) -> None:
+    repo = TransactionRepository(db_session)
+    for uid, amount, type_, created_at in [
+        ("tr_uid_24", Decimal(100), TransactionType.DEPOSIT, datetime(2000, 1, 10, tzinfo=UTC)),
+        ("tr_uid_25", Decimal(30), TransactionType.WITHDRAW, datetime(2000, 1, 20, tzinfo=UTC)),
+        ("tr_uid_26", Decimal(50), TransactionType.DEPOSIT, datetime(2000, 2, 5, tzinfo=UTC)),
+        ("tr_uid_27", Decimal(5), TransactionType.DEPOSIT, datetime.now(UTC)),
+    ]:
+        await repo.add(TransactionAdd(uid=uid, user_id="user_id_16", amount=amount, type=type_, created_at=created_at))
+    await db_session.commit()
+
+    bounds = [
+        (None, None),
+        (None, datetime(2000, 1, 15, tzinfo=UTC)),
+        (datetime(2000, 1, 15, tzinfo=UTC), None),
+        (datetime(2000, 1, 1, tzinfo=UTC), datetime(2000, 2, 1, tzinfo=UTC)),
+        (datetime(2000, 1, 15, tzinfo=UTC), datetime(2000, 2, 10, tzinfo=UTC)),
+        (datetime(2000, 2, 1, tzinfo=UTC), None),
+    ]
+    expected = [await repo.get_total_sum(user_id="user_id_16", after=after, before=before) for after, before in bounds]
+    assert expected == [Decimal(125), Decimal(100), Decimal(25), Decimal(70), Decimal(20), Decimal(55)]
+
+    assert await repo.compact(before=datetime(2000, 3, 1, tzinfo=UTC)) == 3  # noqa: PLR2004
+    await db_session.commit()
+
+    assert (await db_session.get(TransactionDb, "tr_uid_24")) is None
+    assert [await repo.get_total_sum(user_id="user_id_16", after=after, before=before) for after, before in bounds] == (
+        expected
+    )
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_get_compacted_transaction(db_session: AsyncSessionType) -> None:
+    repo = TransactionRepository(db_session)
+
+    transaction = await repo.get("tr_uid_24")
+    assert isinstance(transaction, TransactionArchiveDb)
+    assert transaction.amount == Decimal(100)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_compact_without_archive(db_session: AsyncSessionType) -> None:
+    repo = TransactionRepository(db_session)
+    for uid, amount, created_at in [
+        ("tr_uid_28", Decimal(10), datetime(1999, 10, 10, tzinfo=UTC)),
+        ("tr_uid_29", Decimal(20), datetime(1999, 11, 10, tzinfo=UTC)),
+    ]:
+        await repo.add(
+            TransactionAdd(
+                uid=uid, user_id="user_id_17", amount=amount, type=TransactionType.DEPOSIT, created_at=created_at
+            )
+        )
+    await db_session.commit()
+
+    assert await repo.compact(before=datetime(1999, 12, 1, tzinfo=UTC), archive=False) == 2  # noqa: PLR2004
+    await db_session.commit()
+
+    assert await repo.get("tr_uid_28") is None
+    assert await repo.get_total_sum(user_id="user_id_17") == Decimal(30)
+    assert await repo.get_total_sum(user_id="user_id_17", before=datetime(1999, 11, 1, tzinfo=UTC)) == Decimal(10)
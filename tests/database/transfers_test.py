@@ -0,0 +1,136 @@
+import asyncio
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.base import get_admission_controller, get_db_session, get_shard_router
+from app.application import AppBuilder
+from app.database.concurrency import TRANSACTION_CONFLICTS, ConcurrencyStrategy, run_in_transaction
+from app.database.models import UserDb
+from app.database.repositories import LedgerRepository, OutboxRepository, TransactionRepository, UserRepository
+from app.database.sharding import ShardRouter
+from app.schemas import TransferAdd
+from app.services import TransactionService
+
+
+# Recent, so the rows land in a monthly partition rather than the default one.
+CREATED_AT = datetime.now(UTC)
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def users(db_session_module_scope: AsyncSessionType) -> None:
+    db_session_module_scope.add_all(
+        UserDb(id=f"user_id_{number}", name="test_user_17", balance=Decimal(100)) for number in range(171, 175)
+    )
+    await db_session_module_scope.commit()
+
+
+@pytest.fixture
+async def client(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> AsyncIterator[httpx.AsyncClient]:
+    async def get_test_db_session() -> AsyncIterator[AsyncSessionType]:
+        async with db_sessionmaker() as session:
+            yield session
+
+    builder = AppBuilder()
+    builder.app.dependency_overrides[get_admission_controller] = lambda: None
+    builder.app.dependency_overrides[get_db_session] = get_test_db_session
+    builder.app.dependency_overrides[get_shard_router] = lambda: ShardRouter({"default": db_sessionmaker}, 1)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=builder.app), base_url="http://test") as client:
+        yield client
+
+
+def transfer(uid: str, from_user_id: str, to_user_id: str, amount: str = "30.25") -> dict[str, str]:
+    return {
+        "uid": uid,
+        "from_user_id": from_user_id,
+        "to_user_id": to_user_id,
+        "amount": amount,
+        "created_at": CREATED_AT.isoformat(),
+    }
+
+
+async def balance(client: httpx.AsyncClient, user_id: str) -> str:
+    return (await client.get(f"/api/user/{user_id}/balance/")).json()["balance"]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_transfer(client: httpx.AsyncClient) -> None:
+    response = await client.post("/api/transfer/", json=transfer("transfer_171", "user_id_171", "user_id_172"))
+    assert response.status_code == 200  # noqa: PLR2004
+    body = response.json()
+    assert body["withdrawal"]["user_id"] == "user_id_171"
+    assert body["withdrawal"]["type"] == "WITHDRAW"
+    assert body["deposit"]["user_id"] == "user_id_172"
+    assert body["deposit"]["type"] == "DEPOSIT"
+    assert await balance(client, "user_id_171") == "69.75"
+    assert await balance(client, "user_id_172") == "130.25"
+    response = await client.get(f"/api/transaction/{body['deposit']['uid']}")
+    assert response.json() == body["deposit"]
+
+    retry = await client.post("/api/transfer/", json=transfer("transfer_171", "user_id_171", "user_id_172"))
+    assert retry.status_code == 200  # noqa: PLR2004
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == body
+    conflict = await client.post("/api/transfer/", json=transfer("transfer_171", "user_id_171", "user_id_173"))
+    assert conflict.status_code == 409  # noqa: PLR2004
+    assert await balance(client, "user_id_171") == "69.75"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_failed_transfer_changes_nothing(client: httpx.AsyncClient) -> None:
+    response = await client.post("/api/transfer/", json=transfer("transfer_172", "user_id_173", "user_id_173"))
+    assert response.status_code == 422  # noqa: PLR2004
+    response = await client.post(
+        "/api/transfer/", json=transfer("transfer_173", "user_id_173", "user_id_174", amount="100.01")
+    )
+    assert response.status_code == 400  # noqa: PLR2004
+    response = await client.post("/api/transfer/", json=transfer("transfer_174", "user_id_173", "user_id_unknown"))
+    assert response.status_code == 404  # noqa: PLR2004
+
+    assert await balance(client, "user_id_173") == "100.00"
+    assert await balance(client, "user_id_174") == "100.00"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_opposite_transfers_do_not_deadlock(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    users = ("user_id_173", "user_id_174")
+    conflicts = TRANSACTION_CONFLICTS.value(strategy=ConcurrencyStrategy.PESSIMISTIC)
+
+    async def move(number: int) -> None:
+        from_user_id, to_user_id = users if number % 2 else users[::-1]
+        data = TransferAdd(
+            uid=f"transfer_175_{number}",
+            from_user_id=from_user_id,
+            to_user_id=to_user_id,
+            amount=Decimal(1),
+            created_at=CREATED_AT,
+        )
+        async with db_sessionmaker() as session:
+            service = TransactionService(
+                transaction_repo=TransactionRepository(session),
+                user_repo=UserRepository(session),
+                outbox_repo=OutboxRepository(session),
+                ledger_repo=LedgerRepository(session),
+                db_session=session,
+            )
+            await run_in_transaction(session, lambda: service.transfer(data), ConcurrencyStrategy.PESSIMISTIC)
+
+    await asyncio.gather(*(move(number) for number in range(20)))
+
+    # A deadlock would have been detected by Postgres and counted as a conflict.
+    assert TRANSACTION_CONFLICTS.value(strategy=ConcurrencyStrategy.PESSIMISTIC) == conflicts
+    async with db_sessionmaker() as session:
+        transaction_repo, user_repo = TransactionRepository(session), UserRepository(session)
+        for user_id in users:
+            user = await user_repo.get(user_id)
+            assert user is not None
+            assert user.balance == Decimal(100)
+            assert await transaction_repo.get_total_sum(user_id) == Decimal(0)
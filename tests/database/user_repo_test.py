@@ -1,11 +1,15 @@
 from decimal import Decimal
+from typing import Any
 
 import pytest
+from sqlalchemy import Executable, Result
 from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from app.database.concurrency import ConcurrencyStrategy
 from app.database.models import UserDb
 from app.database.repositories import UserRepository
-from app.exceptions import AmountExceedsBalanceError, UserNotFoundError
+from app.exceptions import AmountExceedsBalanceError, ConcurrentUpdateError, UserNotFoundError
 from app.schemas import UserCreate
 
 
@@ -28,6 +32,45 @@ async def test_create(db_session: AsyncSessionType) -> None:
     assert retrieved_user.id == user.id
 
 
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_create_existing(db_session: AsyncSessionType) -> None:
+    user_repo = UserRepository(db_session)
+    assert await user_repo.create(UserCreate(id="user_id_101", name="first")) is not None
+    await db_session.commit()
+
+    assert await user_repo.create(UserCreate(id="user_id_101", name="second")) is None
+    await db_session.commit()
+
+    retrieved_user = await user_repo.get("user_id_101")
+    assert retrieved_user is not None
+    assert retrieved_user.name == "first"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_create_many(db_session: AsyncSessionType) -> None:
+    user_repo = UserRepository(db_session)
+    await user_repo.create(UserCreate(id="user_id_102", name="existing"))
+    await db_session.commit()
+
+    created = await user_repo.create_many(
+        [
+            UserCreate(id="user_id_102", name="again"),
+            UserCreate(id="user_id_103", name="new"),
+            UserCreate(id="user_id_104", name="new"),
+        ]
+    )
+    await db_session.commit()
+
+    assert created == {"user_id_103", "user_id_104"}
+    assert await user_repo.create_many([]) == set()
+    user = await user_repo.get("user_id_104")
+    assert user is not None
+    assert user.balance == Decimal(0)
+    assert user.version == 0
+
+
 @pytest.mark.asyncio(loop_scope="session")
 @pytest.mark.usefixtures("check_database")
 async def test_get(db_session: AsyncSessionType) -> None:
@@ -94,3 +137,97 @@ async def test_update_balance_amount_exceeds_balance(db_session: AsyncSessionTyp
 
     with pytest.raises(AmountExceedsBalanceError):
         await user_repo.update_balance(user.id, Decimal(-100))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+@pytest.mark.parametrize("strategy", list(ConcurrencyStrategy))
+async def test_update_balance_with_strategy(db_session: AsyncSessionType, strategy: ConcurrencyStrategy) -> None:
+    user_repo = UserRepository(db_session, strategy=strategy)
+    user = await user_repo.create(UserCreate(id=f"user_id_5_{strategy}", name="test_user_5"))
+    await db_session.commit()
+
+    await user_repo.update_balance(user.id, Decimal(50))
+    await user_repo.update_balance(user.id, Decimal(-20))
+    await db_session.commit()
+    await db_session.refresh(user)
+
+    assert user.balance == Decimal(30)
+    assert user.version == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_update_balance_optimistic_conflict(
+    db_session: AsyncSessionType,
+    db_sessionmaker: async_sessionmaker[AsyncSessionType],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    user_repo = UserRepository(db_session, strategy=ConcurrencyStrategy.OPTIMISTIC)
+    user = await user_repo.create(UserCreate(id="user_id_6", name="test_user_6"))
+    user_id = user.id
+    await db_session.commit()
+
+    execute = db_session.execute
+
+    async def execute_and_update_concurrently(statement: Executable) -> Result[Any]:
+        result = await execute(statement)
+        monkeypatch.undo()
+        async with db_sessionmaker() as other_session:
+            await UserRepository(other_session).update_balance(user_id, Decimal(10))
+            await other_session.commit()
+        return result
+
+    monkeypatch.setattr(db_session, "execute", execute_and_update_concurrently)
+    with pytest.raises(ConcurrentUpdateError):
+        await user_repo.update_balance(user_id, Decimal(50))
+    await db_session.rollback()
+
+    await user_repo.update_balance(user_id, Decimal(50))
+    await db_session.commit()
+    await db_session.refresh(user)
+    assert user.balance == Decimal(60)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+@pytest.mark.parametrize("strategy", list(ConcurrencyStrategy))
+async def test_update_balances(db_session: AsyncSessionType, strategy: ConcurrencyStrategy) -> None:
+    user_repo = UserRepository(db_session, strategy=strategy)
+    payer, payee = f"user_id_161_{strategy}", f"user_id_162_{strategy}"
+    await user_repo.create_many([UserCreate(id=payer, name="payer"), UserCreate(id=payee, name="payee")])
+    await user_repo.update_balance(payer, Decimal("100.10"))
+    await db_session.commit()
+
+    await user_repo.update_balances({payer: Decimal("-40.05"), payee: Decimal("40.05")})
+    await db_session.commit()
+
+    users = {user_id: await user_repo.get(user_id) for user_id in (payer, payee)}
+    for user in users.values():
+        await db_session.refresh(user)
+    assert users[payer].balance == Decimal("60.05")
+    assert users[payer].version == 2  # noqa: PLR2004
+    assert users[payee].balance == Decimal("40.05")
+    assert users[payee].version == 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_update_balances_changes_nothing_on_error(db_session: AsyncSessionType) -> None:
+    user_repo = UserRepository(db_session)
+    await user_repo.create_many(
+        [UserCreate(id="user_id_163", name="payer"), UserCreate(id="user_id_164", name="payee")]
+    )
+    await db_session.commit()
+
+    with pytest.raises(UserNotFoundError):
+        await user_repo.update_balances({"user_id_163": Decimal(-1), "user_id_165": Decimal(1)})
+    with pytest.raises(AmountExceedsBalanceError):
+        await user_repo.update_balances({"user_id_163": Decimal(-1), "user_id_164": Decimal(1)})
+    await db_session.rollback()
+
+    for user_id in ("user_id_163", "user_id_164"):
+        user = await user_repo.get(user_id)
+        await db_session.refresh(user)
+        assert user.balance == Decimal(0)
+        assert user.version == 0
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.concurrency import ConcurrencyStrategy
+from app.database.models import TransactionDb, UserDb
+from app.database.warmup import warm_up
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+@pytest.mark.parametrize("strategy", list(ConcurrencyStrategy))
+async def test_warm_up(db_sessionmaker: async_sessionmaker[AsyncSessionType], strategy: ConcurrencyStrategy) -> None:
+    engine = db_sessionmaker.kw["bind"]
+    executed: list[str] = []
+
+    def record(_conn: Connection, _cursor: object, statement: str, *_: object) -> None:
+        executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        await warm_up(db_sessionmaker, connections=3, strategy=strategy)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    assert engine.pool.checkedin() >= 3  # noqa: PLR2004
+    assert executed
+    assert not [statement for statement in executed if not statement.lstrip().upper().startswith("SELECT")]
+    assert not [statement for statement in executed if "FOR UPDATE" in statement]
+    async with db_sessionmaker() as session:
+        users = await session.scalar(select(func.count()).where(UserDb.id.startswith("warmup-")))
+        transactions = await session.scalar(select(func.count()).where(TransactionDb.uid.startswith("warmup-")))
+    assert users == 0
+    assert transactions == 0
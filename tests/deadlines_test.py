@@ -0,0 +1,123 @@
+import time
+from collections.abc import AsyncIterator
+from datetime import datetime
+from decimal import Decimal
+
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSessionType
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.api.base import get_admission_controller, get_user_service
+from app.application import AppBuilder
+from app.deadlines import EXPIRED, deadline, enforce_statement_timeouts, time_left
+from app.exceptions import DeadlineExceededError
+from app.schemas import UserBalance
+
+
+class UserServiceStub:
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+        self.time_left: list[float | None] = []
+
+    async def get_balance(self, user_id: str, ts: datetime | None = None) -> UserBalance:
+        self.time_left.append(time_left())
+        if self.error is not None:
+            raise self.error
+        return UserBalance(user_id=user_id, balance=Decimal(1), ts=ts)
+
+
+async def client_for(user_service: UserServiceStub) -> AsyncIterator[httpx.AsyncClient]:
+    builder = AppBuilder()
+    builder.app.dependency_overrides[get_admission_controller] = lambda: None
+    builder.app.dependency_overrides[get_user_service] = lambda: user_service
+    transport = httpx.ASGITransport(app=builder.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def test_nested_deadline_keeps_the_sooner_one() -> None:
+    assert time_left() is None
+    with deadline(10):
+        with deadline(100):
+            left = time_left()
+            assert left is not None
+            assert left <= 10  # noqa: PLR2004
+        with deadline(1):
+            left = time_left()
+            assert left is not None
+            assert left <= 1
+    assert time_left() is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_request_budget() -> None:
+    user_service = UserServiceStub()
+    async for client in client_for(user_service):
+        response = await client.get("/api/user/user_id_1/balance/")
+        assert response.status_code == 200  # noqa: PLR2004
+        response = await client.get("/api/user/user_id_1/balance/", headers={"X-Request-Timeout": "0.5"})
+        assert response.status_code == 200  # noqa: PLR2004
+
+        for header in ("soon", "nan", "0", "-1"):
+            response = await client.get("/api/user/user_id_1/balance/", headers={"X-Request-Timeout": header})
+            assert response.status_code == 400  # noqa: PLR2004
+
+    # The read lane's budget, then the client's.
+    first, second = user_service.time_left
+    assert first is not None
+    assert 1 < first <= 2  # noqa: PLR2004
+    assert second is not None
+    assert 0 < second <= 0.5  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_expired_requests_are_rejected_before_the_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DEADLINES__ROUTES", '{"get_user_balance": 0}')
+    user_service = UserServiceStub()
+    expired = EXPIRED.value(route="get_user_balance", stage="admission")
+    async for client in client_for(user_service):
+        response = await client.get("/api/user/user_id_1/balance/")
+
+    assert response.status_code == 504  # noqa: PLR2004
+    assert user_service.time_left == []
+    assert EXPIRED.value(route="get_user_balance", stage="admission") == expired + 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_expired_statements_answer_504() -> None:
+    user_service = UserServiceStub(DeadlineExceededError())
+    expired = EXPIRED.value(route="get_user_balance", stage="database")
+    async for client in client_for(user_service):
+        response = await client.get("/api/user/user_id_1/balance/")
+
+    assert response.status_code == 504  # noqa: PLR2004
+    assert EXPIRED.value(route="get_user_balance", stage="database") == expired + 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.usefixtures("check_database")
+async def test_statement_timeout_follows_deadline(db_sessionmaker: async_sessionmaker[AsyncSessionType]) -> None:
+    engine = create_async_engine(db_sessionmaker.kw["bind"].url, pool_size=1, max_overflow=0)
+    enforce_statement_timeouts(engine, slack=0.05)
+    try:
+        async with engine.connect() as conn:
+            with deadline(0.3):
+                timeout = await conn.scalar(text("SHOW statement_timeout"))
+                assert 250 < int(timeout.removesuffix("ms")) <= 300  # noqa: PLR2004
+
+                started = time.monotonic()
+                with pytest.raises(DeadlineExceededError):
+                    await conn.execute(text("SELECT pg_sleep(5)"))
+                assert time.monotonic() - started < 1
+            await conn.rollback()
+
+            # The timeout ends with the transaction, statements without a deadline run without it.
+            assert await conn.scalar(text("SHOW statement_timeout")) == "0"
+            await conn.rollback()
+
+            with deadline(0), pytest.raises(DeadlineExceededError):
+                await conn.execute(text("SELECT 1"))
+    finally:
+        await engine.dispose()
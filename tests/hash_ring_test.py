@@ -0,0 +1,32 @@
+import collections
+
+from app.database.sharding import HashRing
+
+
+KEYS = [f"user_{number}" for number in range(10_000)]
+
+
+def test_ring_is_deterministic() -> None:
+    ring = HashRing(["a", "b", "c"], virtual_nodes=64)
+    other = HashRing(["c", "b", "a"], virtual_nodes=64)
+
+    assert [ring.node_for(key) for key in KEYS] == [other.node_for(key) for key in KEYS]
+
+
+def test_ring_spreads_keys() -> None:
+    ring = HashRing(["a", "b", "c", "d"], virtual_nodes=64)
+
+    counts = collections.Counter(ring.node_for(key) for key in KEYS)
+
+    assert set(counts) == {"a", "b", "c", "d"}
+    assert all(1_500 < count < 3_500 for count in counts.values())  # noqa: PLR2004
+
+
+def test_adding_node_only_moves_keys_to_it() -> None:
+    before = HashRing(["a", "b", "c"], virtual_nodes=64)
+    after = HashRing(["a", "b", "c", "d"], virtual_nodes=64)
+
+    moved = [key for key in KEYS if before.node_for(key) != after.node_for(key)]
+
+    assert all(after.node_for(key) == "d" for key in moved)
+    assert 1_500 < len(moved) < 3_500  # noqa: PLR2004
@@ -0,0 +1,118 @@
+import json
+import logging
+import queue
+import sys
+from collections.abc import Iterator
+
+import pytest
+
+from app.logs import (
+    DROPPED,
+    SAMPLED_OUT,
+    DroppingQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    configure_logging,
+    stop_logging,
+)
+from app.settings import Settings
+
+
+class ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.lines: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
+
+
+def make_record(name: str, level: int, msg: str = "message", *args: object) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+@pytest.fixture
+def root_handlers() -> Iterator[list[logging.Handler]]:
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield handlers
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_json_formatter() -> None:
+    msg = "boom"
+    try:
+        raise ValueError(msg)  # noqa: TRY301
+    except ValueError:
+        record = logging.getLogger("app.test").makeRecord(
+            "app.test", logging.ERROR, __file__, 1, "failed %s", ("once",), sys.exc_info(), extra={"user_id": "u1"}
+        )
+
+    data = json.loads(JsonFormatter().format(record))
+
+    assert data["level"] == "ERROR"
+    assert data["logger"] == "app.test"
+    assert data["message"] == "failed once"
+    assert data["user_id"] == "u1"
+    assert "ValueError: boom" in data["exc_info"]
+
+
+def test_queue_handler_drops_when_full() -> None:
+    handler = DroppingQueueHandler(queue.Queue(2))
+    dropped = DROPPED.value(level="INFO")
+    values = ["before"]
+
+    for _ in range(5):
+        handler.handle(make_record("app.test", logging.INFO, "%s", values))
+    values.append("after")
+
+    assert handler.queue.qsize() == 2  # noqa: PLR2004
+    assert DROPPED.value(level="INFO") == dropped + 3
+    # Rendered when logged, not when written.
+    assert handler.queue.get_nowait().getMessage() == "['before']"
+
+
+def test_sampling_filter() -> None:
+    sampling = SamplingFilter({"sqlalchemy.engine": 0.25, "noisy": 0})
+    sampled_out = SAMPLED_OUT.value(logger="sqlalchemy.engine")
+
+    kept = [sampling.filter(make_record("sqlalchemy.engine.Engine", logging.INFO)) for _ in range(8)]
+
+    assert kept.count(True) == 2  # noqa: PLR2004
+    assert SAMPLED_OUT.value(logger="sqlalchemy.engine") == sampled_out + 6
+    assert sampling.filter(make_record("sqlalchemy.engine.Engine", logging.WARNING))
+    assert sampling.filter(make_record("sqlalchemy.pool", logging.DEBUG))
+    assert not sampling.filter(make_record("noisy.child", logging.DEBUG))
+
+
+@pytest.mark.usefixtures("root_handlers")
+def test_configure_logging() -> None:
+    root = logging.getLogger()
+    root.handlers[:] = [target := ListHandler()]
+    target.setFormatter(formatter := logging.Formatter("%(levelname)s %(message)s"))
+    root.setLevel(logging.INFO)
+
+    listener = configure_logging(Settings(logging={"sampling": {"app.noisy": 0.5}}))
+    assert listener is not None
+    assert [type(handler) for handler in root.handlers] == [DroppingQueueHandler]
+    logging.getLogger("app.test").info("written by %s", "the listener")
+    for _ in range(4):
+        logging.getLogger("app.noisy").info("sampled")
+    stop_logging(listener)
+
+    assert root.handlers == [target]
+    assert target.formatter is formatter
+    records = [json.loads(line) for line in target.lines]
+    assert records[0]["message"] == "written by the listener"
+    assert records[0]["thread"] == "MainThread"
+    assert [record["logger"] for record in records[1:]] == ["app.noisy", "app.noisy"]
+
+
+@pytest.mark.usefixtures("root_handlers")
+def test_logging_without_queue() -> None:
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+
+    assert configure_logging(Settings(logging={"queue": False})) is None
+    assert root.handlers == handlers
@@ -0,0 +1,77 @@
+import asyncio
+import gc
+import time
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app import schemas
+from app.database.memory_ledger import MemoryLedger, MemoryTransactionRepository, MemoryUserRepository
+from app.loop_monitor import LAG, LAG_QUANTILES, SLOW_CALLBACKS, LoopMonitor
+from app.services import TransactionService, UserService
+from app.types import TransactionType
+
+
+def blocking_call() -> None:
+    time.sleep(0.2)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_blocking_call_is_recorded_with_its_stack() -> None:
+    slow_callbacks = SLOW_CALLBACKS.value()
+    lags = LAG.count()
+    async with LoopMonitor(interval=0.01, threshold=0.05) as monitor:
+        await asyncio.sleep(0.05)
+        blocking_call()
+        await asyncio.sleep(0.05)
+
+    (slow_callback,) = monitor.slow_callbacks
+    assert slow_callback.duration >= 0.15  # noqa: PLR2004
+    assert "in blocking_call" in slow_callback.stack
+    assert "time.sleep(0.2)" in slow_callback.stack
+    assert SLOW_CALLBACKS.value() == slow_callbacks + 1
+    assert LAG.count() > lags
+    assert LAG_QUANTILES.value(quantile="0.99") >= 0.15  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_services_do_not_block_the_loop(
+    db_session_mock: AsyncMock, outbox_repo_mock: AsyncMock, ledger_repo_mock: AsyncMock
+) -> None:
+    ledger = MemoryLedger()
+    user_repo, transaction_repo = MemoryUserRepository(ledger), MemoryTransactionRepository(ledger)
+    user_service = UserService(user_repo=user_repo, transaction_repo=transaction_repo, db_session=db_session_mock)
+    transaction_service = TransactionService(
+        transaction_repo=transaction_repo,
+        user_repo=user_repo,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
+    )
+    await user_service.create_user(schemas.UserCreate(id="user_id_141", name="user_id_141"))
+    started = datetime.now(UTC) - timedelta(days=1)
+
+    # A full collection over the test session's heap blocks the loop too, but is not the services' doing.
+    gc.collect()
+    gc.freeze()
+    try:
+        async with LoopMonitor(interval=0.005, threshold=0.05) as monitor:
+            for number in range(2_000):
+                created_at = started + timedelta(seconds=number)
+                await transaction_service.add_transaction(
+                    schemas.TransactionAdd(
+                        uid=f"tr_uid_141_{number}",
+                        user_id="user_id_141",
+                        amount=Decimal("1.01"),
+                        type=TransactionType.DEPOSIT,
+                        created_at=created_at,
+                    )
+                )
+                await user_service.get_balance("user_id_141", ts=created_at)
+                await asyncio.sleep(0)
+    finally:
+        gc.unfreeze()
+
+    assert list(monitor.slow_callbacks) == []
@@ -0,0 +1,181 @@
+import random
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.database import memory_ledger
+from app.database.memory_ledger import (
+    BalanceHistory,
+    FenwickTree,
+    MemoryLedger,
+    MemoryTransactionRepository,
+    MemoryUserRepository,
+)
+from app.exceptions import AmountExceedsBalanceError, TransactionProcessedError, UserNotFoundError
+from app.schemas import TransactionAdd, UserCreate
+from app.services import UserService
+from app.types import TransactionType
+
+
+@pytest.fixture
+def ledger() -> MemoryLedger:
+    return MemoryLedger()
+
+
+@pytest.fixture
+def user_repo(ledger: MemoryLedger) -> MemoryUserRepository:
+    return MemoryUserRepository(ledger)
+
+
+@pytest.fixture
+def transaction_repo(ledger: MemoryLedger) -> MemoryTransactionRepository:
+    return MemoryTransactionRepository(ledger)
+
+
+def test_fenwick_tree() -> None:
+    rng = random.Random(1)  # noqa: S311
+    values = [rng.randint(-100, 100) for _ in range(50)]
+    tree = FenwickTree(values[:20])
+    for value in values[20:]:
+        tree.append(value)
+    for _ in range(50):
+        index, delta = rng.randrange(len(values)), rng.randint(-10, 10)
+        values[index] += delta
+        tree.add(index, delta)
+
+    assert len(tree) == len(values)
+    assert [tree.prefix(count) for count in range(len(values) + 1)] == [
+        sum(values[:count]) for count in range(len(values) + 1)
+    ]
+
+
+def test_balance_history_with_backdated_inserts(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Small blocks, so appends open new blocks and backdated inserts split full ones.
+    monkeypatch.setattr(memory_ledger, "BLOCK_SIZE", 4)
+    rng = random.Random(2)  # noqa: S311
+    history = BalanceHistory()
+    transactions = []
+    for number in range(300):
+        # Mostly in time order, every third one backdated.
+        micros = number * 10 if number % 3 else rng.randrange(number * 10 + 1)
+        amount = rng.randint(-50, 100)
+        history.add(micros, amount)
+        transactions.append((micros, amount))
+
+    assert len(history) == len(transactions)
+    assert history.total() == sum(amount for _, amount in transactions)
+    for until in [-1, 0, 5, 123, 1500, 2990, 5000, *(rng.randrange(3000) for _ in range(100))]:
+        assert history.sum_until(until) == sum(amount for micros, amount in transactions if micros <= until)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_users(user_repo: MemoryUserRepository) -> None:
+    user = await user_repo.create(UserCreate(id="user_id_1", name="test_user_1"))
+    assert user is not None
+    assert user.balance == Decimal(0)
+    assert await user_repo.create(UserCreate(id="user_id_1", name="again")) is None
+    assert await user_repo.create_many(
+        [UserCreate(id="user_id_1", name="again"), UserCreate(id="user_id_2", name="test_user_2")]
+    ) == {"user_id_2"}
+
+    await user_repo.update_balance("user_id_1", Decimal(50))
+    await user_repo.update_balance("user_id_1", Decimal("-20.5"))
+    user = await user_repo.get("user_id_1")
+    assert user is not None
+    assert user.balance == Decimal("29.5")
+    assert user.version == 2  # noqa: PLR2004
+    assert await user_repo.exists("user_id_2")
+    assert [user.id for user in await user_repo.get_top_by_balance(1)] == ["user_id_1"]
+
+    with pytest.raises(AmountExceedsBalanceError):
+        await user_repo.update_balance("user_id_1", Decimal(-50))
+    with pytest.raises(UserNotFoundError):
+        await user_repo.update_balance("non_existent_user", Decimal(50))
+
+    await user_repo.update_balances({"user_id_1": Decimal("-9.5"), "user_id_2": Decimal("9.5")})
+    with pytest.raises(AmountExceedsBalanceError):
+        await user_repo.update_balances({"user_id_1": Decimal(30), "user_id_2": Decimal(-30)})
+    balances = {user.id: user.balance for user in await user_repo.get_top_by_balance(2)}
+    assert balances == {"user_id_1": Decimal(20), "user_id_2": Decimal("9.5")}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_transactions(user_repo: MemoryUserRepository, transaction_repo: MemoryTransactionRepository) -> None:
+    await user_repo.create(UserCreate(id="user_id_1", name="test_user_1"))
+    data = TransactionAdd(
+        uid="tr_uid_1",
+        user_id="user_id_1",
+        amount=Decimal("12.34"),
+        type=TransactionType.WITHDRAW,
+        created_at=datetime(2024, 1, 1, 12, 30, 0, 123456, tzinfo=UTC),
+    )
+    await transaction_repo.add(data)
+
+    transaction = await transaction_repo.get("tr_uid_1")
+    assert transaction is not None
+    assert (transaction.uid, transaction.user_id, transaction.amount, transaction.type, transaction.created_at) == (
+        data.uid,
+        data.user_id,
+        data.amount,
+        data.type,
+        data.created_at,
+    )
+    assert await transaction_repo.exists("tr_uid_1")
+    assert await transaction_repo.get("tr_uid_2") is None
+
+    with pytest.raises(TransactionProcessedError):
+        await transaction_repo.add(data)
+    with pytest.raises(UserNotFoundError):
+        await transaction_repo.add(data.model_copy(update={"uid": "tr_uid_2", "user_id": "user_id_2"}))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_total_sum(user_repo: MemoryUserRepository, transaction_repo: MemoryTransactionRepository) -> None:
+    # The cases of the Postgres repository's ``get_total_sum`` tests, with the newest transaction added first.
+    await user_repo.create(UserCreate(id="user_id_1", name="test_user_1"))
+    now = datetime.now(UTC)
+    for uid, amount, type_, created_at in [
+        ("tr_uid_3", Decimal(25), TransactionType.DEPOSIT, now),
+        ("tr_uid_1", Decimal(100), TransactionType.DEPOSIT, now - timedelta(days=2)),
+        ("tr_uid_2", Decimal(50), TransactionType.WITHDRAW, now - timedelta(days=1)),
+    ]:
+        await transaction_repo.add(
+            TransactionAdd(uid=uid, user_id="user_id_1", amount=amount, type=type_, created_at=created_at)
+        )
+
+    cases = [
+        ({}, Decimal(75)),
+        ({"before": now - timedelta(hours=1)}, Decimal(50)),
+        ({"before": now}, Decimal(75)),
+        ({"before": now - timedelta(days=3)}, Decimal(0)),
+        ({"after": now - timedelta(hours=1)}, Decimal(25)),
+        ({"after": now}, Decimal(25)),
+        ({"after": now - timedelta(days=1)}, Decimal(-25)),
+        ({"after": now - timedelta(days=3)}, Decimal(75)),
+        ({"after": now - timedelta(days=1, hours=1), "before": now - timedelta(hours=1)}, Decimal(-50)),
+    ]
+    for bounds, expected in cases:
+        assert await transaction_repo.get_total_sum(user_id="user_id_1", **bounds) == expected
+    assert await transaction_repo.get_total_sum(user_id="user_id_2") == Decimal(0)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_user_service_on_memory_ledger(
+    db_session_mock: AsyncMock, user_repo: MemoryUserRepository, transaction_repo: MemoryTransactionRepository
+) -> None:
+    user_service = UserService(user_repo=user_repo, transaction_repo=transaction_repo, db_session=db_session_mock)
+    await user_service.create_user(UserCreate(id="user_id_1", name="test_user_1"))
+    await transaction_repo.add(
+        TransactionAdd(
+            uid="tr_uid_1",
+            user_id="user_id_1",
+            amount=Decimal(10),
+            type=TransactionType.DEPOSIT,
+            created_at=datetime(2024, 1, 1, tzinfo=UTC),
+        )
+    )
+
+    balance = await user_service.get_balance("user_id_1", ts=datetime(2024, 1, 2, tzinfo=UTC))
+    assert balance.balance == Decimal(10)
@@ -0,0 +1,49 @@
+import math
+
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_render() -> None:
+    registry = Registry()
+    counter = Counter("requests_total", "Requests.", registry=registry)
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+
+    assert counter.value(route="/a") == 3  # noqa: PLR2004
+    assert counter.value(route="/b") == 0
+    assert registry.render() == (
+        '# HELP requests_total Requests.\n# TYPE requests_total counter\nrequests_total{route="/a"} 3\n'
+    )
+
+
+def test_gauge_callback() -> None:
+    registry = Registry()
+    gauge = Gauge("pool_size", "Pool size.", registry=registry, callback=lambda: 5)
+
+    assert gauge.value() == 5  # noqa: PLR2004
+    assert registry.render().endswith("pool_size 5\n")
+
+
+def test_histogram() -> None:
+    registry = Registry()
+    histogram = Histogram("latency_seconds", "Latency.", registry=registry, buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.count() == 4  # noqa: PLR2004
+    assert histogram.quantile(0.5) == pytest.approx(0.55)
+    assert math.isnan(histogram.quantile(0.5, route="/missing"))
+    rendered = registry.render()
+    assert 'latency_seconds_bucket{le="1"} 3' in rendered
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in rendered
+    assert "latency_seconds_count 4" in rendered
+
+
+def test_duplicate_registration() -> None:
+    registry = Registry()
+    Counter("requests_total", "Requests.", registry=registry)
+
+    with pytest.raises(ValueError, match="already registered"):
+        Counter("requests_total", "Requests.", registry=registry)
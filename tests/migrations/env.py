@@ -3,7 +3,9 @@ from logging.config import fileConfig
 from alembic import context
 from sqlalchemy import URL, engine_from_config, pool
 
-from app.database.models import METADATA
+from app.database.models import METADATA, TransactionDb
+from app.database.partitions import is_partition_name
+from app.database.utils import Money
 
 
 # this is the Alembic Config object, which provides
@@ -30,6 +32,19 @@ if config.config_file_name is not None:
 # add your model's MetaData object here for 'autogenerate' support
 target_metadata = METADATA
 
+
+def include_name(name, type_, parent_names) -> bool:  # noqa: ANN001, ARG001
+    # Partitions are created by ``app.jobs.partitions``, not by migrations.
+    return not (type_ == "table" and is_partition_name(TransactionDb.__tablename__, name))
+
+
+def render_item(type_, obj, autogen_context) -> str | bool:  # noqa: ANN001, ARG001
+    # Amounts are plain BIGINT columns in the database, migrations should not import application types.
+    if type_ == "type" and isinstance(obj, Money):
+        return "sa.BigInteger()"
+    return False
+
+
 config.set_section_option("alembic", "sqlalchemy.url", get_dsn().render_as_string(hide_password=False))
 
 
@@ -79,6 +94,8 @@ def run_migrations_online() -> None:
             url=get_dsn(),
             connection=connection,
             target_metadata=target_metadata,
+            include_name=include_name,
+            render_item=render_item,
             process_revision_directives=process_revision_directives,
         )
 
@@ -0,0 +1,98 @@
+import asyncio
+import marshal
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.application import AppBuilder
+from app.exceptions import ProfilerBusyError
+from app.profiling import StackSampler, exclusive
+
+
+def busy(seconds: float) -> None:
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def test_sampler_collapses_stacks() -> None:
+    sampler = StackSampler(threading.get_ident(), interval=0.001)
+    sampler.sample(sys._getframe())  # noqa: SLF001
+    sampler.sample(sys._getframe())  # noqa: SLF001
+
+    ((stack, count),) = sampler.stacks.items()
+    first_line = test_sampler_collapses_stacks.__code__.co_firstlineno
+    assert stack.endswith(f";test_sampler_collapses_stacks (profiling_test.py:{first_line})")
+    assert count == 2  # noqa: PLR2004
+    assert sampler.collapsed() == f"{stack} 2\n"
+
+    # Stacks outside the code profiled are not counted.
+    within = StackSampler(threading.get_ident(), interval=0.001, within=busy.__code__)
+    within.sample(sys._getframe())  # noqa: SLF001
+    assert within.samples == 0
+
+
+def test_sampler_samples_thread() -> None:
+    with StackSampler(threading.get_ident(), interval=0.001, within=busy.__code__) as sampler:
+        busy(0.1)
+
+    assert sampler.samples > 0
+    assert all(f"busy (profiling_test.py:{busy.__code__.co_firstlineno})" in stack for stack in sampler.stacks)
+
+
+def test_one_profile_at_a_time() -> None:
+    with exclusive(), pytest.raises(ProfilerBusyError), exclusive():
+        pass
+    with exclusive():
+        pass
+
+
+@pytest.fixture
+def profiling_app(monkeypatch: pytest.MonkeyPatch) -> AppBuilder:
+    monkeypatch.setenv("PROFILING__ENABLED", "true")
+    monkeypatch.setenv("PROFILING__TOKEN", "secret")
+    monkeypatch.setenv("PROFILING__MAX_SECONDS", "1")
+    return AppBuilder()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_profile_endpoint(profiling_app: AppBuilder) -> None:
+    transport = httpx.ASGITransport(app=profiling_app.app)
+    auth = {"Authorization": "Bearer secret"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/admin/profile", params={"seconds": 0.1})
+        assert response.status_code == 401  # noqa: PLR2004
+        response = await client.post("/admin/profile", params={"seconds": 0.1}, headers={"Authorization": "Bearer x"})
+        assert response.status_code == 401  # noqa: PLR2004
+        response = await client.post("/admin/profile", params={"seconds": 2}, headers=auth)
+        assert response.status_code == 400  # noqa: PLR2004
+
+        response = await client.post("/admin/profile", params={"seconds": 0.1}, headers=auth)
+        assert response.status_code == 200  # noqa: PLR2004
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        assert response.text.splitlines()[0].rsplit(" ", 1)[1].isdigit()
+
+        response = await client.post(
+            "/admin/profile", params={"seconds": 0.1}, headers={**auth, "X-Profile-Route": "unknown"}
+        )
+        assert response.status_code == 404  # noqa: PLR2004
+        responses = await asyncio.gather(
+            client.post("/admin/profile", params={"seconds": 0.2}, headers={**auth, "X-Profile-Route": "live"}),
+            client.post("/admin/profile", params={"seconds": 0.2}, headers=auth),
+        )
+        assert sorted(response.status_code for response in responses) == [200, 409]
+
+        response = await client.post("/admin/profile", params={"seconds": 0.1, "format": "pstats"}, headers=auth)
+        assert response.status_code == 200  # noqa: PLR2004
+        assert isinstance(marshal.loads(response.content), dict)  # noqa: S302
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_profile_endpoint_disabled_by_default() -> None:
+    transport = httpx.ASGITransport(app=AppBuilder().app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/admin/profile", headers={"Authorization": "Bearer "})
+        assert response.status_code == 404  # noqa: PLR2004
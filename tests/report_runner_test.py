@@ -0,0 +1,146 @@
+import asyncio
+import concurrent.futures
+from collections.abc import Callable
+from concurrent.futures.process import BrokenProcessPool
+from datetime import UTC, datetime
+from pathlib import Path
+
+import pytest
+
+from app.api.base import byte_range
+from app.exceptions import RangeNotSatisfiableError, ReportNotFoundError, ServiceOverloadedError, TooManyReportsError
+from app.schemas import Report, ReportCreate
+from app.services.reports import REPORTS_IN_PROGRESS, ReportRunner, load_report, report_path, save_report
+from app.settings import Settings
+from app.types import ReportKind, ReportStatus
+
+
+STATEMENT = ReportCreate(kind=ReportKind.STATEMENT, user_id="user_id_1")
+
+
+class PendingExecutor(concurrent.futures.Executor):
+    """Keeps the submitted reports queued until a test finishes them."""
+
+    def __init__(self) -> None:
+        self.futures: list[concurrent.futures.Future[None]] = []
+
+    def submit(
+        self,
+        fn: Callable[..., None],  # noqa: ARG002
+        /,
+        *args: object,  # noqa: ARG002
+        **kwargs: object,  # noqa: ARG002
+    ) -> concurrent.futures.Future[None]:
+        future: concurrent.futures.Future[None] = concurrent.futures.Future()
+        self.futures.append(future)
+        return future
+
+
+@pytest.fixture
+def executor() -> PendingExecutor:
+    return PendingExecutor()
+
+
+@pytest.fixture
+def runner(tmp_path: Path, executor: PendingExecutor) -> ReportRunner:
+    settings = Settings(reports={"directory": tmp_path, "max_jobs": 3, "tenant_jobs": 2})
+    report_runner = ReportRunner(settings, executor)
+    report_runner.start()
+    return report_runner
+
+
+async def settle(runner: ReportRunner) -> None:
+    """Wait until the runner has taken note of the finished reports."""
+    for _ in range(100):
+        if all(not future.done() for future in runner._futures.values()):  # noqa: SLF001
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_byte_range() -> None:
+    assert byte_range(None, 100) is None
+    assert byte_range("bytes=0-9", 100) == (0, 9)
+    assert byte_range("bytes=90-", 100) == (90, 99)
+    assert byte_range("bytes=90-200", 100) == (90, 99)
+    assert byte_range("bytes=-10", 100) == (90, 99)
+    assert byte_range("bytes=-200", 100) == (0, 99)
+    # Ignored: other units, several ranges, malformed ones.
+    assert byte_range("items=0-9", 100) is None
+    assert byte_range("bytes=0-9,20-29", 100) is None
+    assert byte_range("bytes=9-0", 100) is None
+    assert byte_range("bytes=a-", 100) is None
+    assert byte_range("bytes=-", 100) is None
+    for unsatisfiable in ("bytes=100-", "bytes=-0", "bytes=100-200"):
+        with pytest.raises(RangeNotSatisfiableError):
+            byte_range(unsatisfiable, 100)
+    with pytest.raises(RangeNotSatisfiableError):
+        byte_range("bytes=-1", 0)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_runner_limits_tenants(runner: ReportRunner, executor: PendingExecutor) -> None:
+    in_progress = REPORTS_IN_PROGRESS.value()
+    first = await runner.submit("tenant_a", STATEMENT)
+    second = await runner.submit("tenant_a", STATEMENT)
+    with pytest.raises(TooManyReportsError):
+        await runner.submit("tenant_a", STATEMENT)
+
+    await runner.submit("tenant_b", STATEMENT)
+    with pytest.raises(ServiceOverloadedError):
+        await runner.submit("tenant_c", STATEMENT)
+    assert REPORTS_IN_PROGRESS.value() == in_progress + 3
+
+    assert (await runner.get("tenant_a", first.id)).status == ReportStatus.QUEUED
+    with pytest.raises(ReportNotFoundError):
+        await runner.get("tenant_b", first.id)
+
+    executor.futures[0].set_result(None)
+    await settle(runner)
+    assert REPORTS_IN_PROGRESS.value() == in_progress + 2
+    await runner.submit("tenant_a", STATEMENT)
+
+    # Reports still queued when the worker stops fail.
+    await runner.close()
+    await settle(runner)
+    assert all(future.cancelled() for future in executor.futures[1:])
+    assert (await runner.get("tenant_a", second.id)).status == ReportStatus.FAILED
+    assert REPORTS_IN_PROGRESS.value() == in_progress
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_runner_records_crashed_processes(runner: ReportRunner, executor: PendingExecutor) -> None:
+    report = await runner.submit("tenant_a", STATEMENT)
+
+    executor.futures[0].set_exception(BrokenProcessPool("A child process terminated abruptly"))
+    await settle(runner)
+
+    failed = await runner.get("tenant_a", report.id)
+    assert failed.status == ReportStatus.FAILED
+    assert failed.error == "A child process terminated abruptly"
+    await runner.close()
+
+
+def test_purge(runner: ReportRunner) -> None:
+    for report_id, status, finished_at in [
+        ("0" * 32, ReportStatus.DONE, datetime(2020, 1, 1, tzinfo=UTC)),
+        ("1" * 32, ReportStatus.DONE, datetime.now(UTC)),
+        # A running report is never purged, however old.
+        ("2" * 32, ReportStatus.RUNNING, None),
+    ]:
+        report = Report(
+            id=report_id,
+            tenant="tenant_a",
+            request=STATEMENT,
+            status=status,
+            created_at=datetime(2020, 1, 1, tzinfo=UTC),
+            finished_at=finished_at,
+        )
+        save_report(runner.directory, report)
+        report_path(runner.directory, report_id).write_text("user_id,ts,balance\n")
+
+    runner.purge()
+
+    assert load_report(runner.directory, "0" * 32) is None
+    assert not report_path(runner.directory, "0" * 32).exists()
+    assert load_report(runner.directory, "1" * 32) is not None
+    assert load_report(runner.directory, "2" * 32) is not None
@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+import pytest
+
+from app.services.balance_updates import DROPPED, BalanceSubscriptions, BalanceUpdate, balance_events
+
+
+def update(version: int, user_id: str = "user_1") -> BalanceUpdate:
+    return BalanceUpdate(user_id=user_id, balance=Decimal(version), version=version)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_publish_reaches_only_the_users_subscriptions() -> None:
+    subscriptions = BalanceSubscriptions(buffer_size=4)
+    subscription = subscriptions.subscribe("user_1")
+    other = subscriptions.subscribe("user_2")
+
+    subscriptions.publish(update(1))
+
+    assert await subscription.get(max_wait=0.01) == update(1)
+    assert await other.get(max_wait=0.01) is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_full_buffer_drops_oldest_updates() -> None:
+    subscriptions = BalanceSubscriptions(buffer_size=2)
+    subscription = subscriptions.subscribe("user_1")
+    dropped = DROPPED.value()
+
+    for version in range(1, 4):
+        subscriptions.publish(update(version))
+
+    assert DROPPED.value() == dropped + 1
+    assert await subscription.get(max_wait=0.01) == update(2)
+    assert await subscription.get(max_wait=0.01) == update(3)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_balance_events() -> None:
+    subscriptions = BalanceSubscriptions(buffer_size=4)
+    subscription = subscriptions.subscribe("user_1")
+    events = balance_events(subscriptions, subscription, update(2), heartbeat=0.01)
+
+    assert await anext(events) == 'event: balance\nid: 2\ndata: {"user_id":"user_1","balance":"2"}\n\n'
+    subscriptions.publish(update(1))
+    subscriptions.publish(update(3))
+    assert await anext(events) == 'event: balance\nid: 3\ndata: {"user_id":"user_1","balance":"3"}\n\n'
+    assert await anext(events) == ": keep-alive\n\n"
+
+    subscriptions.close_all()
+    with pytest.raises(StopAsyncIteration):
+        await anext(events)
+    subscriptions.publish(update(4))
+    assert await subscription.get(max_wait=0.01) is None
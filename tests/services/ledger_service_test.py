@@ -0,0 +1,73 @@
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.database.models import UserDb
+from app.schemas import DailyVolume, Liabilities, UserBalance
+from app.services import LedgerService, ShardedLedgerService
+from app.types import TransactionType
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_liabilities(
+    db_session_mock: AsyncMock, ledger_repo_mock: AsyncMock, user_repo_mock: AsyncMock
+) -> None:
+    ledger_service = LedgerService(ledger_repo=ledger_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock)
+    ledger_repo_mock.get_liabilities.return_value = Decimal("10.5")
+
+    assert await ledger_service.get_liabilities() == Liabilities(total=Decimal("10.5"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_daily_volumes_lists_every_type(
+    db_session_mock: AsyncMock, ledger_repo_mock: AsyncMock, user_repo_mock: AsyncMock
+) -> None:
+    ledger_service = LedgerService(ledger_repo=ledger_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock)
+    ledger_repo_mock.get_daily_volumes.return_value = [
+        SimpleNamespace(type=TransactionType.DEPOSIT, amount=Decimal(7), transactions_count=2)
+    ]
+
+    volumes = await ledger_service.get_daily_volumes(date(2024, 5, 1))
+    assert volumes == [
+        DailyVolume(day=date(2024, 5, 1), type=TransactionType.WITHDRAW, amount=Decimal(0), transactions_count=0),
+        DailyVolume(day=date(2024, 5, 1), type=TransactionType.DEPOSIT, amount=Decimal(7), transactions_count=2),
+    ]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_top_users(
+    db_session_mock: AsyncMock, ledger_repo_mock: AsyncMock, user_repo_mock: AsyncMock
+) -> None:
+    ledger_service = LedgerService(ledger_repo=ledger_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock)
+    user_repo_mock.get_top_by_balance.return_value = [UserDb(id="a", name="a", balance=Decimal(3))]
+
+    assert await ledger_service.get_top_users(1) == [UserBalance(user_id="a", balance=Decimal(3))]
+    user_repo_mock.get_top_by_balance.assert_awaited_once_with(1)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_sharded_ledger_service_merges_shards() -> None:
+    shards = [AsyncMock(spec=LedgerService), AsyncMock(spec=LedgerService)]
+    shards[0].get_liabilities.return_value = Liabilities(total=Decimal(1))
+    shards[1].get_liabilities.return_value = Liabilities(total=Decimal(2))
+    day = date(2024, 5, 1)
+    for number, shard in enumerate(shards, start=1):
+        shard.get_daily_volumes.return_value = [
+            DailyVolume(day=day, type=type_, amount=Decimal(number), transactions_count=number)
+            for type_ in TransactionType
+        ]
+    shards[0].get_top_users.return_value = [UserBalance(user_id="a", balance=Decimal(5))]
+    shards[1].get_top_users.return_value = [
+        UserBalance(user_id="b", balance=Decimal(9)),
+        UserBalance(user_id="c", balance=Decimal(1)),
+    ]
+    ledger_service = ShardedLedgerService(shards)
+
+    assert await ledger_service.get_liabilities() == Liabilities(total=Decimal(3))
+    assert await ledger_service.get_daily_volumes(day) == [
+        DailyVolume(day=day, type=type_, amount=Decimal(3), transactions_count=3) for type_ in TransactionType
+    ]
+    assert [user.user_id for user in await ledger_service.get_top_users(2)] == ["b", "a"]
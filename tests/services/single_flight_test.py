@@ -0,0 +1,103 @@
+import asyncio
+import functools
+import typing
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.deadlines import deadline
+from app.exceptions import DeadlineExceededError
+from app.services.single_flight import COALESCED, SingleFlight
+
+
+async def slow(result: str) -> str:
+    await asyncio.sleep(0.01)
+    return result
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_concurrent_calls_share_one_call() -> None:
+    single_flight = SingleFlight("test_share")
+    call = AsyncMock(side_effect=functools.partial(slow, "result"))
+
+    results = await asyncio.gather(*(single_flight.do("key", call) for _ in range(3)))
+
+    assert results == ["result"] * 3
+    call.assert_awaited_once()
+    assert COALESCED.value(operation="test_share") == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_different_keys_and_later_calls_run_again() -> None:
+    single_flight = SingleFlight("test_keys")
+    call = AsyncMock(side_effect=functools.partial(slow, "result"))
+
+    await asyncio.gather(single_flight.do("key_1", call), single_flight.do("key_2", call))
+    await single_flight.do("key_1", call)
+
+    assert call.await_count == 3  # noqa: PLR2004
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_errors_are_shared() -> None:
+    single_flight = SingleFlight("test_errors")
+
+    async def fail() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    results = await asyncio.gather(*(single_flight.do("key", fail) for _ in range(2)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_follower_takes_over_after_leader_is_cancelled() -> None:
+    single_flight = SingleFlight("test_cancel")
+    call = AsyncMock(side_effect=functools.partial(slow, "result"))
+
+    leader = asyncio.create_task(single_flight.do("key", call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(single_flight.do("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "result"
+    assert call.await_count == 2  # noqa: PLR2004
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_follower_takes_over_after_leader_deadline() -> None:
+    single_flight = SingleFlight("test_leader_deadline")
+    call = AsyncMock(side_effect=[DeadlineExceededError(), "result"])
+
+    async def leader_call() -> str:
+        await asyncio.sleep(0.01)
+        return typing.cast(str, await call())
+
+    leader = asyncio.create_task(single_flight.do("key", leader_call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(single_flight.do("key", leader_call))
+
+    assert await follower == "result"
+    with pytest.raises(DeadlineExceededError):
+        await leader
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_follower_waits_within_its_deadline() -> None:
+    single_flight = SingleFlight("test_follower_deadline")
+
+    async def slow_call() -> str:
+        await asyncio.sleep(0.2)
+        return "result"
+
+    leader = asyncio.create_task(single_flight.do("key", slow_call))
+    await asyncio.sleep(0)
+    with deadline(0.01), pytest.raises(DeadlineExceededError):
+        await single_flight.do("key", slow_call)
+
+    assert not leader.done()
+    assert await leader == "result"
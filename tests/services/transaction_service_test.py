@@ -13,6 +13,9 @@ from app.exceptions import (
     TransactionProcessedError,
 )
 from app.services import TransactionService
+from app.services.idempotency import REPLAYS, TransactionReplays
+from app.services.outbox import TRANSACTION_ADDED
+from app.services.transaction_service import transfer_legs
 from app.types import TransactionType
 
 
@@ -30,12 +33,20 @@ async def test_init(
     db_session_mock: AsyncMock,
     user_repo_mock: AsyncMock,
     transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
 ) -> None:
     transaction_service = TransactionService(
-        transaction_repo=transaction_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
     )
     assert transaction_service.transaction_repo is transaction_repo_mock
     assert transaction_service.user_repo is user_repo_mock
+    assert transaction_service.outbox_repo is outbox_repo_mock
+    assert transaction_service.ledger_repo is ledger_repo_mock
     assert transaction_service.db_session is db_session_mock
 
 
@@ -44,9 +55,15 @@ async def test_add_transaction(
     db_session_mock: AsyncMock,
     user_repo_mock: AsyncMock,
     transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
 ) -> None:
     transaction_service = TransactionService(
-        transaction_repo=transaction_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
     )
 
     transaction_repo_mock.get.return_value = None
@@ -59,6 +76,12 @@ async def test_add_transaction(
     assert added_transaction.amount == transaction_schema.amount
     assert added_transaction.type == transaction_schema.type
     assert added_transaction.created_at == transaction_schema.created_at
+    outbox_repo_mock.add.assert_awaited_once_with(
+        transaction_schema.user_id, TRANSACTION_ADDED, transaction_schema.model_dump(mode="json")
+    )
+    ledger_repo_mock.record.assert_awaited_once_with(
+        transaction_schema.type, transaction_schema.amount, transaction_schema.created_at
+    )
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -66,9 +89,15 @@ async def test_add_transaction_throws_transaction_exceeds_balance(
     db_session_mock: AsyncMock,
     user_repo_mock: AsyncMock,
     transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
 ) -> None:
     transaction_service = TransactionService(
-        transaction_repo=transaction_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
     )
 
     def raise_amount_exceeds_balance_error(user_id: str, amount: Decimal) -> None:  # noqa: ARG001
@@ -78,6 +107,8 @@ async def test_add_transaction_throws_transaction_exceeds_balance(
     user_repo_mock.update_balance.side_effect = raise_amount_exceeds_balance_error
     with pytest.raises(TransactionExceedsBalanceError):
         await transaction_service.add_transaction(transaction_schema)
+    outbox_repo_mock.add.assert_not_awaited()
+    ledger_repo_mock.record.assert_not_awaited()
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -85,9 +116,15 @@ async def test_add_transaction_throws_transaction_processed(
     db_session_mock: AsyncMock,
     user_repo_mock: AsyncMock,
     transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
 ) -> None:
     transaction_service = TransactionService(
-        transaction_repo=transaction_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
     )
     transaction_repo_mock.get.return_value = TransactionDb(**transaction_schema.model_dump())
     with pytest.raises(TransactionProcessedError):
@@ -99,9 +136,15 @@ async def test_get_transaction(
     db_session_mock: AsyncMock,
     user_repo_mock: AsyncMock,
     transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
 ) -> None:
     transaction_service = TransactionService(
-        transaction_repo=transaction_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
     )
     transaction_repo_mock.get.return_value = TransactionDb(**transaction_schema.model_dump())
 
@@ -118,10 +161,169 @@ async def test_get_transaction_throws_transaction_not_found(
     db_session_mock: AsyncMock,
     user_repo_mock: AsyncMock,
     transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
 ) -> None:
     transaction_service = TransactionService(
-        transaction_repo=transaction_repo_mock, user_repo=user_repo_mock, db_session=db_session_mock
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
     )
     transaction_repo_mock.get.return_value = None
     with pytest.raises(TransactionNotFoundError):
         await transaction_service.get_transaction("test_uid")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_replay(
+    db_session_mock: AsyncMock,
+    user_repo_mock: AsyncMock,
+    transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
+) -> None:
+    transaction_service = TransactionService(
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
+        replays=TransactionReplays(max_size=10),
+    )
+    assert transaction_service.replay_cached(transaction_schema) is None
+
+    # The stored row is found once, later retries are answered from the cache.
+    transaction_repo_mock.get.return_value = TransactionDb(**transaction_schema.model_dump())
+    from_database = REPLAYS.value(source="database")
+    replayed = await transaction_service.replay(transaction_schema)
+    assert replayed.model_dump() == transaction_schema.model_dump()
+    assert REPLAYS.value(source="database") == from_database + 1
+
+    from_cache = REPLAYS.value(source="cache")
+    retry = transaction_schema.model_copy(update={"amount": Decimal("100.00")})
+    assert transaction_service.replay_cached(retry) == replayed
+    assert REPLAYS.value(source="cache") == from_cache + 1
+    transaction_repo_mock.get.assert_awaited_once()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_replay_with_different_payload_conflicts(
+    db_session_mock: AsyncMock,
+    user_repo_mock: AsyncMock,
+    transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
+) -> None:
+    transaction_service = TransactionService(
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
+        replays=TransactionReplays(max_size=10),
+    )
+    other = transaction_schema.model_copy(update={"amount": Decimal("100.01")})
+
+    transaction_repo_mock.get.return_value = TransactionDb(**transaction_schema.model_dump())
+    with pytest.raises(TransactionProcessedError):
+        await transaction_service.replay(other)
+
+    transaction_service.remember(transaction_schema)
+    with pytest.raises(TransactionProcessedError):
+        transaction_service.replay_cached(other)
+
+
+def test_replays_keep_latest_transactions() -> None:
+    replays = TransactionReplays(max_size=2)
+    transactions = [
+        schemas.Transaction(**transaction_schema.model_dump(exclude={"uid"}), uid=f"test_uid_{number}")
+        for number in range(3)
+    ]
+    replays.remember(transactions[0])
+    replays.remember(transactions[1])
+    assert replays.get("test_uid_0") == transactions[0]
+    replays.remember(transactions[2])
+
+    assert len(replays) == 2  # noqa: PLR2004
+    assert replays.get("test_uid_0") == transactions[0]
+    assert replays.get("test_uid_1") is None
+
+
+transfer_schema = schemas.TransferAdd(
+    uid="test_transfer_uid",
+    from_user_id="test_user_id",
+    to_user_id="test_other_user_id",
+    amount=Decimal("100"),
+    created_at=datetime.now(UTC),
+)
+
+
+def test_transfer_legs_are_named_after_transfer() -> None:
+    withdrawal, deposit = transfer_legs(transfer_schema)
+
+    assert (withdrawal.user_id, withdrawal.type) == ("test_user_id", TransactionType.WITHDRAW)
+    assert (deposit.user_id, deposit.type) == ("test_other_user_id", TransactionType.DEPOSIT)
+    assert withdrawal.amount == deposit.amount == transfer_schema.amount
+    assert withdrawal.uid != deposit.uid
+    assert transfer_legs(transfer_schema.model_copy()) == (withdrawal, deposit)
+    assert transfer_legs(transfer_schema.model_copy(update={"uid": "other"}))[0].uid != withdrawal.uid
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_transfer(
+    db_session_mock: AsyncMock,
+    user_repo_mock: AsyncMock,
+    transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
+) -> None:
+    transaction_service = TransactionService(
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
+    )
+    transaction_repo_mock.exists.return_value = False
+
+    transfer = await transaction_service.transfer(transfer_schema)
+
+    withdrawal, deposit = transfer_legs(transfer_schema)
+    assert transfer.withdrawal.uid == withdrawal.uid
+    assert transfer.deposit.uid == deposit.uid
+    user_repo_mock.update_balances.assert_awaited_once_with(
+        {"test_user_id": Decimal(-100), "test_other_user_id": Decimal(100)}
+    )
+    transaction_repo_mock.add_many.assert_awaited_once_with([withdrawal, deposit])
+    ledger_repo_mock.record_transfer.assert_awaited_once_with(transfer_schema.amount, transfer_schema.created_at)
+    assert [call.args[0] for call in outbox_repo_mock.add.await_args_list] == ["test_user_id", "test_other_user_id"]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_transfer_throws(
+    db_session_mock: AsyncMock,
+    user_repo_mock: AsyncMock,
+    transaction_repo_mock: AsyncMock,
+    outbox_repo_mock: AsyncMock,
+    ledger_repo_mock: AsyncMock,
+) -> None:
+    transaction_service = TransactionService(
+        transaction_repo=transaction_repo_mock,
+        user_repo=user_repo_mock,
+        outbox_repo=outbox_repo_mock,
+        ledger_repo=ledger_repo_mock,
+        db_session=db_session_mock,
+    )
+    transaction_repo_mock.exists.return_value = True
+    with pytest.raises(TransactionProcessedError):
+        await transaction_service.transfer(transfer_schema)
+    user_repo_mock.update_balances.assert_not_awaited()
+
+    transaction_repo_mock.exists.return_value = False
+    user_repo_mock.update_balances.side_effect = AmountExceedsBalanceError
+    with pytest.raises(TransactionExceedsBalanceError):
+        await transaction_service.transfer(transfer_schema)
+    transaction_repo_mock.add_many.assert_not_awaited()
+    outbox_repo_mock.add.assert_not_awaited()
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
 from unittest.mock import AsyncMock
@@ -19,6 +20,7 @@ user_with_balance = UserDb(
     id="test_id",
     name="test_name",
     balance=Decimal(100),
+    version=7,
 )
 
 
@@ -46,11 +48,11 @@ async def test_create_user(
         user_repo=user_repo_mock, transaction_repo=transaction_repo_mock, db_session=db_session_mock
     )
 
-    user_repo_mock.get.return_value = None
     user_repo_mock.create.return_value = UserDb(**user_create_schema.model_dump())
 
     created_user = await user_service.create_user(user_create_schema)
     assert created_user.id == user_create_schema.id
+    user_repo_mock.get.assert_not_called()
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -62,11 +64,27 @@ async def test_create_user_throws_user_exists(
     user_service = UserService(
         user_repo=user_repo_mock, transaction_repo=transaction_repo_mock, db_session=db_session_mock
     )
-    user_repo_mock.get.return_value = UserDb(**user_create_schema.model_dump())
+    user_repo_mock.create.return_value = None
     with pytest.raises(UserExistsError):
         await user_service.create_user(user_create_schema)
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_users(
+    db_session_mock: AsyncMock,
+    user_repo_mock: AsyncMock,
+    transaction_repo_mock: AsyncMock,
+) -> None:
+    user_service = UserService(
+        user_repo=user_repo_mock, transaction_repo=transaction_repo_mock, db_session=db_session_mock
+    )
+    users = [user_create_schema, UserCreate(id="other_id", name="other_name")]
+    user_repo_mock.create_many.return_value = {"other_id"}
+
+    assert await user_service.create_users(users) == {"other_id"}
+    user_repo_mock.create_many.assert_awaited_once_with(users)
+
+
 @pytest.mark.asyncio(loop_scope="session")
 async def test_get_user(
     db_session_mock: AsyncMock,
@@ -112,6 +130,7 @@ async def test_get_balance(
     balance = await user_service.get_balance("test_id")
     assert balance.user_id == user_create_schema.id
     assert balance.balance == Decimal(100)
+    assert balance.version == 7  # noqa: PLR2004
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -131,6 +150,7 @@ async def test_get_balance_with_timestamp(
     assert balance.user_id == user_create_schema.id
     assert balance.balance == Decimal(100)
     assert balance.ts == timestamp
+    assert balance.version is None
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -163,3 +183,24 @@ async def test_get_balance_throws_wrong_timestamp(
         await user_service.get_balance("test_id", ts=datetime.now(tz=UTC) + timedelta(minutes=1))
     with pytest.raises(WrongTimeStampError):
         await user_service.get_balance("test_id", ts=datetime.now(tz=UTC) + timedelta(days=1000))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_balance_coalesces_concurrent_calls(
+    db_session_mock: AsyncMock,
+    user_repo_mock: AsyncMock,
+    transaction_repo_mock: AsyncMock,
+) -> None:
+    user_service = UserService(
+        user_repo=user_repo_mock, transaction_repo=transaction_repo_mock, db_session=db_session_mock
+    )
+
+    async def get_user(**_: str) -> UserDb:
+        await asyncio.sleep(0.01)
+        return user_with_balance
+
+    user_repo_mock.get.side_effect = get_user
+
+    balances = await asyncio.gather(*(user_service.get_balance("test_id") for _ in range(5)))
+    assert [balance.balance for balance in balances] == [Decimal(100)] * 5
+    user_repo_mock.get.assert_awaited_once()
@@ -0,0 +1,15 @@
+import httpx
+import pytest
+
+from app.application import AppBuilder
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_live_and_ready() -> None:
+    app = AppBuilder().app
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.get("/live")).status_code == 200  # noqa: PLR2004
+        assert (await client.get("/ready")).status_code == 503  # noqa: PLR2004
+
+        app.state.ready = True
+        assert (await client.get("/ready")).status_code == 200  # noqa: PLR2004
@@ -1,7 +1,8 @@
 import math
 from datetime import UTC, datetime
+from decimal import Decimal
 
-from app.utils import timezone_validator
+from app.utils import from_minor_units, timezone_validator, to_minor_units
 
 
 def test_timezone_validator() -> None:
@@ -13,3 +14,13 @@ def test_timezone_validator() -> None:
     assert t1_validated.tzinfo is not None
     assert t1_validated.tzinfo.utcoffset(t1_validated) is not None
     assert t1_validated.tzinfo.tzname == UTC.tzname
+
+
+def test_minor_units() -> None:
+    assert to_minor_units(Decimal("12.34")) == 1234  # noqa: PLR2004
+    assert to_minor_units(Decimal("0.005")) == 1
+    assert to_minor_units(Decimal("-0.005")) == -1
+    assert to_minor_units(Decimal(100)) == 10000  # noqa: PLR2004
+    assert str(from_minor_units(1234)) == "12.34"
+    assert str(from_minor_units(100)) == "1.00"
+    assert from_minor_units(Decimal(-50)) == Decimal("-0.5")